@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""
+NutriSort AI - AI 응답 캐시.
+
+같은 사진(재촬영·새로고침·다른 세션)에 대해 Gemini 를 다시 부르지 않도록
+이미지 내용 해시 + 프롬프트 버전 + 모델을 키로 파싱된 결과를 디스크(sqlite)에 보관한다.
+총 용량 상한을 넘으면 가장 오래 사용하지 않은 항목부터 지운다 (LRU).
+
+식전 인사이트처럼 텍스트 입력이 반복되는 응답은 정규화한 입력을 키로 프로세스 메모리(TTL+LRU)에 보관한다.
+캐시에 아직 없는 같은 요청(두 번 탭·rerun·여러 탭)이 동시에 들어오면 AI_SINGLE_FLIGHT 로 진행 중인 호출 하나를 함께 기다린다.
+같은 사용자가 잠시 뒤 같은 접시를 다시 찍은 사진은 NEAR_DUPLICATES(지각 해시)로 앞 사진의 해시에 묶어
+Gemini 호출 전에 앞 사진의 캐시 결과를 쓰게 한다.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+
+# 캐시 위치·용량: 환경변수로 조정 (Railway 등 임시 디스크에서도 동작하도록 기본은 tmp)
+_CACHE_DIR = os.environ.get("NUTRISORT_CACHE_DIR", "").strip() or os.path.join(
+    tempfile.gettempdir(), "nutrisort_cache"
+)
+_VISION_CACHE_MAX_MB = float(os.environ.get("NUTRISORT_VISION_CACHE_MB", "64") or 64)
+
+
+def prompt_version(*prompts) -> str:
+    """프롬프트 원문 해시 — 프롬프트가 바뀌면 자동으로 다른 키가 되어 이전 결과를 쓰지 않는다."""
+    h = hashlib.md5()
+    for p in prompts:
+        h.update((p or "").encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:12]
+
+
+def vision_cache_key(task: str, image_hash: str, prompt_ver: str, model: str) -> str:
+    return f"{task}:{image_hash}:{prompt_ver}:{model}"
+
+
+class DiskLRUCache:
+    """sqlite 파일 하나에 JSON 값을 저장하는 용량 제한 LRU 캐시 (프로세스 내 스레드 안전)."""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str):
+        """저장된 값(dict 등) 또는 None. 조회 시 최근 사용 시각 갱신."""
+        with self._lock:
+            try:
+                db = self._db()
+                row = db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+                db.commit()
+                self.hits += 1
+                return json.loads(row[0])
+            except Exception as e:
+                # 캐시 장애는 분석 자체를 막지 않는다
+                sys.stderr.write(f"[AI 캐시] 조회 실패 {key}: {e}\n")
+                self.misses += 1
+                return None
+
+    def set(self, key: str, value) -> None:
+        with self._lock:
+            try:
+                payload = json.dumps(value, ensure_ascii=False)
+                size = len(payload.encode("utf-8"))
+                if size > self.max_bytes:
+                    return
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                    (key, payload, size, time.time()),
+                )
+                self._evict(db)
+                db.commit()
+            except Exception as e:
+                sys.stderr.write(f"[AI 캐시] 저장 실패 {key}: {e}\n")
+
+    def _evict(self, db):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in db.execute("SELECT key, size FROM entries ORDER BY last_access ASC").fetchall():
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> dict:
+        with self._lock:
+            try:
+                n, total = self._db().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            except Exception:
+                n, total = 0, 0
+            return {
+                "entries": n,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_vision_cache = None
+_vision_cache_lock = threading.Lock()
+
+
+def get_vision_cache() -> DiskLRUCache:
+    """비전 분석(메뉴명·스캐너 결과) 공용 캐시. 첫 사용 시 생성."""
+    global _vision_cache
+    with _vision_cache_lock:
+        if _vision_cache is None:
+            _vision_cache = DiskLRUCache(
+                os.path.join(_CACHE_DIR, "vision.sqlite3"),
+                int(_VISION_CACHE_MAX_MB * 1024 * 1024),
+            )
+        return _vision_cache
+
+
+class TTLCache:
+    """프로세스 메모리 LRU 캐시: 항목별 만료(TTL) + 최대 개수 초과 시 오래된 것부터 제거 (스레드 안전)."""
+
+    def __init__(self, max_entries: int, ttl_sec: float):
+        self.max_entries = int(max_entries)
+        self.ttl_sec = float(ttl_sec)
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if now >= expires_at:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl_sec, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_sec": self.ttl_sec,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 식전 인사이트 캐시: (정규화 메뉴, 장소, 끼니, 피로도 구간) → 파싱된 인사이트 dict
+# ──────────────────────────────────────────────────────────────────────────────
+PRE_MEAL_INSIGHTS_TTL_SEC = float(os.environ.get("NUTRISORT_INSIGHTS_CACHE_TTL", str(6 * 3600)) or 6 * 3600)
+PRE_MEAL_INSIGHTS_MAX_ENTRIES = int(os.environ.get("NUTRISORT_INSIGHTS_CACHE_SIZE", "5000") or 5000)
+# 누적 혈당 피로도(0~100)를 이 폭의 구간으로 묶는다
+STRESS_BUCKET_WIDTH = 25
+
+pre_meal_insights_cache = TTLCache(PRE_MEAL_INSIGHTS_MAX_ENTRIES, PRE_MEAL_INSIGHTS_TTL_SEC)
+
+# 메뉴 구분자: + , / & · 및 한국어 접속 표현(그리고)
+_MENU_SPLIT_RE = re.compile(r"\s*(?:[+,/&·|]|\s그리고\s)\s*")
+
+
+def _strip_symbols(text: str) -> str:
+    """이모지·기호(Unicode So/Sk)와 변형 선택자·ZWJ(Mn/Cf)를 제거하고 공백을 하나로."""
+    out = []
+    for ch in unicodedata.normalize("NFKC", text):
+        if unicodedata.category(ch) in ("So", "Sk", "Cf", "Cs", "Co", "Mn"):
+            continue
+        out.append(ch)
+    return re.sub(r"\s+", " ", "".join(out)).strip()
+
+
+def normalize_menu_text(menu: str) -> str:
+    """
+    "🍲 김치찌개 + 🍚현미밥" · "현미밥, 김치찌개" → "김치찌개+현미밥".
+    이모지·공백·대소문자·항목 순서 차이를 없앤 메뉴 키.
+    """
+    base = _strip_symbols((menu or "").lower())
+    parts = [re.sub(r"\s+", "", p) for p in _MENU_SPLIT_RE.split(base)]
+    parts = sorted({p for p in parts if p})
+    return "+".join(parts)
+
+
+def stress_bucket(current_stress) -> int:
+    try:
+        v = max(0.0, min(100.0, float(current_stress or 0)))
+    except (TypeError, ValueError):
+        v = 0.0
+    return int(v // STRESS_BUCKET_WIDTH)
+
+
+def pre_meal_insights_cache_key(menu, location, meal_slot, current_stress, prompt_ver: str) -> str:
+    """프롬프트와 같은 규칙으로 장소를 집밥/외식 두 가지로 묶는다."""
+    loc = "외식" if (location or "").strip() in ("외식", "외식/배달") else "집밥"
+    slot = (meal_slot or "").strip()
+    return f"{prompt_ver}|{normalize_menu_text(menu)}|{loc}|{slot}|{stress_bucket(current_stress)}"
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 진행 중 요청 합치기 (single-flight): 같은 키의 요청이 동시에 오면 먼저 온 호출 하나만 실행
+# ──────────────────────────────────────────────────────────────────────────────
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    작업(task)·요청 지문(key)이 같은 호출이 진행 중이면 새로 호출하지 않고 그 결과(또는 예외)를 함께 받는다 (스레드 안전).
+    결과 객체는 호출자끼리 공유되므로 바꿀 값이면 호출부에서 복사한다. 끝난 호출은 기억하지 않는다 (그건 캐시의 몫).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._stats = {}
+
+    def _row(self, task):
+        return self._stats.setdefault(task, {"calls": 0, "joined": 0, "shared_errors": 0, "timeouts": 0, "max_waiters": 0})
+
+    def do(self, task: str, key: str, fn, timeout: float = None, on_join=None):
+        """
+        fn() 결과 반환. 같은 (task, key) 호출이 진행 중이면 on_join() 을 부르고 그 호출이 끝나기를 기다린다.
+        timeout 초 안에 끝나지 않으면 TimeoutError (진행 중인 호출은 그대로 둔다).
+        """
+        fkey = (task, key)
+        with self._lock:
+            row = self._row(task)
+            flight = self._inflight.get(fkey)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[fkey] = _Flight()
+                row["calls"] += 1
+            else:
+                flight.waiters += 1
+                row["joined"] += 1
+                row["max_waiters"] = max(row["max_waiters"], flight.waiters)
+        if leader:
+            try:
+                flight.result = fn()
+                return flight.result
+            except BaseException as e:
+                flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._inflight.pop(fkey, None)
+                flight.done.set()
+        if on_join is not None:
+            on_join()
+        if not flight.done.wait(timeout):
+            with self._lock:
+                row["timeouts"] += 1
+            raise TimeoutError(f"같은 요청({task})의 결과를 기다리다 시간이 초과되었습니다.")
+        if flight.error is not None:
+            with self._lock:
+                row["shared_errors"] += 1
+            raise flight.error
+        return flight.result
+
+    def stats(self) -> dict:
+        """작업별 실제 호출(calls)·합쳐져 아낀 호출(joined) 수와 현재 진행 중인 요청 수."""
+        with self._lock:
+            tasks = {task: dict(row) for task, row in self._stats.items()}
+            return {
+                "inflight": len(self._inflight),
+                "saved_calls": sum(row["joined"] for row in tasks.values()),
+                "tasks": tasks,
+            }
+
+
+# 프로세스 공용 (세션·탭·작업 스레드가 모두 공유)
+AI_SINGLE_FLIGHT = SingleFlight()
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 다시 찍은 사진 판별: 사용자별 최근 업로드의 지각 해시(dHash) 색인
+# ──────────────────────────────────────────────────────────────────────────────
+NEAR_DUP_WINDOW_SEC = float(os.environ.get("NUTRISORT_NEAR_DUP_WINDOW_SEC", "1800") or 1800)
+# 64비트 dHash 해밍 거리 상한 (같은 접시 재촬영·재압축·살짝 자르기 ≈ 0~5, 다른 사진 ≈ 25 이상)
+NEAR_DUP_MAX_DISTANCE = int(os.environ.get("NUTRISORT_NEAR_DUP_MAX_DISTANCE", "8") or 8)
+_NEAR_DUP_PER_OWNER = 20
+_NEAR_DUP_MAX_OWNERS = 5000
+
+
+def _hamming64(a: int, b: int) -> int:
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count("1")
+
+
+class NearDuplicateIndex:
+    """
+    사용자(owner)별 최근 업로드 (시각, dHash, 원본 해시, 대표 이미지 해시) 를 시간 창 안에서 보관 (스레드 안전).
+    canonical_hash 는 창 안의 비슷한 앞 사진이 있으면 그 사진의 대표 해시를, 없으면 자기 해시를 돌려주므로
+    호출부가 그 값으로 캐시 키를 만들면 재촬영 사진은 Gemini 호출 없이 앞 결과를 쓴다.
+    업로드 1건당 한 번만 부른다 (rerun 마다 부르면 같은 사진이 exact 로 다시 세어진다).
+    이미 색인된 원본 해시는 새 항목을 넣지 않으므로 같은 파일을 다시 올려도 앞 사진들이 밀려나지 않는다.
+    """
+
+    def __init__(self, window_sec: float, max_distance: int):
+        self.window_sec = float(window_sec)
+        self.max_distance = int(max_distance)
+        self._lock = threading.Lock()
+        self._owners = OrderedDict()
+        self.exact = 0
+        self.near = 0
+        self.new = 0
+
+    def canonical_hash(self, owner, image_hash: str, dhash: int) -> str:
+        if not owner or self.window_sec <= 0:
+            return image_hash
+        now = time.time()
+        with self._lock:
+            entries = self._owners.get(owner)
+            if entries is None:
+                entries = self._owners[owner] = deque(maxlen=_NEAR_DUP_PER_OWNER)
+                while len(self._owners) > _NEAR_DUP_MAX_OWNERS:
+                    self._owners.popitem(last=False)
+            self._owners.move_to_end(owner)
+            while entries and now - entries[0][0] > self.window_sec:
+                entries.popleft()
+            best = None
+            for _ts, d, raw, canon in entries:
+                if raw == image_hash:
+                    self.exact += 1
+                    return canon
+                dist = _hamming64(d, dhash)
+                if dist <= self.max_distance and (best is None or dist < best[0]):
+                    best = (dist, canon)
+            if best is not None:
+                self.near += 1
+                # 앞 사진에 묶어 두고, 이 사진도 창 안에서 다시 찾을 수 있게 남긴다
+                entries.append((now, dhash, image_hash, best[1]))
+                return best[1]
+            self.new += 1
+            entries.append((now, dhash, image_hash, image_hash))
+            return image_hash
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "owners": len(self._owners),
+                "window_sec": self.window_sec,
+                "max_distance": self.max_distance,
+                "exact_duplicates": self.exact,
+                "near_duplicates": self.near,
+                "new_images": self.new,
+            }
+
+
+NEAR_DUPLICATES = NearDuplicateIndex(NEAR_DUP_WINDOW_SEC, NEAR_DUP_MAX_DISTANCE)
@@ -12,6 +12,8 @@ from collections import defaultdict
 import statistics
 import io
 import base64
+import copy
+import uuid
 from PIL import Image
 from datetime import datetime, timezone
 
@@ -21,14 +23,12 @@ from translation import LANG_DICT, get_text, GOAL_INTERNAL_KEYS
 from terms import TERMS_TOS, TERMS_PRIVACY, TERMS_HEALTH, TERMS_MARKETING, TERMS_CUSTOM_PRIV, TERMS_BIGDATA
 from prompts import (
     get_analysis_prompt,
-    PRE_MEAL_INSIGHTS_SYSTEM_PROMPT,
-    PRE_MEAL_MENU_NAME_VISION_PROMPT,
-    get_pre_meal_insights_user_prompt,
-    POST_MEAL_FEEDBACK_SYSTEM_PROMPT,
-    get_post_meal_feedback_user_prompt,
+    score_post_meal_glucose,
+    get_post_meal_template_message,
 )
 from firebase_db import (
     upload_image_to_storage,
+    upload_meal_thumbnails,
     save_meal_and_summary,
     get_daily_summary,
     get_daily_pancreas_stress,
@@ -116,6 +116,7 @@ def _ensure_pre_meal_state():
             "post_meal_feedback": "",
             "post_meal_is_success": False,
             "post_meal_stress_change": 0,
+            "post_meal_band": "",
         }
         return
     pm = st.session_state["pre_meal"]
@@ -129,6 +130,9 @@ def _ensure_pre_meal_state():
         pm["post_meal_feedback"] = ""
         pm["post_meal_is_success"] = False
         pm["post_meal_stress_change"] = 0
+        pm["post_meal_band"] = ""
+        st.session_state.pop("post_meal_feedback_job", None)
+        st.session_state.pop("post_meal_dialog_reopen", None)
         st.session_state.pop("pre_meal_pancreas_hydrated", None)
         st.session_state.pop("pre_meal_menu_img_hash", None)
 
@@ -238,10 +242,9 @@ def _pre_meal_mission_dialog(mission_text: str, t):
 
 
 @st.dialog("🛡️ 방어전 결과")
-def _post_meal_result_dialog(t: dict):
-    """식후 혈당 피드백 결과 다이얼로그 — 성공/실패 평가 + 피로도 정산."""
+def _post_meal_result_dialog(t: dict, celebrate: bool = False):
+    """식후 혈당 피드백 결과 다이얼로그 — 성공/실패 평가 + 피로도 정산. celebrate: 처음 열 때만 풍선."""
     pm = st.session_state.get("pre_meal") or {}
-    feedback = pm.get("post_meal_feedback", "")
     is_success = pm.get("post_meal_is_success", False)
     change = int(pm.get("post_meal_stress_change", 0))
 
@@ -252,9 +255,8 @@ def _post_meal_result_dialog(t: dict):
     change_sign = "+" if change > 0 else ""
     change_text = esc(f"췌장 피로도 {change_sign}{change}점")
     badge_bg = "rgba(16,185,129,0.12)" if is_success else "rgba(239,68,68,0.12)"
-    feedback_esc = esc(feedback)
 
-    if is_success:
+    if is_success and celebrate:
         st.balloons()
 
     st.markdown(
@@ -267,13 +269,11 @@ def _post_meal_result_dialog(t: dict):
     {change_text}
   </div>
 </div>
-<div style="background:#f8f9fa;border-radius:14px;padding:14px 16px;
-            font-size:0.95rem;line-height:1.75;color:#1e293b;white-space:pre-wrap;">
-  {feedback_esc}
-</div>
 """,
         unsafe_allow_html=True,
     )
+    # 점수·성공 여부는 로컬 채점으로 즉시 표시, 코치 멘트는 비동기로 채운다
+    _render_post_meal_feedback_message(t)
 
     if st.button(
         t.get("post_meal_dialog_close", "✅ 확인하고 다음 식사 준비"),
@@ -301,8 +301,11 @@ def _post_meal_result_dialog(t: dict):
         pm["post_meal_feedback"] = ""
         pm["post_meal_is_success"] = False
         pm["post_meal_stress_change"] = 0
+        pm["post_meal_band"] = ""
+        st.session_state.pop("post_meal_feedback_job", None)
+        st.session_state.pop("post_meal_dialog_reopen", None)
         st.session_state.pop("pre_meal_menu_img_hash", None)
-        st.session_state.pop("pre_meal_menu_image_bytes", None)
+        st.session_state.pop("pre_meal_menu_image", None)
         st.session_state.pop("pre_meal_menu_image_valid_for", None)
         st.session_state["pre_meal_capture_version"] = (
             st.session_state.get("pre_meal_capture_version", 0) + 1
@@ -313,6 +316,70 @@ def _post_meal_result_dialog(t: dict):
         st.rerun()
 
 
+# 식후 피드백: 코치 멘트(Gemini)를 기다리는 최대 시간(초). 넘기면 구간별 기본 문구 사용
+POST_MEAL_FEEDBACK_WAIT_SEC = 6.0
+
+
+def _resolve_post_meal_feedback(pm: dict) -> bool:
+    """비동기 피드백 작업 결과를 pm["post_meal_feedback"]에 반영. 확정되면 True."""
+    if pm.get("post_meal_feedback"):
+        return True
+    job = st.session_state.get("post_meal_feedback_job")
+    if not job:
+        pm["post_meal_feedback"] = get_post_meal_template_message(pm.get("post_meal_band"))
+        return True
+    fut = job["future"]
+    if fut.done():
+        try:
+            pm["post_meal_feedback"] = fut.result()["feedback_message"]
+        except Exception as _e:
+            sys.stderr.write(f"[식후 피드백] AI 멘트 실패 → 기본 문구: {_e}\n")
+            pm["post_meal_feedback"] = get_post_meal_template_message(pm.get("post_meal_band"))
+    elif time.time() - job["started"] > POST_MEAL_FEEDBACK_WAIT_SEC:
+        # 실행 중인 호출은 제출 시 건 마감(POST_MEAL_FEEDBACK_WAIT_SEC)으로 워커·쿼터가 풀린다
+        fut.cancel()
+        pm["post_meal_feedback"] = get_post_meal_template_message(pm.get("post_meal_band"))
+    else:
+        return False
+    st.session_state.pop("post_meal_feedback_job", None)
+    return True
+
+
+def _render_post_meal_feedback_message(t: dict) -> None:
+    """결과 다이얼로그의 코치 멘트 영역 — 확정됐으면 한 번 그리고, 아니면 폴링 fragment 로 기다린다."""
+    pm = st.session_state.get("pre_meal") or {}
+    if _resolve_post_meal_feedback(pm):
+        _post_meal_feedback_box(pm.get("post_meal_feedback", ""))
+    else:
+        _poll_post_meal_feedback_message(t)
+
+
+@st.fragment(run_every=0.5)
+def _poll_post_meal_feedback_message(t: dict) -> None:
+    """
+    멘트 작업이 끝날 때까지 0.5초마다 이 부분만 다시 그린다. 확정되면 전체 rerun 으로 이 fragment 를 없애
+    폴링을 멈추고, 다이얼로그는 post_meal_dialog_reopen 으로 한 번 다시 열려 확정된 멘트를 그린다.
+    """
+    pm = st.session_state.get("pre_meal") or {}
+    if _resolve_post_meal_feedback(pm):
+        st.session_state["post_meal_dialog_reopen"] = True
+        st.rerun()
+    _post_meal_feedback_box(t.get("post_meal_feedback_pending", "AI 코치가 한마디를 준비 중입니다…"))
+
+
+def _post_meal_feedback_box(text: str) -> None:
+    body = html_module.escape(text)
+    st.markdown(
+        f"""
+<div style="background:#f8f9fa;border-radius:14px;padding:14px 16px;
+            font-size:0.95rem;line-height:1.75;color:#1e293b;white-space:pre-wrap;">
+  {body}
+</div>
+""",
+        unsafe_allow_html=True,
+    )
+
+
 def _render_post_meal_feedback_card(t: dict, pm: dict) -> None:
     """식후 혈당 입력 카드 — step 3에서 미션 요약 카드 아래에 렌더."""
     esc = html_module.escape
@@ -352,19 +419,31 @@ def _render_post_meal_feedback_card(t: dict, pm: dict) -> None:
             use_container_width=True,
             type="primary",
         ):
+            # 점수·성공 여부는 로컬 채점으로 즉시 확정 → 다이얼로그를 바로 띄우고 멘트만 비동기 생성
+            _score = score_post_meal_glucose(int(glucose_val))
+            pm["post_meal_is_success"] = _score["is_success"]
+            pm["post_meal_stress_change"] = _score["stress_score_change"]
+            pm["post_meal_band"] = _score["band"]
+            pm["post_meal_feedback"] = ""
+            _menu_arg = menu_echo or t.get("pre_meal_menu_fallback", "오늘의 식사")
+            _slot_arg = pm.get("meal_slot", "식사")
+            _glucose_arg = int(glucose_val)
             try:
-                with st.spinner(t.get("post_meal_spinner", "AI 코치가 방어전 결과를 분석 중입니다...")):
-                    result = generate_post_meal_feedback(
-                        menu_echo or t.get("pre_meal_menu_fallback", "오늘의 식사"),
-                        int(glucose_val),
-                        pm.get("meal_slot", "식사"),
-                    )
-                pm["post_meal_feedback"] = result["feedback_message"]
-                pm["post_meal_is_success"] = result["is_success"]
-                pm["post_meal_stress_change"] = result["stress_score_change"]
-                _post_meal_result_dialog(t)
+                _client_pm = _gemini_client("text")
+                st.session_state["post_meal_feedback_job"] = {
+                    "future": submit_gemini_call(
+                        lambda: generate_post_meal_feedback(_client_pm, _menu_arg, _glucose_arg, _slot_arg),
+                        deadline_sec=POST_MEAL_FEEDBACK_WAIT_SEC,
+                    ),
+                    "started": time.time(),
+                }
             except Exception as _e:
-                st.error(t.get("post_meal_err_ai", "AI 분석에 실패했습니다.") + f" {_e}")
+                sys.stderr.write(f"[식후 피드백] 작업 제출 실패: {_e}\n")
+                st.session_state.pop("post_meal_feedback_job", None)
+            _post_meal_result_dialog(t, celebrate=True)
+        elif st.session_state.pop("post_meal_dialog_reopen", False):
+            # 멘트 폴링이 끝나며 전체 rerun 한 직후: 확정된 멘트로 다이얼로그를 한 번 다시 연다 (폴링 없음)
+            _post_meal_result_dialog(t)
 
 
 def _format_menu_lines_html(menu_text: str) -> str:
@@ -384,15 +463,14 @@ def _render_pre_meal_result_card(t: dict, pm: dict, mt_run: str) -> None:
     esc = html_module.escape
     mt_run = (mt_run or "").strip()
     _valid = (st.session_state.get("pre_meal_menu_image_valid_for") or "").strip()
-    _img_bytes = st.session_state.get("pre_meal_menu_image_bytes")
-    _show_img = bool(_img_bytes) and (_valid == mt_run)
+    _art = st.session_state.get("pre_meal_menu_image")
+    _show_img = _art is not None and (_valid == mt_run)
 
-    # 왼쪽(이미지) HTML 조각
+    # 왼쪽(이미지) HTML 조각 (data URI 는 아티팩트에 한 번만 만들어 둠)
     if _show_img:
-        b64 = base64.b64encode(_img_bytes).decode()
         left_html = (
             '<div class="ns-rc-img-wrap">'
-            f'<img src="data:image/jpeg;base64,{b64}" alt="" class="ns-rc-img" />'
+            f'<img src="{_art.data_uri}" alt="" class="ns-rc-img" />'
             '</div>'
         )
     else:
@@ -422,6 +500,8 @@ def _render_pre_meal_result_card(t: dict, pm: dict, mt_run: str) -> None:
 """,
         unsafe_allow_html=True,
     )
+    # 사용자가 장소를 고르는 동안 두 장소의 인사이트를 미리 요청 (예산 안에서만)
+    _prefetch_pre_meal_insights(pm, mt_run)
     # 버튼은 Streamlit 컴포넌트 (HTML 안에 배치 불가) — 카드 바로 아래 full-width 2열
     _bc1, _bc2 = st.columns(2, gap="small")
     with _bc1:
@@ -682,7 +762,7 @@ def _render_pre_meal_skeleton(t, is_guest=False, guest_remaining=0):
                 pm["post_meal_is_success"] = False
                 pm["post_meal_stress_change"] = 0
                 st.session_state.pop("pre_meal_menu_img_hash", None)
-                st.session_state.pop("pre_meal_menu_image_bytes", None)
+                st.session_state.pop("pre_meal_menu_image", None)
                 st.session_state.pop("pre_meal_menu_image_valid_for", None)
                 st.session_state["pre_meal_capture_version"] = st.session_state.get("pre_meal_capture_version", 0) + 1
                 for _k in ("pre_meal_menu_input", "pre_meal_slot_select"):
@@ -703,8 +783,8 @@ def _render_pre_meal_skeleton(t, is_guest=False, guest_remaining=0):
         """이미지·메뉴 세션 완전 초기화 → 업로더 화면으로 복귀."""
         pm["menu_text"] = ""
         pm["step"] = 1
-        for _k in ("pre_meal_menu_image_bytes", "pre_meal_menu_image_valid_for",
-                   "pre_meal_menu_img_hash"):
+        for _k in ("pre_meal_menu_image", "pre_meal_menu_image_valid_for",
+                   "pre_meal_menu_img_hash", "pre_meal_upload_artifact"):
             st.session_state.pop(_k, None)
         st.session_state["pre_meal_capture_version"] = (
             st.session_state.get("pre_meal_capture_version", 0) + 1
@@ -753,12 +833,24 @@ def _render_pre_meal_skeleton(t, is_guest=False, guest_remaining=0):
         pil_src = None
         if up is not None:
             try:
-                pil_src = compress_image(Image.open(up), max_size_kb=500)
+                # 업로드 1장당 한 번: 축소 디코딩·EXIF 방향·표시용 JPEG·원본 해시와
+                # 재촬영 판별 대표 해시 (rerun 에서는 재사용 → 색인·통계도 업로드당 한 번)
+                _up_key = getattr(up, "file_id", None) or (up.name, up.size)
+                _ingested = st.session_state.get("pre_meal_upload_artifact")
+                if _ingested and _ingested[0] == _up_key:
+                    pil_src, h = _ingested[1], _ingested[2]
+                else:
+                    pil_src = ImageArtifact.from_upload(up)
+                    # 같은 파일(원본 해시)이나 시간 창 안에 다시 찍은 비슷한 사진(dHash)이면 앞 사진의 해시로 묶어
+                    # 메뉴 인식 캐시를 그대로 쓴다 (Gemini 호출 없음)
+                    h = NEAR_DUPLICATES.canonical_hash(_near_dup_owner(), pil_src.image_hash, pil_src.dhash)
+                    st.session_state["pre_meal_upload_artifact"] = (_up_key, pil_src, h)
+            except UploadImageTooLarge:
+                st.warning(t.get("pre_meal_err_image_large", "사진 해상도가 너무 커요. 더 작은 사진으로 다시 올려 주세요."))
             except Exception:
                 st.warning(t.get("pre_meal_err_image", "이미지를 열 수 없습니다."))
 
         if pil_src is not None:
-            h = _pre_meal_image_hash(pil_src)
             if h != st.session_state.get("pre_meal_menu_img_hash"):
                 if is_guest and guest_remaining <= 0:
                     st.warning(t.get("pre_meal_guest_vision_block", "무료 체험 횟수가 부족합니다."))
@@ -796,7 +888,7 @@ def _render_pre_meal_skeleton(t, is_guest=False, guest_remaining=0):
 
                     _vision_ok = False
                     try:
-                        name = extract_pre_meal_menu_name_from_image(pil_src)
+                        name = extract_menu_name_from_image(_gemini_client("vision"), pil_src, image_hash=h)
                         if not name:
                             name = t.get("pre_meal_menu_fallback", "오늘의 식사")
                         pm["menu_text"] = name
@@ -817,19 +909,11 @@ def _render_pre_meal_skeleton(t, is_guest=False, guest_remaining=0):
                     if _vision_ok:
                         _loading_slot.empty()
 
-            # 이미지 bytes 세션 저장
-            try:
-                _buf = io.BytesIO()
-                _p = pil_src.copy() if hasattr(pil_src, "copy") else pil_src
-                if _p.mode in ("RGBA", "P"):
-                    _p = _p.convert("RGB")
-                _p.save(_buf, format="JPEG", quality=88)
-                st.session_state["pre_meal_menu_image_bytes"] = _buf.getvalue()
-                st.session_state["pre_meal_menu_image_valid_for"] = (
-                    st.session_state.get("pre_meal_menu_input") or pm.get("menu_text") or ""
-                ).strip()
-            except Exception:
-                pass
+            # 카드 미리보기용: 같은 아티팩트(표시용 JPEG)를 그대로 보관, 재인코딩 없음
+            st.session_state["pre_meal_menu_image"] = pil_src
+            st.session_state["pre_meal_menu_image_valid_for"] = (
+                st.session_state.get("pre_meal_menu_input") or pm.get("menu_text") or ""
+            ).strip()
 
         # 직접 입력 expander
         with st.expander(t.get("pre_meal_expander_manual", "⌨️ 직접 입력하기"), expanded=False):
@@ -1418,7 +1502,7 @@ _embed_script = """
     }
 
     // 4. [성능 최적화] 브라우저 단 이미지 압축 로직은 모바일 카메라 촬영 시 
-    // 메모리/캔버스 오작동을 유발하므로 제거됨. (Python 서버단 compress_image 함수가 대신 처리)
+    // 메모리/캔버스 오작동을 유발하므로 제거됨. (Python 서버단 업로드 수신 ImageArtifact.from_upload 가 대신 처리)
 
     // iframe 내부의 PWA 배너 로직 생성 코드는 docs/index.html의 최상위 프레임 전용으로 이관되어 삭제됨.
 
@@ -1430,248 +1514,151 @@ st.components.v1.html(
     height=0,
 )
 from google import genai  # 패키지: google-genai (구 google-generativeai 아님)
-from google.genai import types as gtypes
-
-
-def _parse_pre_meal_insights_json(raw: str) -> dict:
-    """LLM 응답 문자열 → mission/analysis/next_meal/added_stress 검증 (JSON만 파싱)."""
-    text = (raw or "").strip()
-    if not text:
-        raise ValueError("모델 응답이 비어 있습니다.")
-    if text.startswith("```"):
-        text = re.sub(r"^```(?:json)?\s*", "", text, flags=re.I | re.M)
-        text = re.sub(r"\s*```\s*$", "", text)
-    text = text.strip()
-
-    def _loads(s: str):
-        return json.loads(s)
-
-    try:
-        data = _loads(text)
-    except json.JSONDecodeError:
-        start, end = text.find("{"), text.rfind("}")
-        if start < 0 or end <= start:
-            raise
-        data = _loads(text[start : end + 1])
-
-    if not isinstance(data, dict):
-        raise ValueError("JSON 최상위는 객체여야 합니다.")
-    for k in ("mission", "analysis", "next_meal"):
-        if k not in data:
-            raise ValueError(f"필수 키 누락: {k}")
-        data[k] = str(data[k] or "").strip()
-    try:
-        ai = int(round(float(data.get("added_stress", 0))))
-    except (TypeError, ValueError):
-        ai = 0
-    data["added_stress"] = max(0, min(30, ai))
-    return data
-
-
-def generate_pre_meal_insights(menu: str, location: str, meal_slot: str, current_stress: float) -> dict:
-    """Gemini 텍스트 모델로 식전 인사이트 JSON 생성·파싱 (내부에서 API 키로 클라이언트 생성)."""
-    api_key = _get_secret("GEMINI_API_KEY")
-    if not api_key:
-        raise RuntimeError("GEMINI_API_KEY가 설정되어 있지 않습니다.")
-    client = genai.Client(api_key=api_key)
-    user_prompt = get_pre_meal_insights_user_prompt(menu, location, meal_slot, current_stress)
-    _env = os.environ.get("GEMINI_TEXT_MODEL", "").strip()
-    candidates = []
-    if _env:
-        candidates.append(_env)
-    for _m in ("gemini-2.5-flash", "gemini-2.0-flash"):
-        if _m not in candidates:
-            candidates.append(_m)
-    last_err = None
-    for mm in candidates:
-        try:
-            response = client.models.generate_content(
-                model=mm,
-                contents=[user_prompt],
-                config=gtypes.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    system_instruction=PRE_MEAL_INSIGHTS_SYSTEM_PROMPT,
-                ),
-            )
-            raw = (response.text or "").strip()
-            return _parse_pre_meal_insights_json(raw)
-        except json.JSONDecodeError as je:
-            last_err = je
-            continue
-        except ValueError as ve:
-            last_err = ve
-            continue
-        except Exception as e:
-            last_err = e
-            es = str(e)
-            if "not found" in es.lower() or "not supported" in es.lower() or "NOT_FOUND" in es:
-                continue
-            raise
-    if last_err:
-        raise last_err
-    raise RuntimeError("사용 가능한 Gemini 텍스트 모델이 없습니다.")
-
-
-def _parse_post_meal_feedback_json(raw: str) -> dict:
-    """식후 피드백 LLM 응답 → feedback_message/stress_score_change/is_success 검증."""
-    text = (raw or "").strip()
-    if not text:
-        raise ValueError("모델 응답이 비어 있습니다.")
-    if text.startswith("```"):
-        text = re.sub(r"^```(?:json)?\s*", "", text, flags=re.I | re.M)
-        text = re.sub(r"\s*```\s*$", "", text)
-    text = text.strip()
-    try:
-        data = json.loads(text)
-    except json.JSONDecodeError:
-        start, end = text.find("{"), text.rfind("}")
-        if start < 0 or end <= start:
-            raise
-        data = json.loads(text[start : end + 1])
-    if not isinstance(data, dict):
-        raise ValueError("JSON 최상위는 객체여야 합니다.")
-    data["feedback_message"] = str(data.get("feedback_message") or "").strip()
-    if not data["feedback_message"]:
-        raise ValueError("필수 키 누락: feedback_message")
-    try:
-        sc = int(round(float(data.get("stress_score_change", 0))))
-    except (TypeError, ValueError):
-        sc = 0
-    data["stress_score_change"] = max(-15, min(30, sc))
-    data["is_success"] = bool(data.get("is_success", False))
-    return data
+from gemini_client import (
+    get_gemini_client,
+    model_fallback_chain,
+    classify_gemini_error,
+    submit_gemini_call,
+    image_part,
+    ENCODED_JPEG_INFO_KEY,
+    SPECULATIVE_BUDGET,
+    client_pool_stats,
+)
+from gemini_metrics import GEMINI_METRICS
+from gemini_quota import GEMINI_LIMITER, GeminiQuotaWaitTooLong, gemini_priority
+from jobs import VISION_JOBS, JobQueueFull
+from response_schemas import ResponseSchemaError
+from image_pipeline import ImageArtifact, UploadImageTooLarge
+from ai_cache import (
+    get_vision_cache,
+    pre_meal_insights_cache,
+    AI_SINGLE_FLIGHT,
+    NEAR_DUPLICATES,
+)
+from gemini_flows import (
+    VisionParseError,
+    extract_menu_name_from_image,
+    generate_post_meal_feedback,
+    generate_pre_meal_insights,
+    pre_meal_insights_key,
+    run_vision_analysis,
+    stream_vision_advice,
+)
 
 
-def generate_post_meal_feedback(menu: str, glucose_value: int, meal_slot: str = "식사") -> dict:
-    """Gemini 텍스트 모델로 식후 혈당 피드백 JSON 생성·파싱."""
+def _gemini_client(family: str):
+    """API 키별 공용 Gemini 클라이언트 (family: text | vision). 키가 없으면 RuntimeError."""
     api_key = _get_secret("GEMINI_API_KEY")
     if not api_key:
         raise RuntimeError("GEMINI_API_KEY가 설정되어 있지 않습니다.")
-    client = genai.Client(api_key=api_key)
-    user_prompt = get_post_meal_feedback_user_prompt(menu, glucose_value, meal_slot)
-    _env = os.environ.get("GEMINI_TEXT_MODEL", "").strip()
-    candidates = []
-    if _env:
-        candidates.append(_env)
-    for _m in ("gemini-2.5-flash", "gemini-2.0-flash"):
-        if _m not in candidates:
-            candidates.append(_m)
-    last_err = None
-    for mm in candidates:
-        try:
-            response = client.models.generate_content(
-                model=mm,
-                contents=[user_prompt],
-                config=gtypes.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    system_instruction=POST_MEAL_FEEDBACK_SYSTEM_PROMPT,
-                ),
-            )
-            raw = (response.text or "").strip()
-            return _parse_post_meal_feedback_json(raw)
-        except json.JSONDecodeError as je:
-            last_err = je
-            continue
-        except ValueError as ve:
-            last_err = ve
-            continue
-        except Exception as e:
-            last_err = e
-            es = str(e)
-            if "not found" in es.lower() or "not supported" in es.lower() or "NOT_FOUND" in es:
-                continue
-            raise
-    if last_err:
-        raise last_err
-    raise RuntimeError("사용 가능한 Gemini 텍스트 모델이 없습니다.")
+    return get_gemini_client(api_key, family)
 
 
-def _pre_meal_image_hash(pil_img: Image.Image) -> str:
-    import hashlib
-
-    buf = io.BytesIO()
-    im = pil_img.copy() if hasattr(pil_img, "copy") else pil_img
-    if im.mode in ("RGBA", "P"):
-        im = im.convert("RGB")
-    im.save(buf, format="JPEG", quality=88)
-    return hashlib.md5(buf.getvalue()).hexdigest()
+def _near_dup_owner() -> str:
+    """재촬영 판별 색인의 소유자: 로그인 사용자는 UID, 게스트는 세션마다 따로 (게스트끼리 결과를 섞지 않음)."""
+    uid = st.session_state.get("user_id")
+    if uid and uid != "guest_user_demo" and st.session_state.get("logged_in"):
+        return f"uid:{uid}"
+    if "near_dup_session" not in st.session_state:
+        st.session_state["near_dup_session"] = uuid.uuid4().hex
+    return "session:" + st.session_state["near_dup_session"]
 
 
-def _parse_menu_name_json(raw: str) -> str:
-    text = (raw or "").strip()
-    if not text:
-        return ""
-    if text.startswith("```"):
-        text = re.sub(r"^```(?:json)?\s*", "", text, flags=re.I | re.M)
-        text = re.sub(r"\s*```\s*$", "", text)
-    text = text.strip()
-    try:
-        data = json.loads(text)
-    except json.JSONDecodeError:
-        start, end = text.find("{"), text.rfind("}")
-        if start < 0 or end <= start:
-            return ""
-        try:
-            data = json.loads(text[start : end + 1])
-        except json.JSONDecodeError:
-            return ""
-    if isinstance(data, dict):
-        return str(data.get("menu_name") or "").strip()
-    return ""
+# 메뉴 카드가 뜨면 집밥·외식 인사이트를 둘 다 미리 요청해 두는 장소 값 (버튼과 같은 값)
+PRE_MEAL_PREFETCH_LOCATIONS = ("집밥", "외식")
 
 
-def extract_pre_meal_menu_name_from_image(pil_image: Image.Image) -> str:
-    """Gemini Vision으로 음식 메뉴 짧은 문자열 추출."""
-    api_key = _get_secret("GEMINI_API_KEY")
-    if not api_key:
-        raise RuntimeError("GEMINI_API_KEY가 설정되어 있지 않습니다.")
-    client = genai.Client(api_key=api_key)
-    _env_mm = os.environ.get("GEMINI_VISION_MODEL", "").strip()
-    candidates = []
-    if _env_mm:
-        candidates.append(_env_mm)
-    for _m in ("gemini-2.5-flash", "gemini-2.0-flash"):
-        if _m not in candidates:
-            candidates.append(_m)
-    last_err = None
-    for mm in candidates:
-        try:
-            response = client.models.generate_content(
-                model=mm,
-                contents=[PRE_MEAL_MENU_NAME_VISION_PROMPT, pil_image],
-                config=gtypes.GenerateContentConfig(response_mime_type="application/json"),
-            )
-            raw = (response.text or "").strip()
-            name = _parse_menu_name_json(raw)
-            if name:
-                return name[:120]
-        except Exception as e:
-            last_err = e
-            es = str(e)
-            if "not found" in es.lower() or "not supported" in es.lower() or "NOT_FOUND" in es:
-                continue
-            raise
-    if last_err:
-        raise last_err
-    raise RuntimeError("메뉴 이름을 인식하지 못했습니다.")
+def _prefetch_pre_meal_insights(pm: dict, menu_text: str) -> None:
+    """
+    메뉴 카드 표시 시점에 두 장소의 인사이트 생성을 백그라운드로 시작 (결과는 공용 캐시에도 저장됨).
+    게스트·비로그인은 하지 않고, 사용자별·전체 추측 예산이나 모델 과부하 상태면 건너뛴다.
+    """
+    uid = st.session_state.get("user_id")
+    menu = (menu_text or "").strip()
+    if not menu or not uid or uid == "guest_user_demo" or not st.session_state.get("logged_in"):
+        return
+    slot = pm.get("meal_slot", "아침")
+    stress = float(pm.get("pancreas_stress") or 0)
+    keys = {loc: pre_meal_insights_key(menu, loc, slot, stress) for loc in PRE_MEAL_PREFETCH_LOCATIONS}
+    prev = st.session_state.get("pre_meal_prefetch") or {}
+    if set(prev) == set(keys.values()):
+        return
+    # 메뉴·끼니가 바뀌었으면 이전 추측 요청은 시작 전이면 취소 (이미 실행 중이면 끝나고 캐시에 남음)
+    for fut in prev.values():
+        if fut is not None:
+            SPECULATIVE_BUDGET.note("cancelled" if fut.cancel() else "unused")
+    # 키 → Future (이미 캐시에 있거나 예산이 없으면 None: 같은 메뉴로 rerun 될 때 다시 시도하지 않음)
+    futures = {k: None for k in keys.values()}
+    missing = [loc for loc, k in keys.items() if pre_meal_insights_cache.get(k) is None]
+    # 쿼터 대기열이 이미 밀려 있으면 추측 요청으로 더 밀지 않는다
+    if missing and GEMINI_LIMITER.estimate_wait("speculative") > 1.0:
+        missing = []
+    if missing and SPECULATIVE_BUDGET.try_acquire(uid, len(missing)):
+
+        _client = _gemini_client("text")
+
+        def _speculative(loc):
+            # 쿼터가 빠듯하면 실제 요청(스캐너·식전 멘트)에 밀려 나중에 입장
+            with gemini_priority("speculative"):
+                return generate_pre_meal_insights(_client, menu, loc, slot, stress)
+
+        for loc in missing:
+            futures[keys[loc]] = submit_gemini_call(lambda loc=loc: _speculative(loc))
+    st.session_state["pre_meal_prefetch"] = futures
+
+
+def _take_prefetched_insights(menu_text: str, location_val: str, meal_slot: str, stress: float):
+    """
+    고른 장소의 추측 요청 Future (없으면 None). 나머지는 시작 전이면 취소, 아니면 캐시용으로 둔다.
+    고른 요청도 아직 시작 전이면 취소하고 None (사용자 요청을 insight 우선순위로 새로 보냄).
+    """
+    prefetch = st.session_state.pop("pre_meal_prefetch", None) or {}
+    chosen = prefetch.pop(pre_meal_insights_key(menu_text, location_val, meal_slot, stress), None)
+    for fut in prefetch.values():
+        if fut is not None:
+            SPECULATIVE_BUDGET.note("cancelled" if fut.cancel() else "unused")
+    if chosen is None:
+        return None
+    if chosen.cancel():
+        SPECULATIVE_BUDGET.note("cancelled")
+        return None
+    SPECULATIVE_BUDGET.note("served")
+    return chosen
 
 
 def _execute_pre_meal_insights_flow(pm: dict, t: dict, menu_text: str, location_val: str) -> None:
-    """식전 인사이트 생성 → 저장 → 미션 다이얼로그."""
+    """식전 인사이트 생성 → 저장 → 미션 다이얼로그. 미리 시작한 요청이 있으면 그 결과를 기다려 사용."""
+    _menu_arg = (menu_text or "").strip()
+    _slot_arg = pm.get("meal_slot", "아침")
+    _stress_arg = float(pm.get("pancreas_stress") or 0)
+    _prefetched = _take_prefetched_insights(_menu_arg, location_val, _slot_arg, _stress_arg)
+    _spinner_text = t.get(
+        "pre_meal_spinner_mission",
+        "AI 코치가 메뉴를 스캔하고 방어막을 설계 중입니다…",
+    )
+    # 쿼터 대기열이 밀려 있으면 예상 대기 시간을 함께 안내
+    _quota_eta = GEMINI_LIMITER.estimate_wait("insight") if _prefetched is None else 0.0
+    if _quota_eta >= 2:
+        _spinner_text += f" (요청이 많아 약 {_quota_eta:.0f}초 대기)"
     try:
-        with st.spinner(
-            t.get(
-                "pre_meal_spinner_mission",
-                "AI 코치가 메뉴를 스캔하고 방어막을 설계 중입니다…",
-            )
-        ):
-            out = generate_pre_meal_insights(
-                (menu_text or "").strip(),
-                location_val,
-                pm.get("meal_slot", "아침"),
-                float(pm.get("pancreas_stress") or 0),
-            )
-    except json.JSONDecodeError as je:
+        with st.spinner(_spinner_text):
+            out = None
+            # 이미 끝난 추측 요청만 Future 결과를 쓴다. 진행 중이면 아래 일반 요청이 같은 호출에 합류하면서
+            # 아직 쿼터 대기 중인 그 호출의 우선순위를 speculative → insight 로 올린다
+            if _prefetched is not None and _prefetched.done():
+                try:
+                    out = _prefetched.result()
+                except ResponseSchemaError:
+                    # 응답은 받았지만 해석 실패: 같은 요청을 다시 보내지 않는다
+                    raise
+                except Exception as _pe:
+                    # 추측 요청 실패는 일반 요청으로 다시 시도
+                    sys.stderr.write(f"[식전 인사이트] 미리 받기 실패 → 재요청: {_pe}\n")
+            if out is None:
+                out = generate_pre_meal_insights(
+                    _gemini_client("text"), _menu_arg, location_val, _slot_arg, _stress_arg
+                )
+    except ResponseSchemaError as je:
         st.error(
             t.get(
                 "pre_meal_err_json",
@@ -1679,6 +1666,8 @@ def _execute_pre_meal_insights_flow(pm: dict, t: dict, menu_text: str, location_
             )
             + f" ({je})"
         )
+    except GeminiQuotaWaitTooLong:
+        st.error(t.get("pre_meal_err_busy", "요청이 많아 AI 코치가 잠시 바빠요. 잠시 후 다시 눌러 주세요."))
     except Exception as e:
         st.error(
             t.get("pre_meal_err_ai", "AI 호출에 실패했습니다.")
@@ -1747,100 +1736,147 @@ def _format_record_date(date_str, saved_at_utc=None, lang="KO"):
         return date_str or (str(saved_at_utc) if saved_at_utc else "")
 
 
-def _extract_json_blob_from_text(raw):
-    """Gemini 텍스트 응답에서 JSON 객체 문자열만 추출 (마크다운 펜스·잡담 대응)."""
-    if raw is None:
-        return None
-    if not isinstance(raw, str):
-        raw = str(raw)
-    s = raw.strip()
-    if not s:
-        return None
-    fence = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", s, re.IGNORECASE)
-    if fence:
-        inner = fence.group(1).strip()
-        if inner.startswith("{"):
-            s = inner
-    dec = json.JSONDecoder()
-    i = s.find("{")
-    while i != -1:
-        try:
-            _obj, end = dec.raw_decode(s, i)
-            return s[i:end]
-        except json.JSONDecodeError:
-            i = s.find("{", i + 1)
-    return None
+# 분석 중: 분석 버튼(primary) 자체를 무지개색 반응형 패널로 변조하는 CSS
+_ANALYZE_LOADING_CSS = """
+                <style>
+                /* 분석 버튼(primary) 자체를 무지개색 반응형 패널로 강제 변조 */
+                button[data-testid="baseButton-primary"], 
+                button[kind="primary"] {
+                    background: linear-gradient(124deg, #ff2400, #e81d1d, #e8b71d, #e3e81d, #1de840, #1ddde8, #2b1de8, #dd00f3, #dd00f3) !important;
+                    background-size: 1800% 1800% !important;
+                    animation: rainbowBtn 2s ease infinite !important;
+                    border: none !important;
+                    box-shadow: 0 4px 15px rgba(0,0,0,0.2) !important;
+                    position: relative !important;
+                    pointer-events: none !important; /* 중복 클릭 방지 */
+                }
+                button[data-testid="baseButton-primary"] p, 
+                button[kind="primary"] p {
+                    color: transparent !important; /* 기존 글자 투명화 (공간 유지용) */
+                }
+                button[data-testid="baseButton-primary"]::after, 
+                button[kind="primary"]::after {
+                    content: '🤖 분석 중...' !important;
+                    position: absolute !important;
+                    top: 50% !important;
+                    left: 50% !important;
+                    transform: translate(-50%, -50%) !important;
+                    color: white !important;
+                    font-weight: 800 !important;
+                    font-size: 18px !important;
+                    visibility: visible !important;
+                    width: 100% !important;
+                    text-align: center !important;
+                    animation: blinkText 1.2s infinite !important;
+                }
+                @keyframes rainbowBtn { 
+                    0% { background-position: 0% 50% }
+                    50% { background-position: 100% 50% }
+                    100% { background-position: 0% 50% }
+                }
+                @keyframes blinkText {
+                    0% { opacity: 0.4; }
+                    50% { opacity: 1; }
+                    100% { opacity: 0.4; }
+                }
+                </style>
+            """
 
 
-def _coerce_int_nutrient(v, default=0):
-    """JSON 숫자 필드를 정수로 안전 변환."""
-    if v is None:
-        return default
-    if isinstance(v, bool):
-        return default
-    if isinstance(v, int):
-        return v
-    if isinstance(v, float):
-        return int(round(v))
-    s = str(v).strip()
-    if not s:
-        return default
-    try:
-        return int(float(s))
-    except (TypeError, ValueError):
-        digits = "".join(c for c in s if c.isdigit() or c in ".-")
-        try:
-            return int(float(digits)) if digits else default
-        except (TypeError, ValueError):
-            return default
+def _vision_resume_token() -> str:
+    """세션별 분석 작업 이어받기 토큰 (작업 meta 와 URL 의 scan_token 에 같이 둠, 게스트 작업 보호용)."""
+    tok = st.session_state.get("vision_resume_token")
+    if not tok:
+        tok = st.session_state["vision_resume_token"] = uuid.uuid4().hex
+    return tok
 
 
-def _parse_food_analysis_json_response(text):
+def _resumable_vision_job(job_id, token):
     """
-    비전 JSON 응답 → (sorted_items, total_carbs) 또는 None.
-    sorted_items 항목: [name, gi, carbs, protein, color, order, fat, kcal]
+    URL 의 scan_job 으로 이어받을 수 있는 작업. 로그인 사용자 작업은 소유자가 같아야 하고,
+    게스트 작업(owner=None)은 제출한 세션의 이어받기 토큰이 같아야 한다. 아니면 None.
     """
-    blob = _extract_json_blob_from_text(text)
-    if not blob:
-        return None
-    try:
-        data = json.loads(blob)
-    except json.JSONDecodeError:
+    job = VISION_JOBS.get(job_id)
+    if job is None or job.claimed:
         return None
-    if not isinstance(data, dict):
-        return None
-    items = data.get("items")
-    if not isinstance(items, list) or len(items) == 0:
-        return None
-    parsed = []
-    for it in items:
-        if not isinstance(it, dict):
-            continue
-        name = str(it.get("name", "")).strip()
-        if not name:
-            continue
-        gi = max(0, min(100, _coerce_int_nutrient(it.get("gi"), 50)))
-        carbs = max(0, _coerce_int_nutrient(it.get("carbs"), 0))
-        protein = max(0, _coerce_int_nutrient(it.get("protein"), 0))
-        fat = max(0, _coerce_int_nutrient(it.get("fat"), 0))
-        kcal = max(0, _coerce_int_nutrient(it.get("kcal"), 0))
-        signal = it.get("signal") or it.get("color") or "노랑"
-        signal = str(signal).strip() or "노랑"
-        order = max(1, _coerce_int_nutrient(it.get("order"), 99))
-        parsed.append([name, gi, carbs, protein, signal, order, fat, kcal])
-    if not parsed:
-        return None
-    sorted_items = sorted(parsed, key=lambda x: x[5])
-    sum_carbs = sum(x[2] for x in parsed)
-    tc_raw = data.get("total_carbs")
-    try:
-        tc = int(float(tc_raw))
-    except (TypeError, ValueError):
-        tc = sum_carbs
-    if sum_carbs > 0 and abs(tc - sum_carbs) > max(8, int(sum_carbs * 0.35)):
-        tc = sum_carbs
-    total_carbs = max(0, tc)
-    return sorted_items, total_carbs
+    if job.owner is not None:
+        return job if job.owner == st.session_state.get("user_id") else None
+    expected = job.meta.get("resume_token")
+    return job if (expected and token == expected) else None
+
+
+def _clear_scan_job_params() -> None:
+    for _k in ("scan_job", "scan_token"):
+        if _k in st.query_params:
+            del st.query_params[_k]
+
+
+def _abandon_vision_job() -> None:
+    """진행 중인 분석 작업을 버린다 (결과가 나와도 이 세션·다른 세션 모두 이어받지 않음)."""
+    VISION_JOBS.abandon(st.session_state.pop("vision_job_id", None))
+    _clear_scan_job_params()
+    if st.session_state.get("vision_analysis_status") == "running":
+        st.session_state["vision_analysis_status"] = "idle"
+
+
+@st.fragment(run_every=1.0)
+def _poll_vision_job(t: dict, job_id: str) -> None:
+    """분석 작업 진행률 — 이 부분만 1초마다 다시 그리고, 끝나면 전체 rerun 으로 결과 반영."""
+    job = VISION_JOBS.get(job_id)
+    if job is None or job.done:
+        st.rerun()
+    if job.state == "queued":
+        _q = VISION_JOBS.metrics()["queued"]
+        st.progress(0.0, text=f"대기 중… (대기열 {_q}건)")
+    else:
+        st.progress(job.progress, text=job.message or t["analyze_btn"])
+
+
+def _finish_vision_job(t: dict, job, is_guest: bool, loading_placeholder) -> None:
+    """끝난 분석 작업을 이 세션에 반영: 하루 누적·current_analysis·결과 화면 전환 또는 오류 안내."""
+    st.session_state.pop("vision_job_id", None)
+    _clear_scan_job_params()
+    if job is None or not VISION_JOBS.claim(job.id):
+        # 결과 보관 시간이 지났거나 다른 세션(탭)이 이미 반영함
+        loading_placeholder.empty()
+        st.session_state["vision_analysis_status"] = "idle"
+        st.warning(t["session_reset_msg"])
+        return
+    if job.state == "error":
+        err = job.error
+        if isinstance(err, VisionParseError):
+            _reset_vision_analysis_parse_error(is_guest, loading_placeholder)
+            return
+        loading_placeholder.empty()
+        st.session_state["vision_analysis_status"] = "idle"
+        # 에러로 인해 스캔이 실패했으므로, 게스트 유저인 경우 차감된 횟수를 1회 복구해줍니다.
+        if is_guest and st.session_state.get('guest_usage_count', 0) > 0:
+            st.session_state['guest_usage_count'] -= 1
+        # 문자열 대신 구조화된 상태 코드로 과부하·쿼터 초과를 판별 (앱 쪽 쿼터 대기열 초과 포함)
+        if isinstance(err, GeminiQuotaWaitTooLong) or classify_gemini_error(err) in ("unavailable", "rate_limited"):
+            st.error(t["server_busy"])
+        else:
+            st.error(get_text("KO", "analysis_error_generic", msg=str(err)))
+        return
+
+    # 작업 결과는 실행기에 남아 있으므로 세션에는 항목 리스트까지 복사본을 둔다 (raw_img 는 읽기 전용이라 공유)
+    res = dict(job.result)
+    res["sorted_items"] = copy.deepcopy(res["sorted_items"])
+    # 하루 누적 업데이트
+    prev_count = st.session_state['daily_meals_count']
+    st.session_state['daily_blood_sugar_score'] = int(
+        (st.session_state['daily_blood_sugar_score'] * prev_count + res["blood_sugar_score"]) / (prev_count + 1)
+    )
+    st.session_state['daily_carbs'] += res["total_carbs"]
+    st.session_state['daily_protein'] += res["total_protein"]
+    st.session_state['daily_meals_count'] += 1
+
+    st.session_state['current_analysis'] = res
+    st.session_state['current_img'] = res.get("raw_img")
+    loading_placeholder.empty()
+    st.session_state["vision_analysis_status"] = "done"
+    st.session_state['app_stage'] = 'result'
+    st.rerun()
 
 
 def _reset_vision_analysis_parse_error(is_guest, loading_placeholder):
@@ -1857,26 +1893,64 @@ def _reset_vision_analysis_parse_error(is_guest, loading_placeholder):
     st.error("이미지 분석 중 오류가 발생했습니다. 다시 시도해 주세요.")
 
 
-def compress_image(img, max_size_kb=500, max_edge=1024):
-    """이미지가 서버에 로드된 직후 500KB 이하로 브라우저 표시 및 전송 전에 최적화. 모바일 대용량 사진은 먼저 리사이즈해 인코딩 시간 단축."""
-    if img.mode in ("RGBA", "P"):
-        img = img.convert("RGB")
-    w, h = img.size
-    # 1단계: 한 번에 최대 길이로 리사이즈 → 반복 인코딩 부담 감소 (모바일 지연 해소)
-    if w > max_edge or h > max_edge:
-        ratio = min(max_edge / w, max_edge / h)
-        nw, nh = max(1, int(w * ratio)), max(1, int(h * ratio))
-        img = img.resize((nw, nh), Image.Resampling.LANCZOS)
-    quality = 88
-    while True:
-        output = io.BytesIO()
-        img.save(output, format="JPEG", quality=quality)
-        size_kb = len(output.getvalue()) / 1024
-        if size_kb <= max_size_kb or quality <= 25:
-            output.seek(0)
-            return Image.open(output)
-        quality -= 12
-        img = img.resize((max(1, int(img.width * 0.85)), max(1, int(img.height * 0.85))), Image.Resampling.LANCZOS)
+def _is_admin_user() -> bool:
+    """NUTRISORT_ADMIN_USERS(쉼표 구분 이메일·UID)에 있는 로그인 사용자만 관리자."""
+    admins = {a.strip().lower() for a in str(_get_secret("NUTRISORT_ADMIN_USERS", "") or "").split(",") if a.strip()}
+    if not admins or not st.session_state.get("logged_in"):
+        return False
+    ids = (st.session_state.get("user_email"), st.session_state.get("user_id"))
+    return any(i and str(i).lower() in admins for i in ids)
+
+
+def _render_gemini_debug_panel() -> None:
+    """관리자 전용: Gemini 호출 계측(지연·토큰·재시도·폴백·파싱) 히스토그램과 최근 기록 JSONL 내보내기."""
+    with st.expander("🛠️ Gemini 계측 (관리자)", expanded=False):
+        snap = GEMINI_METRICS.snapshot()
+        ops = GEMINI_METRICS.recent(limit=30, type_="operation")
+        if ops:
+            st.caption("최근 작업 (최신순)")
+            st.dataframe(
+                [
+                    {k: r[k] for k in (
+                        "op", "wall_ms", "model", "calls", "fallback_hops", "retries",
+                        "prompt_tokens", "response_tokens", "image_bytes", "parse_ok", "error",
+                    )}
+                    for r in reversed(ops)
+                ],
+                use_container_width=True,
+            )
+        else:
+            st.caption("아직 기록된 Gemini 호출이 없습니다.")
+        st.caption("히스토그램 (p50/p95 는 구간 상한 근사)")
+        st.json(snap["histograms"], expanded=False)
+        st.caption("카운터")
+        st.json(snap["counters"], expanded=False)
+        st.caption("비전 분석 작업 대기열")
+        st.json(VISION_JOBS.metrics(), expanded=False)
+        st.caption("식전 인사이트 미리 받기 예산")
+        st.json(SPECULATIVE_BUDGET.stats(), expanded=False)
+        st.caption("Gemini 클라이언트 풀·백엔드")
+        st.json(client_pool_stats(), expanded=False)
+        st.caption("재촬영 사진 판별 (원본 해시·dHash)")
+        st.json(NEAR_DUPLICATES.stats(), expanded=False)
+        st.caption("진행 중 요청 합치기 (saved_calls = 아낀 호출 수)")
+        st.json(AI_SINGLE_FLIGHT.stats(), expanded=False)
+        st.caption("Gemini 쿼터 입장 제어 (우선순위별 대기)")
+        st.json(GEMINI_LIMITER.stats(), expanded=False)
+        col_dl, col_reset = st.columns(2)
+        with col_dl:
+            st.download_button(
+                "⬇️ JSONL 내보내기",
+                data=GEMINI_METRICS.export_jsonl(),
+                file_name=f"gemini_metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl",
+                mime="application/x-ndjson",
+                use_container_width=True,
+                key="gemini_metrics_download",
+            )
+        with col_reset:
+            if st.button("🧹 계측 초기화", key="gemini_metrics_reset", use_container_width=True):
+                GEMINI_METRICS.reset()
+                st.rerun()
 
 
 def compress_image_for_storage(img, max_width=1024, quality=80):
@@ -2819,6 +2893,19 @@ st.markdown(f"""
         white-space: nowrap;
     }}
     .ns-tl-body {{ flex: 1 1 0; min-width: 0; }}
+    .ns-tl-thumb {{
+        width: 56px;
+        height: 56px;
+        object-fit: cover;
+        border-radius: 12px;
+        flex-shrink: 0;
+    }}
+    .ns-tl-photo {{
+        display: block;
+        width: 100%;
+        border-radius: 12px;
+        margin-bottom: 8px;
+    }}
     .ns-tl-menu {{
         font-size: 0.95rem;
         font-weight: 700;
@@ -5686,6 +5773,12 @@ if not st.session_state.get("_ls_auth_saved") and st.session_state.get("login_ty
 # 5. 메인 영역 — 스캐너/기록 전환은 하단 바 + session_state.nav_menu만 사용 (상단 중복 탭 제거)
 menu_key = st.session_state.get("nav_menu") or "scanner"
 
+# 분석 대기 화면을 어떤 경로로든(하단 탭·다시 촬영·설정 등) 떠났으면 진행 중인 분석 작업을 버린다
+if st.session_state.get("vision_job_id") and (
+    menu_key != "scanner" or st.session_state.get("app_stage") != "analyze"
+):
+    _abandon_vision_job()
+
 # 5-1. 식단 스캐너
 if menu_key == "scanner":
     # Ghost 제거: render_login_badge() + 빈 col_top1 컬럼 완전 삭제
@@ -5703,7 +5796,26 @@ if menu_key == "scanner":
         st.error(t["gemini_key_error"])
         render_bottom_bar()
         st.stop()
-    client = genai.Client(api_key=API_KEY)
+    # rerun 마다 새 클라이언트를 만들지 않고 프로세스 공용 풀에서 재사용 (커넥션·TLS 유지)
+    client = get_gemini_client(API_KEY, "vision")
+
+    # 분석 중 웹소켓 재연결·새로고침으로 세션이 바뀐 경우: 이 사용자(게스트는 같은 이어받기 토큰)의
+    # 아직 수령되지 않은 분석 작업을 이어받는다. 소유자 기준 최근 작업 조회는 세션당 한 번만
+    if not st.session_state.get("vision_job_id"):
+        _resume_job = _resumable_vision_job(
+            st.query_params.get("scan_job"), st.query_params.get("scan_token")
+        )
+        if _resume_job is None and not st.session_state.get("vision_resume_checked"):
+            _uid_resume = st.session_state.get("user_id")
+            if _uid_resume and _uid_resume != "guest_user_demo":
+                _resume_job = VISION_JOBS.latest_for_owner(_uid_resume, "vision")
+        st.session_state["vision_resume_checked"] = True
+        if _resume_job is not None and not _resume_job.claimed:
+            st.session_state["vision_job_id"] = _resume_job.id
+            st.session_state["vision_resume_token"] = _resume_job.meta.get("resume_token")
+            st.session_state["current_img"] = _resume_job.meta.get("img")
+            st.session_state["vision_analysis_status"] = "running"
+            st.session_state['app_stage'] = 'analyze'
 
     if st.session_state['app_stage'] == 'main':
         is_guest = st.session_state.get('user_id') == 'guest_user_demo'
@@ -6675,6 +6787,9 @@ if menu_key == "scanner":
                 st.session_state["push_notif_enabled"] = False
                 st.info("🔕 알림이 꺼졌습니다. 브라우저 설정에서도 알림을 차단할 수 있습니다.")
 
+            if _is_admin_user():
+                _render_gemini_debug_panel()
+
             st.markdown("<div style='margin-bottom:10px;'></div>", unsafe_allow_html=True)
 
     elif st.session_state['app_stage'] == 'analyze':
@@ -6682,6 +6797,8 @@ if menu_key == "scanner":
         is_guest = st.session_state.get("user_id") == "guest_user_demo"
         # 2페이지: 업로드 완료 & 분석 대기 페이지
         if st.button(t["btn_back_main"], key="btn_back_main_1", use_container_width=True):
+            # 진행 중인 분석 작업은 버린다 (다른 세션이 이어받지 않도록)
+            _abandon_vision_job()
             st.session_state['app_stage'] = 'main'
             st.session_state['current_page'] = 'main'
             st.session_state['current_img'] = None
@@ -6692,220 +6809,44 @@ if menu_key == "scanner":
         # 미리보기: 최대 높이 350px, object-fit contain → 분석 버튼이 스크롤 없이 보이도록
         _img = st.session_state['current_img']
         if _img:
-            _buf = io.BytesIO()
-            if _img.mode in ("RGBA", "P"):
-                _img = _img.convert("RGB")
-            _img.save(_buf, format="JPEG", quality=85)
-            _b64 = base64.b64encode(_buf.getvalue()).decode()
+            # 업로드 아티팩트의 표시용 JPEG (rerun 마다 다시 인코딩하지 않음)
             st.markdown(f"""
             <div style="max-height:350px;display:flex;justify-content:center;align-items:center;margin-bottom:10px;background:#f8f9fa;border-radius:12px;overflow:hidden;">
-                <img src="data:image/jpeg;base64,{_b64}" alt="" role="presentation" decoding="async" style="max-height:350px;width:100%;object-fit:contain;" />
+                <img src="{_img.data_uri}" alt="" role="presentation" decoding="async" style="max-height:350px;width:100%;object-fit:contain;" />
             </div>
             """, unsafe_allow_html=True)
         
         # 분석 버튼 (피그마 스타일 & 무지개 애니메이션) - primary 타입으로 지정하여 다른 버튼(뒤로가기)과 CSS 분리
-        if st.button(t["analyze_btn"], use_container_width=True, type="primary"):
-            loading_placeholder = st.empty()
-            loading_placeholder.markdown("""
-                <style>
-                /* 분석 버튼(primary) 자체를 무지개색 반응형 패널로 강제 변조 */
-                button[data-testid="baseButton-primary"], 
-                button[kind="primary"] {
-                    background: linear-gradient(124deg, #ff2400, #e81d1d, #e8b71d, #e3e81d, #1de840, #1ddde8, #2b1de8, #dd00f3, #dd00f3) !important;
-                    background-size: 1800% 1800% !important;
-                    animation: rainbowBtn 2s ease infinite !important;
-                    border: none !important;
-                    box-shadow: 0 4px 15px rgba(0,0,0,0.2) !important;
-                    position: relative !important;
-                    pointer-events: none !important; /* 중복 클릭 방지 */
-                }
-                button[data-testid="baseButton-primary"] p, 
-                button[kind="primary"] p {
-                    color: transparent !important; /* 기존 글자 투명화 (공간 유지용) */
-                }
-                button[data-testid="baseButton-primary"]::after, 
-                button[kind="primary"]::after {
-                    content: '🤖 분석 중...' !important;
-                    position: absolute !important;
-                    top: 50% !important;
-                    left: 50% !important;
-                    transform: translate(-50%, -50%) !important;
-                    color: white !important;
-                    font-weight: 800 !important;
-                    font-size: 18px !important;
-                    visibility: visible !important;
-                    width: 100% !important;
-                    text-align: center !important;
-                    animation: blinkText 1.2s infinite !important;
-                }
-                @keyframes rainbowBtn { 
-                    0% { background-position: 0% 50% }
-                    50% { background-position: 100% 50% }
-                    100% { background-position: 0% 50% }
-                }
-                @keyframes blinkText {
-                    0% { opacity: 0.4; }
-                    50% { opacity: 1; }
-                    100% { opacity: 0.4; }
-                }
-                </style>
-            """, unsafe_allow_html=True)
-            st.session_state["vision_analysis_status"] = "running"
-            import time
-            import random
-            
-            max_retries = 3
-            success = False
-            last_err_msg = ""
-            is_503 = False
-            food_prompt, advice_prompt = get_analysis_prompt("KO")
-
-            # Gemini 1.5 시리즈 폐기: gemini-2.5-flash → gemini-2.0-flash 만 사용 (google-genai SDK)
-            _env_mm = os.environ.get("GEMINI_VISION_MODEL", "").strip()
-            _model_candidates = []
-            if _env_mm:
-                _model_candidates.append(_env_mm)
-            for _m in ("gemini-2.5-flash", "gemini-2.0-flash"):
-                if _m not in _model_candidates:
-                    _model_candidates.append(_m)
-
-            for attempt in range(max_retries):
-                try:
-                    response = None
-                    last_model_err = ""
-                    for _mm_model in _model_candidates:
-                        try:
-                            try:
-                                response = client.models.generate_content(
-                                    model=_mm_model,
-                                    contents=[food_prompt, st.session_state["current_img"]],
-                                    config=gtypes.GenerateContentConfig(
-                                        response_mime_type="application/json"
-                                    ),
-                                )
-                            except Exception:
-                                response = client.models.generate_content(
-                                    model=_mm_model,
-                                    contents=[food_prompt, st.session_state["current_img"]],
-                                )
-                            break
-                        except Exception as _me:
-                            last_model_err = str(_me)
-                            # 모델 미지원/미존재는 다음 후보로 폴백
-                            if "not found" in last_model_err.lower() or "not supported" in last_model_err.lower() or "NOT_FOUND" in last_model_err:
-                                continue
-                            raise
-                    if response is None:
-                        raise Exception(last_model_err or "No available Gemini multimodal model")
-
-                    raw_text = (response.text or "").strip()
-                    parsed_tuple = _parse_food_analysis_json_response(raw_text)
-                    if not parsed_tuple:
-                        _reset_vision_analysis_parse_error(is_guest, loading_placeholder)
-                        success = True
-                        break
-
-                    sorted_items, total_carbs = parsed_tuple
-                    if sorted_items:
-                        # 혈당 스코어 계산
-                        avg_gi = int(sum(i[1] for i in sorted_items) / len(sorted_items))
-                        blood_sugar_score = min(100, avg_gi)
-                        total_protein = sum(i[3] for i in sorted_items)
-                        total_fat = sum((i[6] if len(i) > 6 else 0) for i in sorted_items)
-                        total_kcal = sum((i[7] if len(i) > 7 else 0) for i in sorted_items)
-
-                        # 소견 분석 (선택 언어로 응답하도록 prompts.get_advice_prompt 사용)
-                        advice_res = None
-                        last_model_err = ""
-                        for _mm_model in _model_candidates:
-                            try:
-                                advice_res = client.models.generate_content(
-                                    model=_mm_model,
-                                    contents=[advice_prompt, st.session_state['current_img']]
-                                )
-                                break
-                            except Exception as _me:
-                                last_model_err = str(_me)
-                                if "not found" in last_model_err.lower() or "not supported" in last_model_err.lower() or "NOT_FOUND" in last_model_err:
-                                    continue
-                                raise
-                        if advice_res is None:
-                            raise Exception(last_model_err or "No available Gemini model (advice)")
-
-                        # 혈당 순서 가이드 엔진: 식이섬유 → 단백질 → 탄수화물
-                        def _classify_bucket(name, gi, carbs, protein, fat):
-                            n = (name or "").lower()
-                            if any(k in n for k in ["salad","샐러드","나물","야채","채소","greens","spinach","lettuce","kimchi","김치","무침"]):
-                                return "fiber"
-                            if protein >= carbs and protein >= fat:
-                                return "protein"
-                            return "carb"
-                        buckets = {"fiber": [], "protein": [], "carb": []}
-                        for it in sorted_items:
-                            # it: [name, gi, carbs, protein, color, order, fat?, kcal?]
-                            name, gi, carbs, protein = it[0], it[1], it[2], it[3]
-                            fat = it[6] if len(it) > 6 else 0
-                            buckets[_classify_bucket(name, gi, carbs, protein, fat)].append(name)
-                        order_comment = (
-                            "이 식단은 "
-                            f"{( ' · '.join(buckets['fiber']) if buckets['fiber'] else '식이섬유' )} "
-                            "➡ "
-                            f"{( ' · '.join(buckets['protein']) if buckets['protein'] else '단백질' )} "
-                            "➡ "
-                            f"{( ' · '.join(buckets['carb']) if buckets['carb'] else '탄수화물' )} "
-                            "순서로 드시면 혈당 스파이크를 줄이는 데 도움이 됩니다!"
-                        )
-
-                        # 하루 누적 업데이트
-                        prev_count = st.session_state['daily_meals_count']
-                        st.session_state['daily_blood_sugar_score'] = int(
-                            (st.session_state['daily_blood_sugar_score'] * prev_count + blood_sugar_score) / (prev_count + 1)
-                        )
-                        st.session_state['daily_carbs'] += total_carbs
-                        st.session_state['daily_protein'] += total_protein
-                        st.session_state['daily_meals_count'] += 1
-
-                        st.session_state['current_analysis'] = {
-                            "sorted_items": sorted_items,
-                            "advice": advice_res.text + "\n\n" + order_comment,
-                            "raw_img": st.session_state['current_img'],
-                            "blood_sugar_score": blood_sugar_score,
-                            "total_carbs": total_carbs,
-                            "total_protein": total_protein,
-                            "total_fat": total_fat,
-                            "total_kcal": total_kcal,
-                            "avg_gi": avg_gi,
-                        }
-                        loading_placeholder.empty()
-                        st.session_state["vision_analysis_status"] = "done"
-                        st.session_state['app_stage'] = 'result'
-                        success = True
-                        st.rerun()
-                        
-                except Exception as e:
-                    err_str = str(e)
-                    last_err_msg = err_str
-                    if '503' in err_str:
-                        is_503 = True
-                        if attempt < max_retries - 1:
-                            # 503 발생 시 점진적으로 대기 시간을 늘립니다.
-                            time.sleep(random.uniform(2.0, 4.0))
-                            continue
-                    
-                    is_503 = '503' in err_str
-                    break
-                    
-            if not success:
-                loading_placeholder.empty()
-                st.session_state["vision_analysis_status"] = "idle"
-                # 에러로 인해 스캔이 실패했으므로, 게스트 유저인 경우 차감된 횟수를 1회 복구해줍니다.
+        # 분석은 백그라운드 작업으로 제출하고, 진행률은 자동 새로고침 fragment 로 확인한다.
+        _vjob_id = st.session_state.get("vision_job_id")
+        if st.button(t["analyze_btn"], use_container_width=True, type="primary") and not _vjob_id:
+            _uid_job = st.session_state.get("user_id")
+            _img_job = st.session_state["current_img"]
+            try:
+                _vjob_id = VISION_JOBS.submit(
+                    "vision",
+                    lambda progress: run_vision_analysis(client, _img_job, progress),
+                    owner=_uid_job if (_uid_job and not is_guest) else None,
+                    meta={"img": _img_job, "resume_token": _vision_resume_token()},
+                )
+            except JobQueueFull:
+                _vjob_id = None
                 if is_guest and st.session_state['guest_usage_count'] > 0:
                     st.session_state['guest_usage_count'] -= 1
-                    
-                if is_503:
-                    st.error(t["server_busy"])
-                else:
-                    st.error(get_text("KO", "analysis_error_generic", msg=last_err_msg))
+                st.error(t["server_busy"])
+            else:
+                st.session_state["vision_job_id"] = _vjob_id
+                st.query_params["scan_job"] = _vjob_id
+                st.query_params["scan_token"] = _vision_resume_token()
+                st.session_state["vision_analysis_status"] = "running"
+        if _vjob_id:
+            loading_placeholder = st.empty()
+            loading_placeholder.markdown(_ANALYZE_LOADING_CSS, unsafe_allow_html=True)
+            _vjob = VISION_JOBS.get(_vjob_id)
+            if _vjob is not None and not _vjob.done:
+                _poll_vision_job(t, _vjob_id)
+            else:
+                _finish_vision_job(t, _vjob, is_guest, loading_placeholder)
 
     elif st.session_state['app_stage'] == 'result':
         # 세션 손실(다중 워커/타임아웃 등) 시 분석 결과가 없으면 메인으로 복귀
@@ -6951,14 +6892,9 @@ if menu_key == "scanner":
         with col_img:
             _res_img = res.get("raw_img")
             if _res_img:
-                _rb = io.BytesIO()
-                if _res_img.mode in ("RGBA", "P"):
-                    _res_img = _res_img.convert("RGB")
-                _res_img.save(_rb, format="JPEG", quality=85)
-                _res_b64 = base64.b64encode(_rb.getvalue()).decode()
                 st.markdown(f"""
                 <div style="max-height:350px;display:flex;justify-content:center;align-items:center;background:#f8f9fa;border-radius:12px;overflow:hidden;">
-                    <img src="data:image/jpeg;base64,{_res_b64}" alt="" role="presentation" decoding="async" style="max-height:350px;width:100%;object-fit:contain;" />
+                    <img src="{_res_img.data_uri}" alt="" role="presentation" decoding="async" style="max-height:350px;width:100%;object-fit:contain;" />
                 </div>
                 """, unsafe_allow_html=True)
         with col_score:
@@ -7093,7 +7029,39 @@ if menu_key == "scanner":
 
         # ── 6. AI 소견 ──
         st.markdown(f"""<div style="display:flex;align-items:center;margin:12px 0 8px;"><div style="width:5px;height:20px;background:linear-gradient(to bottom,#86cc85,#359f33);border-radius:4px;margin-right:9px;"></div><div style="font-size:16px;font-weight:800;color:#1e293b;">{t['ai_advice_section']}</div></div>""", unsafe_allow_html=True)
-        st.info(res['advice'])
+        if res.get("advice_pending"):
+            # stream 모드: 소견을 토큰 단위로 흘려 표시하고, 완성된 문자열을 결과·캐시에 반영
+            _advice_prompt = get_analysis_prompt("KO")[1]
+            try:
+                with st.container(border=True):
+                    _streamed = st.write_stream(
+                        stream_vision_advice(
+                            client,
+                            model_fallback_chain("GEMINI_VISION_MODEL"),
+                            _advice_prompt,
+                            image_part(res["raw_img"].model_input()),
+                        )
+                    )
+                _streamed = (_streamed if isinstance(_streamed, str) else "".join(map(str, _streamed or []))).strip()
+            except Exception as _se:
+                sys.stderr.write(f"[소견 스트리밍] 실패: {_se}\n")
+                _streamed = ""
+            res["advice_pending"] = False
+            if _streamed:
+                res["advice"] = _streamed + "\n\n" + res.get("advice_suffix", "")
+                if res.get("cache_key"):
+                    get_vision_cache().set(
+                        res["cache_key"],
+                        {
+                            "sorted_items": res.get("sorted_items", []),
+                            "total_carbs": res.get("total_carbs", 0),
+                            "advice": _streamed,
+                        },
+                    )
+            # 스트리밍된 소견은 위 컨테이너에 이미 표시됨 → 식사 순서 가이드만 덧붙임
+            st.info(res.get("advice_suffix") or res['advice'])
+        else:
+            st.info(res['advice'])
 
         # ── 7. 저장 실행 처리 (Bottom Bar에서 트리거) ──
         if st.session_state.get("login_type") != "guest" and st.session_state.get("meal_save_trigger"):
@@ -7130,8 +7098,15 @@ if menu_key == "scanner":
                     }
 
                     meal_id = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f")
-                    image_url = upload_image_to_storage(uid, meal_id, res.get("raw_img"), max_width=800, quality=85)
+                    # 아티팩트의 저장용 JPEG (한 번만 인코딩) 를 그대로 업로드
+                    _raw_art = res.get("raw_img")
+                    image_url = upload_image_to_storage(
+                        uid, meal_id, _raw_art.storage_jpeg(800, 85) if _raw_art is not None else None
+                    )
                     meal_data["image_url"] = image_url
+                    # 피드용 WebP 썸네일 (실패한 너비는 빠지고, 피드는 원본을 요청 시에만 내려받음)
+                    if _raw_art is not None and image_url:
+                        meal_data["thumb_urls"] = upload_meal_thumbnails(uid, meal_id, _raw_art.thumbnails())
                     _saved_id = save_meal_and_summary(uid, date_key, meal_data)
                     meal_data["meal_id"] = _saved_id
 
@@ -7554,6 +7529,12 @@ elif menu_key == "history":
             _menu_name = _extract_menu_names(rec) or t.get("pre_meal_menu_fallback", "기록된 식단")
             _adv = str(rec.get("advice") or "")
             image_url = rec.get("image_url")
+            _thumbs = rec.get("thumb_urls") or {}
+            # 행 미리보기는 160px 썸네일 URL 을 브라우저가 직접 받는다 (서버 다운로드 없음, immutable 캐시 적용)
+            _row_thumb = (
+                f'<img class="ns-tl-thumb" alt="" loading="lazy" src="{esc(_thumbs["160"])}">'
+                if _thumbs.get("160") else ""
+            )
 
             # 위험도 색상·라벨·이모지
             if rec_score <= 40:
@@ -7601,7 +7582,7 @@ elif menu_key == "history":
     <div class="ns-tl-macros">
       🍚 <b>{rec_carbs}g</b>&nbsp;·&nbsp;💪 <b>{rec_protein}g</b>&nbsp;·&nbsp;🧈 <b>{rec_fat}g</b>&nbsp;·&nbsp;⚡ 스파이크 <b>{est_spike}</b>
     </div>
-  </div>
+  </div>{_row_thumb}
 </div>
 """,
                     unsafe_allow_html=True,
@@ -7615,14 +7596,28 @@ elif menu_key == "history":
                             unsafe_allow_html=True,
                         )
 
-                # 식단 사진 (접기/펼치기)
+                # 식단 사진 (접기/펼치기): 접혀 있어도 본문은 실행되므로 서버에서 받지 않는다.
+                # 320px 썸네일은 lazy <img> 라 펼쳤을 때 브라우저가 받고, 원본 JPEG 은 버튼을 눌렀을 때만
                 if image_url:
                     with st.expander("📷 식단 사진", expanded=False):
-                        image_bytes, debug_msg = fetch_image_bytes_direct(image_url)
-                        if image_bytes:
-                            st.image(image_bytes, use_container_width=True)
-                        else:
-                            st.caption(f"이미지 로드 실패: {debug_msg}")
+                        _full_key = f"meal_full_img_{_doc_id or i}"
+                        _img_slot = st.empty()
+                        _show_full = bool(st.session_state.get(_full_key))
+                        if not _show_full and st.button(
+                            "🔍 원본 사진 보기", key=f"meal_full_btn_{_doc_id}_{i}", use_container_width=True
+                        ):
+                            _show_full = st.session_state[_full_key] = True
+                        if _show_full:
+                            image_bytes, debug_msg = fetch_image_bytes_direct(image_url)
+                            if image_bytes:
+                                _img_slot.image(image_bytes, use_container_width=True)
+                            else:
+                                _img_slot.caption(f"이미지 로드 실패: {debug_msg}")
+                        elif _thumbs.get("320"):
+                            _img_slot.markdown(
+                                f'<img class="ns-tl-photo" alt="" loading="lazy" src="{esc(_thumbs["320"])}">',
+                                unsafe_allow_html=True,
+                            )
 
         # 더 보기
         if st.session_state.get("has_more") and _uid_hist:
@@ -110,15 +110,24 @@ def _compress_for_storage(img, max_width=800, quality=85):
 
 
 def upload_image_to_storage(uid, meal_id, pil_image, max_width=800, quality=85):
+    """pil_image 는 PIL 이미지 또는 이미 인코딩된 JPEG 바이트(업로드 아티팩트의 storage_jpeg: 그대로 업로드)."""
     _init_firebase()
     if pil_image is None:
         return None
-    img_bytes = _compress_for_storage(pil_image, max_width=max_width, quality=quality)
+    if isinstance(pil_image, (bytes, bytearray, memoryview)):
+        img_bytes = bytes(pil_image)
+    else:
+        img_bytes = _compress_for_storage(pil_image, max_width=max_width, quality=quality)
     bucket = storage.bucket()
     uid_safe = str(uid).replace("/", "_").replace("\\", "_")
     path = f"users/{uid_safe}/meals/{meal_id}.jpg"
     blob = bucket.blob(path)
     blob.upload_from_string(img_bytes, content_type="image/jpeg")
+    return _blob_url(blob, path, bucket.name, "upload_image_to_storage")
+
+
+def _blob_url(blob, path, bucket_name, tag):
+    """업로드한 객체의 접근 URL: 서명 URL → 공개 URL → GCS 경로 URL 순으로 시도."""
     image_url = None
     try:
         image_url = blob.generate_signed_url(
@@ -127,7 +136,7 @@ def upload_image_to_storage(uid, meal_id, pil_image, max_width=800, quality=85):
             method="GET",
         )
     except Exception as e:
-        sys.stderr.write(f"[upload_image_to_storage] signed URL 생성 실패, 공개 URL로 대체: {e}\n")
+        sys.stderr.write(f"[{tag}] signed URL 생성 실패, 공개 URL로 대체: {e}\n")
     if not (image_url and str(image_url).strip().startswith("http")):
         try:
             blob.make_public()
@@ -135,10 +144,34 @@ def upload_image_to_storage(uid, meal_id, pil_image, max_width=800, quality=85):
             pass
         image_url = getattr(blob, "public_url", None) or ""
         if not (image_url and str(image_url).strip().startswith("http")):
-            image_url = _normalize_image_url(path, bucket.name)
+            image_url = _normalize_image_url(path, bucket_name)
     return image_url
 
 
+def upload_meal_thumbnails(uid, meal_id, thumbs):
+    """
+    피드용 썸네일(WebP)을 식단 사진 옆 users/{uid}/meals/{meal_id}_w{너비}.webp 로 업로드.
+    thumbs: {너비: WebP 바이트} (ImageArtifact.thumbnails). 반환 {"160": url, ...} (Firestore 맵 키는 문자열).
+    일부가 실패해도 나머지는 저장하고, 실패한 너비는 빠진다 (피드는 원본을 요청 시 내려받는다).
+    """
+    if not thumbs:
+        return {}
+    _init_firebase()
+    bucket = storage.bucket()
+    uid_safe = str(uid).replace("/", "_").replace("\\", "_")
+    urls = {}
+    for width, data in sorted(thumbs.items()):
+        path = f"users/{uid_safe}/meals/{meal_id}_w{int(width)}.webp"
+        try:
+            blob = bucket.blob(path)
+            blob.cache_control = "private, max-age=31536000, immutable"
+            blob.upload_from_string(bytes(data), content_type="image/webp")
+            urls[str(int(width))] = _blob_url(blob, path, bucket.name, "upload_meal_thumbnails")
+        except Exception as e:
+            sys.stderr.write(f"[upload_meal_thumbnails] {path!r}: {type(e).__name__}: {e}\n")
+    return urls
+
+
 def sanitize_for_firestore(data):
     """Firestore에 저장하기 전, 중첩 배열(Nested Arrays)을 찾아 쉼표 문자열로 평탄화하는 재귀 함수"""
     if isinstance(data, dict):
@@ -191,20 +224,33 @@ def save_meal_and_summary(uid, date_key, meal_data):
     return meal_ref.id
 
 
+def _object_path_from_url(image_url, bucket_name):
+    """우리 버킷의 GCS URL → 객체 경로 (다른 버킷·형식이면 None)."""
+    if not (image_url and isinstance(image_url, str) and image_url.strip()):
+        return None
+    # 서명 URL(v4)은 ?X-Goog-... 쿼리가 붙으므로 객체 경로만 남긴다
+    u = image_url.strip().split("?", 1)[0]
+    base = f"https://storage.googleapis.com/{bucket_name}/"
+    if u.startswith(base):
+        return urllib.parse.unquote(u[len(base) :])
+    m = re.match(r"https://storage\.googleapis\.com/([^/]+)/(.+)", u)
+    if m and m.group(1) == bucket_name:
+        return urllib.parse.unquote(m.group(2))
+    return None
+
+
 def _blob_paths_for_meal_image(uid, doc_id, data, bucket_name):
     """삭제 시 시도할 Storage 객체 경로 목록(중복 제거)."""
     uid_safe = str(uid).replace("/", "_").replace("\\", "_")
     paths = []
-    image_url = (data or {}).get("image_url") or ""
-    if image_url and isinstance(image_url, str) and image_url.strip():
-        u = image_url.strip()
-        base = f"https://storage.googleapis.com/{bucket_name}/"
-        if u.startswith(base):
-            paths.append(urllib.parse.unquote(u[len(base) :]))
-        else:
-            m = re.match(r"https://storage\.googleapis\.com/([^/]+)/(.+)", u)
-            if m and m.group(1) == bucket_name:
-                paths.append(urllib.parse.unquote(m.group(2)))
+    urls = [(data or {}).get("image_url") or ""]
+    thumb_urls = (data or {}).get("thumb_urls")
+    if isinstance(thumb_urls, dict):
+        urls.extend(thumb_urls.values())
+    for image_url in urls:
+        path = _object_path_from_url(image_url, bucket_name)
+        if path:
+            paths.append(path)
     paths.append(f"users/{uid_safe}/meals/{doc_id}.jpg")
     mid = (data or {}).get("meal_id")
     if mid and str(mid) != str(doc_id):
@@ -313,6 +359,12 @@ def get_meal_feed(uid, limit=5, start_after_doc=None, sort_field=None):
         data = d.to_dict() or {}
         raw_url = data.get("image_url")
         image_url = _normalize_image_url(raw_url, bucket_name) if raw_url else None
+        raw_thumbs = data.get("thumb_urls")
+        thumb_urls = {
+            str(k): _normalize_image_url(v, bucket_name)
+            for k, v in (raw_thumbs.items() if isinstance(raw_thumbs, dict) else ())
+            if v
+        }
         items = data.get("sorted_items", [])
         if items and isinstance(items, list) and isinstance(items[0], dict):
             sorted_lists = [
@@ -335,6 +387,7 @@ def get_meal_feed(uid, limit=5, start_after_doc=None, sort_field=None):
                 "saved_at_utc": data.get("saved_at_utc"),
                 "image": None,
                 "image_url": image_url,
+                "thumb_urls": thumb_urls,
                 "sorted_items": sorted_lists,
                 "advice": data.get("advice", ""),
                 "blood_sugar_score": int(data.get("blood_sugar_score", 0) or 0),
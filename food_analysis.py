@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+NutriSort AI - 비전 음식 분석 응답 해석·점수 계산.
+
+Gemini 비전 JSON 응답을 sorted_items([name, gi, carbs, protein, color, order, fat, kcal])로 바꾸고
+(음식 기준표에 있는 음식은 수치를 기준표 1인분 × portion 으로 채움)
+혈당 스코어·영양 합계·식사 순서 안내 문장을 계산한다. 스캐너(app.py)와 오프라인 재분석
+스크립트(scripts/reanalyze_meals.py)가 같은 규칙을 쓰도록 Streamlit 에 의존하지 않는다.
+"""
+
+import sys
+
+from food_index import get_food_index
+from response_schemas import FOOD_ANALYSIS_SCHEMA, ResponseSchemaError, decode_response
+
+
+def parse_food_analysis_json(response, index=None):
+    """
+    비전 응답(SDK 응답·원문·dict) → (sorted_items, total_carbs) 또는 None.
+    sorted_items 항목: [name, gi, carbs, protein, color, order, fat, kcal]
+    음식 기준표(index, 기본은 공용 기준표)에 있는 음식은 gi·영양 수치를 기준표 값으로 바꾼다.
+    기준표에 없는 음식의 수치가 하나라도 빠졌으면 (모델이 기준표 음식으로 착각해 생략) None.
+    """
+    if index is None:
+        index = get_food_index()
+    try:
+        data = decode_response(response, FOOD_ANALYSIS_SCHEMA)
+    except ResponseSchemaError:
+        return None
+    parsed = []
+    index_hits = 0
+    for it in data["items"]:
+        gi, carbs, protein, fat, kcal = it["gi"], it["carbs"], it["protein"], it["fat"], it["kcal"]
+        facts = index.lookup(it["name"]) if index is not None else None
+        if facts is not None:
+            portion = it["portion"]
+            gi = facts.gi
+            carbs = int(round(facts.carbs * portion))
+            protein = int(round(facts.protein * portion))
+            fat = int(round(facts.fat * portion))
+            kcal = int(round(facts.kcal * portion))
+            index_hits += 1
+        elif None in (gi, carbs, protein, fat, kcal):
+            sys.stderr.write(f"[음식 분석] 기준표에 없는 음식의 수치 누락: {it['name']!r}\n")
+            return None
+        parsed.append([it["name"], gi, carbs, protein, it["signal"], it["order"], fat, kcal])
+    sorted_items = sorted(parsed, key=lambda x: x[5])
+    sum_carbs = sum(x[2] for x in parsed)
+    tc = data["total_carbs"]
+    if tc is None:
+        tc = sum_carbs
+    # 기준표로 바꾼 항목이 있으면 모델의 total_carbs 는 더 이상 항목 합과 맞지 않는다
+    if index_hits or (sum_carbs > 0 and abs(tc - sum_carbs) > max(8, int(sum_carbs * 0.35))):
+        tc = sum_carbs
+    total_carbs = max(0, tc)
+    return sorted_items, total_carbs
+
+
+def classify_food_bucket(name, gi, carbs, protein, fat):
+    """혈당 순서 가이드 엔진: 식이섬유 / 단백질 / 탄수화물 분류."""
+    n = (name or "").lower()
+    if any(k in n for k in ["salad","샐러드","나물","야채","채소","greens","spinach","lettuce","kimchi","김치","무침"]):
+        return "fiber"
+    if protein >= carbs and protein >= fat:
+        return "protein"
+    return "carb"
+
+
+def build_order_comment(sorted_items):
+    """식이섬유 → 단백질 → 탄수화물 순서 안내 문장."""
+    buckets = {"fiber": [], "protein": [], "carb": []}
+    for it in sorted_items:
+        # it: [name, gi, carbs, protein, color, order, fat?, kcal?]
+        name, gi, carbs, protein = it[0], it[1], it[2], it[3]
+        fat = it[6] if len(it) > 6 else 0
+        buckets[classify_food_bucket(name, gi, carbs, protein, fat)].append(name)
+    return (
+        "이 식단은 "
+        f"{( ' · '.join(buckets['fiber']) if buckets['fiber'] else '식이섬유' )} "
+        "➡ "
+        f"{( ' · '.join(buckets['protein']) if buckets['protein'] else '단백질' )} "
+        "➡ "
+        f"{( ' · '.join(buckets['carb']) if buckets['carb'] else '탄수화물' )} "
+        "순서로 드시면 혈당 스파이크를 줄이는 데 도움이 됩니다!"
+    )
+
+
+def score_food_items(sorted_items, total_carbs) -> dict:
+    """sorted_items → 혈당 스코어(평균 GI, 최대 100)·영양 합계·예상 스파이크. 저장 문서와 같은 키."""
+    avg_gi = int(sum(i[1] for i in sorted_items) / len(sorted_items)) if sorted_items else 0
+    return {
+        "blood_sugar_score": min(100, avg_gi),
+        "total_carbs": total_carbs,
+        "total_protein": sum(i[3] for i in sorted_items),
+        "total_fat": sum((i[6] if len(i) > 6 else 0) for i in sorted_items),
+        "total_kcal": sum((i[7] if len(i) > 7 else 0) for i in sorted_items),
+        "avg_gi": avg_gi,
+        "estimated_spike": int(round(float(total_carbs or 0) * 2)),
+    }
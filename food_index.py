@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+NutriSort AI - 로컬 음식 영양·GI 기준표.
+
+assets/food_index_ko.tsv(1인분 기준 gi·탄수화물·단백질·지방·kcal)를 mmap 으로 열고,
+정규화한 음식명·별칭 → 행 위치 정렬 색인만 메모리에 둔다. 숫자는 조회할 때 해당 행만 읽는다.
+비전 분석은 음식명과 인분(portion)만 믿고 수치는 이 표에서 채우며, 표에 없는 음식은 모델 값을 쓴다.
+조회는 정규화한 이름의 정확한 일치만 본다 (대표 이름 또는 표에 적힌 별칭). 접미 일치는 라볶이→떡볶이처럼
+영양이 다른 음식이 엉뚱한 행을 빌려 쓰게 만들므로 쓰지 않는다.
+"""
+
+import mmap
+import os
+import re
+import sys
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import namedtuple
+
+_DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "food_index_ko.tsv")
+# 경로를 바꾸거나 "off" 로 끌 수 있다
+_INDEX_PATH = os.environ.get("NUTRISORT_FOOD_INDEX", "").strip() or _DEFAULT_PATH
+
+FoodFacts = namedtuple("FoodFacts", "name gi carbs protein fat kcal")
+
+# 괄호 안 부가 설명("(소)", "(1인분)")과 수량 표현("1공기", "반 공기")은 이름에서 뺀다 (양은 portion 으로)
+_PAREN_RE = re.compile(r"[(\[{（【].*?[)\]}）】]")
+_QTY_RE = re.compile(r"(?:\d+(?:\.\d+)?|반)\s*(?:인분|공기|그릇|접시|조각|개|g|ml)")
+
+
+def normalize_food_name(name: str) -> str:
+    """NFKC·소문자, 괄호 설명·수량·공백·기호·이모지 제거. "🍚 흰 쌀밥(1공기)" → "흰쌀밥"."""
+    s = unicodedata.normalize("NFKC", str(name or "")).lower()
+    s = _QTY_RE.sub("", _PAREN_RE.sub("", s))
+    return "".join(ch for ch in s if unicodedata.category(ch)[0] in ("L", "N"))
+
+
+class FoodIndex:
+    """mmap 한 TSV 기준표 + (정규화 이름 → 행 오프셋) 정렬 색인. 조회는 스레드 안전."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as fp:
+            self._mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        entries = {}
+        # 대표 이름(첫 열, 파일 순서): 프롬프트에 "수치 생략 가능" 목록으로 넣는다
+        self.names = []
+        offset = 0
+        for raw in iter(self._mm.readline, b""):
+            line = raw.decode("utf-8").rstrip("\r\n")
+            if line and not line.startswith("#"):
+                cols = line.split("\t")
+                self.names.append(cols[0])
+                names = [cols[0]] + [a for a in cols[1].split("|") if a]
+                for n in names:
+                    key = normalize_food_name(n)
+                    if not key:
+                        continue
+                    if key in entries:
+                        sys.stderr.write(f"[음식 기준표] 중복 이름 무시: {n}\n")
+                        continue
+                    entries[key] = offset
+            offset += len(raw)
+        self._keys = sorted(entries)
+        self._offsets = [entries[k] for k in self._keys]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _row(self, offset: int) -> FoodFacts:
+        with self._lock:
+            self._mm.seek(offset)
+            raw = self._mm.readline()
+        cols = raw.decode("utf-8").rstrip("\r\n").split("\t")
+        return FoodFacts(cols[0], *(int(c) for c in cols[2:7]))
+
+    def _exact(self, key: str):
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self._offsets[i]
+        return None
+
+    def lookup(self, name: str):
+        """정규화한 이름이 대표 이름·별칭과 정확히 같으면 FoodFacts, 아니면 None."""
+        key = normalize_food_name(name)
+        if not key:
+            return None
+        off = self._exact(key)
+        return self._row(off) if off is not None else None
+
+
+_index = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+
+def get_food_index():
+    """프로세스 공용 기준표. 꺼져 있거나 파일을 열 수 없으면 None (모델 값 사용)."""
+    global _index, _index_loaded
+    with _index_lock:
+        if not _index_loaded:
+            _index_loaded = True
+            if _INDEX_PATH.lower() != "off":
+                try:
+                    _index = FoodIndex(_INDEX_PATH)
+                except Exception as e:
+                    sys.stderr.write(f"[음식 기준표] 불러오기 실패 {_INDEX_PATH}: {e}\n")
+        return _index
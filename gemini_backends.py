@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+"""
+NutriSort AI - 교체 가능한 Gemini 백엔드 (실제 / 녹화 / 재생·가짜).
+
+get_gemini_client 가 돌려주는 객체는 genai.Client 와 같은 모양
+(models.generate_content · models.generate_content_stream · aio.models.generate_content)이라
+모든 호출부(gemini_generate*)는 백엔드를 몰라도 된다. NUTRISORT_GEMINI_BACKEND 로 고른다.
+  real   (기본) genai.Client
+  record 실제 호출 + 요청 지문별 응답(또는 오류)·지연을 NUTRISORT_GEMINI_RECORD_DIR 에 JSON 으로 저장
+  replay 녹화된 응답 재생, 녹화에 없는 요청은 가짜 응답 — 네트워크 불필요
+  fake   항상 가짜 응답 (response_schema 가 있으면 스키마에 맞는 JSON, 없으면 고정 소견 텍스트)
+replay·fake 는 지연 분포(NUTRISORT_GEMINI_FAKE_LATENCY)와 오류율(NUTRISORT_GEMINI_FAKE_ERRORS),
+항상 NOT_FOUND 인 모델(NUTRISORT_GEMINI_FAKE_MISSING_MODELS)을 설정할 수 있어 노트북에서 부하·지연 시험이 된다.
+API 키는 확인만 하므로 replay·fake 에서는 GEMINI_API_KEY 에 아무 값이나 넣으면 된다.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+from google import genai
+
+BACKEND_MODES = ("real", "record", "replay", "fake")
+_BACKEND = (os.environ.get("NUTRISORT_GEMINI_BACKEND", "real").strip().lower() or "real")
+_RECORD_DIR = os.environ.get("NUTRISORT_GEMINI_RECORD_DIR", "").strip() or os.path.join(
+    tempfile.gettempdir(), "nutrisort_gemini_recordings"
+)
+# 예: "lognormal:1.5,0.4"(중앙값 초, 시그마) | "uniform:0.5,3" | "fixed:0.8" | "recorded"(녹화 지연, 없으면 기본)
+_LATENCY_SPEC = os.environ.get("NUTRISORT_GEMINI_FAKE_LATENCY", "").strip() or "lognormal:1.5,0.4"
+# 예: "503=0.05,429=0.02,404=0.01" (호출마다 독립 확률)
+_ERROR_SPEC = os.environ.get("NUTRISORT_GEMINI_FAKE_ERRORS", "").strip()
+_MISSING_MODELS = tuple(
+    m.strip() for m in os.environ.get("NUTRISORT_GEMINI_FAKE_MISSING_MODELS", "").split(",") if m.strip()
+)
+
+_ERROR_STATUS = {404: "NOT_FOUND", 429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE", 504: "DEADLINE_EXCEEDED"}
+# 이미지 1장당 토큰 (768px 타일 1장 기준 추정)
+_FAKE_IMAGE_TOKENS = 258
+
+
+class FakeGeminiError(Exception):
+    """재생·가짜 백엔드가 내는 API 오류. code·status 가 APIError 와 같아 classify_gemini_error 로 분류된다."""
+
+    def __init__(self, code: int, message: str = "", status: str = None):
+        self.code = int(code)
+        self.status = status or _ERROR_STATUS.get(self.code, "UNKNOWN")
+        self.response = None
+        super().__init__(f"{self.code} {self.status}. {message or '(fake backend)'}")
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 요청 지문·녹화 저장소
+# ──────────────────────────────────────────────────────────────────────────────
+def _dump_model(obj):
+    """SDK pydantic 객체(Schema 등) → JSON 직렬화 가능한 값."""
+    dump = getattr(obj, "model_dump", None)
+    if callable(dump):
+        return dump(mode="json", exclude_none=True)
+    return obj if isinstance(obj, (str, int, float, bool, list, dict, type(None))) else repr(obj)
+
+
+def request_fingerprint(model, contents, config=None) -> str:
+    """(모델, 프롬프트 텍스트, 이미지 바이트 해시, 설정) → sha256. 같은 요청은 실행이 달라도 같은 지문."""
+    h = hashlib.sha256()
+    h.update(str(model).encode("utf-8") + b"\0")
+    for c in contents or []:
+        inline = getattr(c, "inline_data", None)
+        if isinstance(c, str):
+            h.update(b"t:" + c.encode("utf-8"))
+        elif inline is not None and getattr(inline, "data", None):
+            h.update(b"i:" + hashlib.sha256(inline.data).digest() + str(inline.mime_type).encode("utf-8"))
+        elif getattr(c, "text", None):
+            h.update(b"t:" + c.text.encode("utf-8"))
+        else:
+            h.update(b"?:" + type(c).__name__.encode("utf-8"))
+        h.update(b"\0")
+    if config is not None:
+        cfg = {
+            k: _dump_model(getattr(config, k, None))
+            for k in ("response_mime_type", "response_schema", "system_instruction")
+        }
+        h.update(json.dumps(cfg, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _count_images(contents) -> int:
+    return sum(1 for c in contents or [] if getattr(getattr(c, "inline_data", None), "data", None))
+
+
+def _prompt_chars(contents) -> int:
+    return sum(len(c) for c in contents or [] if isinstance(c, str))
+
+
+class RecordingStore:
+    """녹화 디렉터리: 지문마다 JSON 파일 하나 (원자적 교체 저장). 읽은 녹화는 메모리에 보관."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _path(self, fp: str) -> str:
+        return os.path.join(self.directory, f"{fp}.json")
+
+    def load(self, fp: str):
+        with self._lock:
+            if fp in self._cache:
+                return self._cache[fp]
+        try:
+            with open(self._path(fp), encoding="utf-8") as f:
+                rec = json.load(f)
+        except (OSError, ValueError):
+            rec = None
+        with self._lock:
+            self._cache[fp] = rec
+        return rec
+
+    def save(self, fp: str, rec: dict) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = self._path(fp) + f".{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(rec, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self._path(fp))
+        except OSError as e:
+            sys.stderr.write(f"[Gemini 녹화] 저장 실패 {fp[:12]}: {e}\n")
+            return
+        with self._lock:
+            self._cache[fp] = rec
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 녹화 백엔드: 실제 클라이언트를 감싸 요청·응답을 저장
+# ──────────────────────────────────────────────────────────────────────────────
+def _usage_dict(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    return {
+        "prompt_token_count": getattr(usage, "prompt_token_count", None),
+        "candidates_token_count": getattr(usage, "candidates_token_count", None),
+    }
+
+
+def _error_dict(exc):
+    code = getattr(exc, "code", None)
+    return {
+        "code": code if isinstance(code, int) else None,
+        "status": str(getattr(exc, "status", "") or "") or None,
+        "message": str(exc)[:500],
+    }
+
+
+class _RecordingModels:
+    def __init__(self, inner, store):
+        self._inner = inner
+        self._store = store
+
+    def _save(self, model, contents, config, t0, **rec):
+        fp = request_fingerprint(model, contents, config)
+        self._store.save(fp, {
+            "fingerprint": fp,
+            "model": model,
+            "recorded_at": time.time(),
+            "latency_ms": round((time.monotonic() - t0) * 1000, 1),
+            "images": _count_images(contents),
+            **rec,
+        })
+
+    def generate_content(self, *, model, contents, config=None):
+        t0 = time.monotonic()
+        try:
+            response = self._inner.generate_content(model=model, contents=contents, config=config)
+        except Exception as e:
+            self._save(model, contents, config, t0, error=_error_dict(e))
+            raise
+        self._save(model, contents, config, t0, text=response.text, usage=_usage_dict(response))
+        return response
+
+    def generate_content_stream(self, *, model, contents, config=None):
+        t0 = time.monotonic()
+        chunks, usage, first_ms = [], None, None
+        try:
+            for chunk in self._inner.generate_content_stream(model=model, contents=contents, config=config):
+                if first_ms is None:
+                    first_ms = round((time.monotonic() - t0) * 1000, 1)
+                chunks.append(getattr(chunk, "text", None) or "")
+                usage = _usage_dict(chunk) or usage
+                yield chunk
+        except Exception as e:
+            self._save(model, contents, config, t0, error=_error_dict(e), stream=True)
+            raise
+        self._save(model, contents, config, t0, text="".join(chunks), chunks=chunks, usage=usage,
+                   stream=True, first_chunk_ms=first_ms)
+
+
+class _RecordingAsyncModels(_RecordingModels):
+    async def generate_content(self, *, model, contents, config=None):
+        t0 = time.monotonic()
+        try:
+            response = await self._inner.generate_content(model=model, contents=contents, config=config)
+        except Exception as e:
+            self._save(model, contents, config, t0, error=_error_dict(e))
+            raise
+        self._save(model, contents, config, t0, text=response.text, usage=_usage_dict(response))
+        return response
+
+
+class RecordingClient:
+    """genai.Client 를 감싸 모든 요청의 지문·응답을 녹화한다 (동작은 실제 클라이언트와 같음)."""
+
+    backend = "record"
+
+    def __init__(self, inner, store: RecordingStore):
+        self.models = _RecordingModels(inner.models, store)
+        self.aio = SimpleNamespace(models=_RecordingAsyncModels(inner.aio.models, store))
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 재생·가짜 백엔드
+# ──────────────────────────────────────────────────────────────────────────────
+class LatencyModel:
+    """지연 분포 (초). spec: fixed:S | uniform:A,B | lognormal:MEDIAN,SIGMA | recorded[:기본 spec]."""
+
+    def __init__(self, spec: str = "lognormal:1.5,0.4"):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        self.kind = kind.strip().lower()
+        self.use_recorded = self.kind == "recorded"
+        if self.use_recorded:
+            self._fallback = LatencyModel(args or "lognormal:1.5,0.4")
+            return
+        try:
+            self.args = [float(a) for a in args.split(",") if a.strip()]
+        except ValueError:
+            self.args = []
+        if self.kind not in ("fixed", "uniform", "lognormal") or not self.args:
+            sys.stderr.write(f"[Gemini 가짜] 지연 설정 해석 불가 {spec!r} → lognormal:1.5,0.4\n")
+            self.kind, self.args = "lognormal", [1.5, 0.4]
+
+    def sample(self, rng, recorded_ms=None) -> float:
+        if self.use_recorded:
+            return recorded_ms / 1000.0 if recorded_ms is not None else self._fallback.sample(rng)
+        if self.kind == "fixed":
+            return max(0.0, self.args[0])
+        if self.kind == "uniform":
+            lo, hi = self.args[0], self.args[-1]
+            return rng.uniform(min(lo, hi), max(lo, hi))
+        median = self.args[0]
+        sigma = self.args[1] if len(self.args) > 1 else 0.4
+        return median * rng.lognormvariate(0.0, sigma)
+
+
+def parse_error_rates(spec: str) -> dict:
+    """"503=0.05,429=0.02,404=0.01" → {503: 0.05, ...}. 잘못된 항목은 무시."""
+    rates = {}
+    for part in (spec or "").split(","):
+        code, _, p = part.partition("=")
+        try:
+            rates[int(code)] = max(0.0, min(1.0, float(p)))
+        except ValueError:
+            if part.strip():
+                sys.stderr.write(f"[Gemini 가짜] 오류율 항목 무시: {part!r}\n")
+    return rates
+
+
+_SAMPLE_FOODS = ("흰쌀밥", "잡곡밥", "김치찌개", "된장찌개", "배추김치", "계란말이", "제육볶음", "시금치나물", "닭가슴살 샐러드", "떡볶이")
+_SAMPLE_SIGNALS = ("초록", "노랑", "빨강")
+_INT_RANGES = {
+    "gi": (30, 90), "carbs": (0, 70), "protein": (0, 30), "fat": (0, 25), "kcal": (30, 600),
+    "order": (1, 5), "total_carbs": (20, 150), "added_stress": (0, 20), "stress_score_change": (-5, 15),
+}
+_FAKE_ADVICE = (
+    "1. 메뉴 확인\n가짜 백엔드 응답입니다. 채소 반찬이 있어 좋아요.\n\n"
+    "2. 장소별 팁\n밥은 반 공기만 먼저 덜어 드세요.\n\n"
+    "3. 먹는 순서\n나물 → 단백질 → 밥 순서로 드세요.\n\n"
+    "4. 추가 메모\n식후 10분 걷기를 추천해요."
+)
+
+
+def _schema_value(schema, name, rng):
+    """gtypes.Schema → 스키마에 맞는 그럴듯한 값 (필드 이름으로 범위를 고름)."""
+    t = getattr(schema, "type", None)
+    t = str(getattr(t, "value", t) or "").upper()
+    if t == "OBJECT":
+        props = getattr(schema, "properties", None) or {}
+        return {k: _schema_value(v, k, rng) for k, v in props.items()}
+    if t == "ARRAY":
+        return [_schema_value(schema.items, name, rng) for _ in range(rng.randint(2, 4))]
+    if t == "INTEGER":
+        lo, hi = _INT_RANGES.get(name, (0, 50))
+        return rng.randint(lo, hi)
+    if t == "NUMBER":
+        return rng.choice((0.5, 1.0, 1.0, 1.5)) if name == "portion" else round(rng.uniform(0, 10), 1)
+    if t == "BOOLEAN":
+        return rng.random() < 0.5
+    if name == "name":
+        return rng.choice(_SAMPLE_FOODS)
+    if name == "signal":
+        return rng.choice(_SAMPLE_SIGNALS)
+    if name == "menu_name":
+        return " · ".join(rng.sample(_SAMPLE_FOODS, 2))
+    return f"[가짜 응답] {name}"
+
+
+def _fake_response(text, usage, parsed=None):
+    return SimpleNamespace(
+        text=text,
+        parsed=parsed,
+        usage_metadata=SimpleNamespace(**usage) if usage else None,
+    )
+
+
+class FakeClient:
+    """
+    재생·가짜 백엔드. store 가 있으면 지문이 같은 녹화 응답(오류 포함)을 재생하고, 없으면 가짜 응답을 만든다.
+    매 호출 지연은 latency 분포에서 뽑고, error_rates 확률로 503·429·404 등을 낸다.
+    """
+
+    def __init__(self, store: RecordingStore = None, latency: LatencyModel = None, error_rates: dict = None,
+                 missing_models=(), seed=None):
+        self.backend = "replay" if store is not None else "fake"
+        self.store = store
+        self.latency = latency or LatencyModel()
+        self.error_rates = dict(error_rates or {})
+        self.missing_models = frozenset(missing_models)
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"calls": 0, "replay_hits": 0, "replay_misses": 0, "injected_errors": 0}
+        self.models = _FakeModels(self)
+        self.aio = SimpleNamespace(models=_FakeAsyncModels(self))
+
+    def _count(self, key) -> None:
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {"backend": self.backend, "latency": self.latency.spec, "error_rates": self.error_rates, **self._stats}
+
+    def plan(self, model, contents, config):
+        """호출 하나의 결과를 정한다 → (지연 초, 오류 또는 None, 텍스트 조각 목록, usage dict)."""
+        self._count("calls")
+        rec = None
+        if self.store is not None:
+            rec = self.store.load(request_fingerprint(model, contents, config))
+            self._count("replay_hits" if rec else "replay_misses")
+        with self._rng_lock:
+            delay = self.latency.sample(self._rng, (rec or {}).get("latency_ms"))
+            if model in self.missing_models:
+                return delay, FakeGeminiError(404, f"models/{model} is not found"), None, None
+            for code, p in self.error_rates.items():
+                if p and self._rng.random() < p:
+                    self._count("injected_errors")
+                    return delay, FakeGeminiError(code), None, None
+            if rec and rec.get("error"):
+                err = rec["error"]
+                return delay, FakeGeminiError(err.get("code") or 500, err.get("message") or "", err.get("status")), None, None
+            if rec and rec.get("text") is not None:
+                return delay, None, rec.get("chunks") or [rec["text"]], rec.get("usage")
+            schema = getattr(config, "response_schema", None) if config is not None else None
+            text = json.dumps(_schema_value(schema, "", self._rng), ensure_ascii=False) if schema is not None else _FAKE_ADVICE
+        usage = {
+            "prompt_token_count": _prompt_chars(contents) // 2 + _count_images(contents) * _FAKE_IMAGE_TOKENS,
+            "candidates_token_count": len(text) // 2,
+        }
+        # 스트리밍용 조각: 문단 단위
+        pieces = [p + "\n\n" for p in text.split("\n\n")] if schema is None else [text]
+        return delay, None, pieces, usage
+
+
+class _FakeModels:
+    def __init__(self, client: FakeClient):
+        self._client = client
+
+    def generate_content(self, *, model, contents, config=None):
+        delay, err, pieces, usage = self._client.plan(model, contents, config)
+        time.sleep(delay)
+        if err is not None:
+            raise err
+        return _fake_response("".join(pieces), usage)
+
+    def generate_content_stream(self, *, model, contents, config=None):
+        delay, err, pieces, usage = self._client.plan(model, contents, config)
+        # 첫 조각까지 지연의 절반, 나머지는 조각마다 나눠 흘린다
+        time.sleep(delay / 2)
+        if err is not None:
+            raise err
+        step = delay / 2 / max(1, len(pieces))
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(step)
+            yield _fake_response(piece, usage if i == len(pieces) - 1 else None)
+
+
+class _FakeAsyncModels:
+    def __init__(self, client: FakeClient):
+        self._client = client
+
+    async def generate_content(self, *, model, contents, config=None):
+        delay, err, pieces, usage = self._client.plan(model, contents, config)
+        await asyncio.sleep(delay)
+        if err is not None:
+            raise err
+        return _fake_response("".join(pieces), usage)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 백엔드 선택
+# ──────────────────────────────────────────────────────────────────────────────
+def backend_mode() -> str:
+    if _BACKEND not in BACKEND_MODES:
+        return "real"
+    return _BACKEND
+
+
+def create_gemini_client(api_key: str):
+    """NUTRISORT_GEMINI_BACKEND 에 맞는 클라이언트를 새로 만든다 (풀 관리는 gemini_client)."""
+    if _BACKEND not in BACKEND_MODES:
+        sys.stderr.write(f"[Gemini 백엔드] 알 수 없는 값 {_BACKEND!r} → real\n")
+    mode = backend_mode()
+    if mode == "real":
+        return genai.Client(api_key=api_key)
+    if mode == "record":
+        return RecordingClient(genai.Client(api_key=api_key), RecordingStore(_RECORD_DIR))
+    return FakeClient(
+        store=RecordingStore(_RECORD_DIR) if mode == "replay" else None,
+        latency=LatencyModel(_LATENCY_SPEC),
+        error_rates=parse_error_rates(_ERROR_SPEC),
+        missing_models=_MISSING_MODELS,
+    )
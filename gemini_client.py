@@ -0,0 +1,704 @@
+# -*- coding: utf-8 -*-
+"""
+NutriSort AI - Gemini 클라이언트 공용 레지스트리.
+
+genai.Client 를 호출마다 새로 만들면 HTTP 커넥션 풀·TLS 세션이 매번 버려진다.
+이 모듈은 프로세스 전역에서 (API 키, 모델 계열)별로 클라이언트 하나를 재사용한다.
+Streamlit 은 app.py 를 rerun 마다 다시 실행하지만 import 된 모듈은 sys.modules 에 남으므로
+여기 보관한 클라이언트는 세션·rerun 을 넘어 유지된다. (st.cache_resource.clear() 영향도 받지 않음)
+
+모델 후보(GEMINI_*_MODEL → gemini-2.5-flash → gemini-2.0-flash)의 상태도 여기서 공유한다.
+NOT_FOUND·503·429 결과를 TTL 동안 기억하는 서킷 브레이커로, 다음 요청은 건강한 후보부터 시도한다.
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import io
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+from google.genai import types as gtypes  # 패키지: google-genai (구 google-generativeai 아님)
+
+from gemini_backends import backend_mode, create_gemini_client
+from gemini_metrics import note_gemini_retry, record_gemini_call
+from gemini_quota import GEMINI_LIMITER, deadline_remaining, request_deadline
+
+# 모델 계열: 텍스트(식전·식후 인사이트) / 비전(메뉴명·스캐너 분석)
+CLIENT_FAMILIES = ("text", "vision")
+
+_registry_lock = threading.Lock()
+_clients = {}
+_stats = {}
+
+
+def _key_fingerprint(api_key: str) -> str:
+    """통계·로그에 API 키 원문이 남지 않도록 짧은 지문만 사용."""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:8]
+
+
+def get_gemini_client(api_key: str, family: str = "text"):
+    """
+    (api_key, family) 별로 공유되는 클라이언트 반환. 없으면 한 번만 생성 (스레드 안전).
+    기본은 genai.Client, NUTRISORT_GEMINI_BACKEND 로 녹화·재생·가짜 백엔드를 쓸 수 있다 (gemini_backends).
+    """
+    if not api_key:
+        raise RuntimeError("GEMINI_API_KEY가 설정되어 있지 않습니다.")
+    if family not in CLIENT_FAMILIES:
+        family = "text"
+    key = (_key_fingerprint(api_key), family)
+    with _registry_lock:
+        client = _clients.get(key)
+        st_row = _stats.setdefault(
+            key, {"created_at": None, "acquires": 0, "reuses": 0, "last_used": None}
+        )
+        if client is None:
+            client = create_gemini_client(api_key)
+            _clients[key] = client
+            st_row["created_at"] = time.time()
+            sys.stderr.write(f"[Gemini 풀] 클라이언트 생성 key={key[0]} family={family} backend={backend_mode()}\n")
+        else:
+            st_row["reuses"] += 1
+        st_row["acquires"] += 1
+        st_row["last_used"] = time.time()
+        return client
+
+
+def client_pool_stats() -> list:
+    """풀 사용 현황: [{key, family, backend, acquires, reuses, reuse_ratio, created_at, last_used}, ...]."""
+    with _registry_lock:
+        rows = []
+        for (fp, family), row in _stats.items():
+            acq = row["acquires"] or 0
+            client = _clients.get((fp, family))
+            rows.append(
+                {
+                    "key": fp,
+                    "family": family,
+                    "backend": getattr(client, "backend", "real"),
+                    # 재생·가짜 백엔드: 호출·재생 적중·주입 오류 수
+                    "backend_stats": client.stats() if hasattr(client, "stats") else None,
+                    "acquires": acq,
+                    "reuses": row["reuses"],
+                    "reuse_ratio": round(row["reuses"] / acq, 3) if acq else 0.0,
+                    "created_at": row["created_at"],
+                    "last_used": row["last_used"],
+                }
+            )
+        return rows
+
+
+def reset_client_pool() -> None:
+    """API 키 교체 등으로 풀을 비워야 할 때 사용. 다음 호출에서 새로 생성된다."""
+    with _registry_lock:
+        _clients.clear()
+        _stats.clear()
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 이미지 페이로드: 이미지당 한 번만 인코딩한 types.Part 를 모든 요청에서 재사용
+# ──────────────────────────────────────────────────────────────────────────────
+# 표시용 인코딩(image_pipeline) 등이 이미 만든 JPEG 바이트를 PIL Image.info 에 남겨 두는 키 (재인코딩 생략용)
+ENCODED_JPEG_INFO_KEY = "nutrisort_encoded_jpeg"
+_PARTS_INFO_KEY = "nutrisort_gemini_parts"
+_IMAGE_MIME = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+def image_part(img, encoding: str = "JPEG", quality: int = 85):
+    """
+    PIL 이미지 또는 이미 인코딩된 바이트 → types.Part.from_bytes.
+    PIL 이미지를 그대로 넘기면 SDK 가 요청마다 (때로는 PNG 로) 다시 직렬화하므로,
+    여기서 한 번만 인코딩하고 결과 Part 를 이미지 객체에 보관해 재시도·병렬 호출에서 재사용한다.
+    표시용·모델 입력 이미지처럼 JPEG 바이트가 이미 있으면 재인코딩 없이 그대로 사용.
+    """
+    encoding = (encoding or "JPEG").upper()
+    mime = _IMAGE_MIME.get(encoding, "image/jpeg")
+    if isinstance(img, (bytes, bytearray, memoryview)):
+        return gtypes.Part.from_bytes(data=bytes(img), mime_type=mime)
+    info = getattr(img, "info", None)
+    memo_key = (encoding, int(quality))
+    if isinstance(info, dict):
+        cached = (info.get(_PARTS_INFO_KEY) or {}).get(memo_key)
+        if cached is not None:
+            return cached
+    data = info.get(ENCODED_JPEG_INFO_KEY) if (isinstance(info, dict) and encoding == "JPEG") else None
+    if not data:
+        im = img
+        if encoding == "JPEG" and im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+        buf = io.BytesIO()
+        save_kw = {"quality": int(quality)} if encoding in ("JPEG", "WEBP") else {}
+        im.save(buf, format=encoding, **save_kw)
+        data = buf.getvalue()
+    part = gtypes.Part.from_bytes(data=data, mime_type=mime)
+    if isinstance(info, dict):
+        info.setdefault(_PARTS_INFO_KEY, {})[memo_key] = part
+    return part
+
+
+def payload_image_bytes(contents) -> int:
+    """요청 contents 중 인라인 이미지 바이트 합계 (로그·계측용)."""
+    total = 0
+    for c in contents or []:
+        inline = getattr(c, "inline_data", None)
+        data = getattr(inline, "data", None)
+        if data:
+            total += len(data)
+    return total
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 모델 가용성 레지스트리 (서킷 브레이커: closed → open → half_open → closed)
+# ──────────────────────────────────────────────────────────────────────────────
+DEFAULT_MODEL_FALLBACKS = ("gemini-2.5-flash", "gemini-2.0-flash")
+
+# 오류 종류별 서킷 open 유지 시간(초)과 open 전환에 필요한 연속 실패 횟수
+_OPEN_TTL_SEC = {"not_found": 6 * 3600, "unavailable": 30, "rate_limited": 60}
+_OPEN_THRESHOLD = {"not_found": 1, "unavailable": 2, "rate_limited": 1}
+_MAX_OPEN_TTL_SEC = 6 * 3600
+_HALF_OPEN_PROBE_TIMEOUT_SEC = 60
+_LATENCY_WINDOW = 50
+
+
+def _error_status_code(exc):
+    """google-genai APIError 의 구조화된 code 를 우선 사용. 없으면 None."""
+    for attr in ("code", "status_code"):
+        v = getattr(exc, attr, None)
+        if isinstance(v, int):
+            return v
+    resp = getattr(exc, "response", None)
+    v = getattr(resp, "status_code", None)
+    return v if isinstance(v, int) else None
+
+
+def classify_gemini_error(exc):
+    """예외 → "not_found" | "unavailable" | "rate_limited" | None (그 외 오류)."""
+    code = _error_status_code(exc)
+    status = str(getattr(exc, "status", "") or "").upper()
+    if code == 404 or status == "NOT_FOUND":
+        return "not_found"
+    if code == 429 or status == "RESOURCE_EXHAUSTED":
+        return "rate_limited"
+    if code in (500, 502, 503, 504) or status in ("UNAVAILABLE", "INTERNAL", "DEADLINE_EXCEEDED"):
+        return "unavailable"
+    if code is not None:
+        return None
+    # 구조화된 코드가 없는 예외(구버전 SDK·래핑된 예외)만 문자열로 판별
+    es = str(exc)
+    low = es.lower()
+    if "NOT_FOUND" in es or "not found" in low or "not supported" in low:
+        return "not_found"
+    if "429" in es or "RESOURCE_EXHAUSTED" in es:
+        return "rate_limited"
+    if "503" in es or "UNAVAILABLE" in es or "overloaded" in low:
+        return "unavailable"
+    return None
+
+
+def retry_after_seconds(exc):
+    """서버가 알려준 재시도 대기(초): HTTP Retry-After 헤더 또는 google.rpc.RetryInfo.retryDelay. 없으면 None."""
+    resp = getattr(exc, "response", None)
+    headers = getattr(resp, "headers", None)
+    if headers:
+        try:
+            v = headers.get("retry-after") or headers.get("Retry-After")
+            if v:
+                return max(0.0, float(v))
+        except (TypeError, ValueError, AttributeError):
+            pass
+    details = getattr(exc, "details", None)
+    m = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", str(details or exc))
+    if m:
+        return float(m.group(1))
+    return None
+
+
+class GeminiModelProbeBusy(RuntimeError):
+    """half_open 모델의 탐색 요청이 이미 진행 중이라 이 호출은 보내지 않음 (과부하로 분류되어 다음 후보로 폴백)."""
+
+    status = "UNAVAILABLE"
+
+
+def should_try_next_model(exc) -> bool:
+    """모델 미존재·과부하·쿼터 초과는 다음 후보 모델로 폴백할 가치가 있다."""
+    return classify_gemini_error(exc) is not None
+
+
+class RetryPolicy:
+    """
+    Gemini 호출 재시도 정책: 지수 백오프 + full jitter, Retry-After 존중, 전체 마감 시간(deadline) 예산.
+    재시도 대상은 구조화된 상태 코드로 분류한 과부하(5xx)·쿼터 초과(429)뿐이며,
+    다음 대기가 마감 시간을 넘기면 기다리지 않고 바로 마지막 오류를 올린다.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=8.0, deadline_sec=40.0,
+                 retry_on=("unavailable", "rate_limited")):
+        self.max_attempts = int(max_attempts)
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.deadline_sec = float(deadline_sec)
+        self.retry_on = tuple(retry_on)
+
+    def is_retryable(self, exc) -> bool:
+        return classify_gemini_error(exc) in self.retry_on
+
+    def delay_for(self, attempt: int, exc, elapsed: float):
+        """attempt(0부터)번째 시도가 exc 로 실패했을 때 대기할 초. 더 시도하지 않아야 하면 None."""
+        if attempt + 1 >= self.max_attempts or not self.is_retryable(exc):
+            return None
+        delay = random.uniform(0.0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        hinted = retry_after_seconds(exc)
+        if hinted is not None:
+            delay = max(delay, hinted)
+        if elapsed + delay >= self.deadline_sec:
+            return None
+        return delay
+
+    def call(self, fn):
+        """fn() 을 정책에 따라 재시도하며 실행. 마지막 오류는 그대로 올린다. 마감 시간은 쿼터 대기에도 적용."""
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                with request_deadline(self.deadline_sec - (time.monotonic() - started)):
+                    return fn()
+            except Exception as e:
+                delay = self.delay_for(attempt, e, time.monotonic() - started)
+                if delay is None:
+                    raise
+                sys.stderr.write(
+                    f"[Gemini 재시도] {attempt + 1}회 실패({classify_gemini_error(e)}) → {delay:.1f}초 후 재시도\n"
+                )
+                note_gemini_retry()
+                time.sleep(delay)
+                attempt += 1
+
+    async def call_async(self, fn):
+        """call() 의 asyncio 판: fn() 은 코루틴 함수, 대기는 asyncio.sleep (이벤트 루프를 막지 않음)."""
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                with request_deadline(self.deadline_sec - (time.monotonic() - started)):
+                    return await fn()
+            except Exception as e:
+                delay = self.delay_for(attempt, e, time.monotonic() - started)
+                if delay is None:
+                    raise
+                note_gemini_retry()
+                await asyncio.sleep(delay)
+                attempt += 1
+
+
+# 대화형(사용자가 기다리는) 호출 / 백그라운드 멘트 생성 호출용 기본 정책
+INTERACTIVE_RETRY = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=6.0, deadline_sec=40.0)
+BACKGROUND_RETRY = RetryPolicy(max_attempts=2, base_delay=0.5, max_delay=2.0, deadline_sec=6.0)
+
+
+class ModelHealthRegistry:
+    """모델별 서킷 상태·연속 실패·최근 지연시간을 보관하는 프로세스 공용 레지스트리 (스레드 안전)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def _row(self, model):
+        row = self._models.get(model)
+        if row is None:
+            row = {
+                "state": "closed",
+                "open_until": 0.0,
+                "open_ttl": 0.0,
+                "last_error": None,
+                "consecutive_failures": 0,
+                "probe_started": 0.0,
+                "successes": 0,
+                "failures": 0,
+                "latencies": deque(maxlen=_LATENCY_WINDOW),
+            }
+            self._models[model] = row
+        return row
+
+    def _refresh(self, row, now):
+        if row["state"] == "open" and now >= row["open_until"]:
+            row["state"] = "half_open"
+            row["probe_started"] = 0.0
+
+    def _available(self, row, now):
+        self._refresh(row, now)
+        if row["state"] == "closed":
+            return True
+        if row["state"] == "half_open":
+            # half_open 에서는 한 번에 하나의 탐색 요청만 통과
+            return not row["probe_started"] or now - row["probe_started"] > _HALF_OPEN_PROBE_TIMEOUT_SEC
+        return False
+
+    def ordered(self, candidates):
+        """사용 가능한 후보를 건강한 순서로 반환. 전부 open 이면 가장 먼저 풀리는 하나만 반환."""
+        now = time.time()
+        with self._lock:
+            ranked = []
+            for idx, mm in enumerate(candidates):
+                row = self._row(mm)
+                if not self._available(row, now):
+                    continue
+                rank = 0 if row["state"] == "closed" else 2
+                if rank == 0 and row["consecutive_failures"]:
+                    rank = 1  # 최근 실패가 있었던 closed 모델은 뒤로
+                ranked.append((rank, idx, mm))
+            if ranked:
+                return [mm for _r, _i, mm in sorted(ranked)]
+            if not candidates:
+                return []
+            soonest = min(candidates, key=lambda m: self._models[m]["open_until"])
+            return [soonest]
+
+    def begin(self, model) -> bool:
+        """
+        호출 직전: half_open 모델이면 탐색 요청 자리를 확인하고 차지하는 것을 한 번의 잠금 안에서 한다.
+        탐색 요청이면 True (끝나면 end 로 자리 반납). 다른 탐색이 진행 중이면 GeminiModelProbeBusy.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._row(model)
+            self._refresh(row, now)
+            if row["state"] != "half_open":
+                return False
+            if not self._available(row, now):
+                raise GeminiModelProbeBusy(f"{model} 탐색 요청이 진행 중입니다 (half_open)")
+            row["probe_started"] = now
+            return True
+
+    def end(self, model, probe: bool) -> None:
+        """호출 종료: begin 이 탐색 요청으로 표시했으면 자리를 반납 (성공·실패 기록 없이 끝난 경우 포함)."""
+        if not probe:
+            return
+        with self._lock:
+            row = self._row(model)
+            if row["state"] == "half_open":
+                row["probe_started"] = 0.0
+
+    def record_success(self, model, latency_sec):
+        with self._lock:
+            row = self._row(model)
+            row["state"] = "closed"
+            row["open_until"] = 0.0
+            row["open_ttl"] = 0.0
+            row["consecutive_failures"] = 0
+            row["probe_started"] = 0.0
+            row["successes"] += 1
+            row["latencies"].append(float(latency_sec))
+
+    def record_failure(self, model, exc, retry_after=None):
+        """오류 종류에 따라 서킷을 연다. 분류되지 않는 오류(파싱·요청 오류)는 상태에 반영하지 않는다."""
+        kind = classify_gemini_error(exc)
+        if kind is None:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._row(model)
+            row["failures"] += 1
+            row["consecutive_failures"] += 1
+            row["last_error"] = kind
+            row["probe_started"] = 0.0
+            was_half_open = row["state"] == "half_open"
+            if was_half_open or row["consecutive_failures"] >= _OPEN_THRESHOLD[kind]:
+                ttl = _OPEN_TTL_SEC[kind]
+                if retry_after:
+                    ttl = max(ttl, float(retry_after))
+                if was_half_open and row["open_ttl"]:
+                    # 탐색 실패: 직전 TTL 의 두 배로 다시 open
+                    ttl = max(ttl, row["open_ttl"] * 2)
+                ttl = min(ttl, _MAX_OPEN_TTL_SEC)
+                row["state"] = "open"
+                row["open_ttl"] = ttl
+                row["open_until"] = now + ttl
+                sys.stderr.write(f"[Gemini 모델] {model} 서킷 open ({kind}, {int(ttl)}초)\n")
+        return kind
+
+    def under_pressure(self, model) -> bool:
+        """서킷이 닫혀 있지 않거나 직전 호출이 과부하·쿼터 초과로 실패한 모델 (추측 호출을 삼갈 때)."""
+        with self._lock:
+            row = self._row(model)
+            self._refresh(row, time.time())
+            if row["state"] != "closed":
+                return True
+            return bool(row["consecutive_failures"]) and row["last_error"] in ("unavailable", "rate_limited")
+
+    def snapshot(self) -> list:
+        """관리자 확인용: 모델별 상태·성공/실패 수·지연시간(p50/p95, 초)."""
+        now = time.time()
+        out = []
+        with self._lock:
+            for mm, row in self._models.items():
+                self._refresh(row, now)
+                lat = sorted(row["latencies"])
+                out.append(
+                    {
+                        "model": mm,
+                        "state": row["state"],
+                        "open_for_sec": max(0, int(row["open_until"] - now)) if row["state"] == "open" else 0,
+                        "last_error": row["last_error"],
+                        "successes": row["successes"],
+                        "failures": row["failures"],
+                        "latency_p50": round(lat[len(lat) // 2], 3) if lat else None,
+                        "latency_p95": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 3) if lat else None,
+                    }
+                )
+        return out
+
+
+MODEL_HEALTH = ModelHealthRegistry()
+
+
+def configured_models(env_var: str) -> list:
+    """설정 순서 그대로의 후보: 환경변수 모델(있으면) → 기본 폴백 (중복 제거)."""
+    candidates = []
+    _env = os.environ.get(env_var, "").strip()
+    if _env:
+        candidates.append(_env)
+    for _m in DEFAULT_MODEL_FALLBACKS:
+        if _m not in candidates:
+            candidates.append(_m)
+    return candidates
+
+
+def preferred_model(env_var: str) -> str:
+    """설정상 1순위 모델 (캐시 키 등 '어떤 모델 설정의 결과인가'를 구분할 때 사용)."""
+    return configured_models(env_var)[0]
+
+
+def model_fallback_chain(env_var: str) -> list:
+    """설정된 후보를 레지스트리 상태 기준으로 정렬해 반환."""
+    return MODEL_HEALTH.ordered(configured_models(env_var))
+
+
+# 마감이 거의 남지 않았어도 HTTP 요청에 주는 최소 타임아웃 (ms)
+_MIN_HTTP_TIMEOUT_MS = 1000
+
+
+def _config_with_deadline(config):
+    """request_deadline 안이면 남은 시간을 요청별 HTTP 타임아웃으로 건다 (응답이 늦어도 워커 스레드가 풀려나도록)."""
+    left = deadline_remaining()
+    if left is None:
+        return config
+    http_options = gtypes.HttpOptions(timeout=max(_MIN_HTTP_TIMEOUT_MS, int(left * 1000)))
+    if config is None:
+        return gtypes.GenerateContentConfig(http_options=http_options)
+    if getattr(config, "http_options", None) is not None:
+        return config
+    return config.model_copy(update={"http_options": http_options})
+
+
+def gemini_generate(client, *, model, contents, config=None):
+    """
+    client.models.generate_content 래퍼: 모델 상태 레지스트리에 지연시간·실패를 기록하고,
+    호출 계측(벽시계 시간·토큰 수·이미지 바이트·오류 종류)을 gemini_metrics 에 남긴다.
+    호출 전에 공용 쿼터(GEMINI_LIMITER)에서 우선순위 순서로 입장하고, 마감(request_deadline)이 있으면
+    남은 시간을 HTTP 타임아웃으로 건다.
+    """
+    _quota_wait = GEMINI_LIMITER.acquire()
+    config = _config_with_deadline(config)
+    _probe = MODEL_HEALTH.begin(model)
+    _img_bytes = payload_image_bytes(contents)
+    if _img_bytes:
+        sys.stderr.write(f"[Gemini 요청] model={model} image_bytes={_img_bytes}\n")
+    t0 = time.monotonic()
+    try:
+        if config is None:
+            response = client.models.generate_content(model=model, contents=contents)
+        else:
+            response = client.models.generate_content(model=model, contents=contents, config=config)
+    except Exception as e:
+        MODEL_HEALTH.record_failure(model, e, retry_after=retry_after_seconds(e))
+        record_gemini_call(model, time.monotonic() - t0, image_bytes=_img_bytes, error_kind=classify_gemini_error(e) or "error",
+                           quota_wait_sec=_quota_wait)
+        raise
+    finally:
+        MODEL_HEALTH.end(model, _probe)
+    elapsed = time.monotonic() - t0
+    MODEL_HEALTH.record_success(model, elapsed)
+    record_gemini_call(model, elapsed, response=response, image_bytes=_img_bytes, quota_wait_sec=_quota_wait)
+    return response
+
+
+async def gemini_generate_async(client, *, model, contents, config=None):
+    """client.aio.models.generate_content 래퍼 (오프라인 배치용). 상태·계측 기록은 gemini_generate 와 같다."""
+    # 쿼터 대기는 블로킹이므로 스레드에서 (이벤트 루프를 막지 않음)
+    _quota_wait = await asyncio.to_thread(GEMINI_LIMITER.acquire) if GEMINI_LIMITER.enabled else 0.0
+    config = _config_with_deadline(config)
+    _probe = MODEL_HEALTH.begin(model)
+    _img_bytes = payload_image_bytes(contents)
+    t0 = time.monotonic()
+    try:
+        if config is None:
+            response = await client.aio.models.generate_content(model=model, contents=contents)
+        else:
+            response = await client.aio.models.generate_content(model=model, contents=contents, config=config)
+    except Exception as e:
+        MODEL_HEALTH.record_failure(model, e, retry_after=retry_after_seconds(e))
+        record_gemini_call(model, time.monotonic() - t0, image_bytes=_img_bytes, error_kind=classify_gemini_error(e) or "error",
+                           quota_wait_sec=_quota_wait)
+        raise
+    finally:
+        MODEL_HEALTH.end(model, _probe)
+    elapsed = time.monotonic() - t0
+    MODEL_HEALTH.record_success(model, elapsed)
+    record_gemini_call(model, elapsed, response=response, image_bytes=_img_bytes, quota_wait_sec=_quota_wait)
+    return response
+
+
+def gemini_generate_stream(client, *, model, contents, config=None):
+    """
+    client.models.generate_content_stream 래퍼 (제너레이터): 텍스트 조각을 순서대로 yield.
+    전체 응답을 다 받은 시점의 지연시간을 모델 상태 레지스트리에 기록한다.
+    토큰 수는 usage_metadata 가 실린 마지막 조각 기준으로 계측한다.
+    """
+    _quota_wait = GEMINI_LIMITER.acquire()
+    _probe = MODEL_HEALTH.begin(model)
+    _img_bytes = payload_image_bytes(contents)
+    if _img_bytes:
+        sys.stderr.write(f"[Gemini 요청] model={model} image_bytes={_img_bytes} (stream)\n")
+    t0 = time.monotonic()
+    last_chunk = None
+    try:
+        if config is None:
+            stream = client.models.generate_content_stream(model=model, contents=contents)
+        else:
+            stream = client.models.generate_content_stream(model=model, contents=contents, config=config)
+        for chunk in stream:
+            if getattr(chunk, "usage_metadata", None) is not None:
+                last_chunk = chunk
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
+    except Exception as e:
+        MODEL_HEALTH.record_failure(model, e, retry_after=retry_after_seconds(e))
+        record_gemini_call(
+            model, time.monotonic() - t0, response=last_chunk, image_bytes=_img_bytes,
+            error_kind=classify_gemini_error(e) or "error", stream=True, quota_wait_sec=_quota_wait,
+        )
+        raise
+    finally:
+        MODEL_HEALTH.end(model, _probe)
+    elapsed = time.monotonic() - t0
+    MODEL_HEALTH.record_success(model, elapsed)
+    record_gemini_call(model, elapsed, response=last_chunk, image_bytes=_img_bytes, stream=True,
+                       quota_wait_sec=_quota_wait)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 독립적인 Gemini 호출 병렬 실행 (스캐너: 음식 JSON + 소견을 동시에)
+# ──────────────────────────────────────────────────────────────────────────────
+_CALL_POOL = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("GEMINI_CALL_WORKERS", "16") or 16),
+    thread_name_prefix="gemini-call",
+)
+
+
+def run_gemini_calls_concurrently(calls: dict, deadline_sec: float) -> dict:
+    """
+    {이름: 인자 없는 callable} 을 공용 스레드 풀에서 동시에 실행하고 {이름: 결과} 반환.
+    모든 호출이 하나의 마감 시간(deadline_sec)을 공유한다. 하나라도 실패하면 나머지를 기다리지 않고
+    (dict 순서상 앞선) 예외를 그대로 올리고, 마감을 넘기면 TimeoutError.
+    callable 안에서는 st.session_state 에 접근하지 말 것 (스크립트 스레드 밖에서 실행됨).
+    """
+    # 호출자의 계측 작업(gemini_operation)이 워커 스레드에서도 이어지도록 컨텍스트를 복사해 실행
+    futures = {name: _CALL_POOL.submit(contextvars.copy_context().run, fn) for name, fn in calls.items()}
+    done, pending = wait(futures.values(), timeout=deadline_sec, return_when=FIRST_EXCEPTION)
+    for name, fut in futures.items():
+        if fut in done and fut.exception() is not None:
+            for p in pending:
+                p.cancel()
+            raise fut.exception()
+    if pending:
+        for p in pending:
+            p.cancel()
+        late = [name for name, fut in futures.items() if fut in pending]
+        raise TimeoutError(f"Gemini 응답 시간 초과 ({int(deadline_sec)}초): {', '.join(late)}")
+    return {name: fut.result() for name, fut in futures.items()}
+
+
+def submit_gemini_call(fn, deadline_sec: float = None):
+    """
+    인자 없는 callable 을 공용 스레드 풀에 제출하고 Future 반환 (결과를 기다리지 않는 비동기 호출용).
+    deadline_sec 를 주면 제출 시각부터 그 안에 쿼터 대기·재시도·HTTP 요청이 끝나도록 마감을 건다
+    (Future.cancel() 은 이미 실행 중인 호출을 멈추지 못하므로, 기다림을 포기할 호출은 마감으로 풀어 준다).
+    """
+    if deadline_sec is not None:
+        submitted = time.monotonic()
+        inner = fn
+
+        def fn():
+            with request_deadline(deadline_sec - (time.monotonic() - submitted)):
+                return inner()
+
+    return _CALL_POOL.submit(contextvars.copy_context().run, fn)
+
+
+class SpeculativeBudget:
+    """
+    추측 실행(사용자가 고르기 전에 미리 받아 두는) Gemini 호출 예산 (스레드 안전).
+    사용자별 하루 상한과 프로세스 전체 분당 상한을 넘거나, 우선 모델이 과부하·쿼터 초과 상태면 쓰지 않는다.
+    상한을 0 으로 두면 추측 호출을 끈다.
+    """
+
+    def __init__(self, per_owner_daily: int, global_per_minute: int):
+        self.per_owner_daily = int(per_owner_daily)
+        self.global_per_minute = int(global_per_minute)
+        self._lock = threading.Lock()
+        self._day = None
+        self._owner_used = {}
+        self._recent = deque()
+        self._counters = {"granted": 0, "denied": 0, "served": 0, "cancelled": 0, "unused": 0}
+
+    def try_acquire(self, owner, n: int = 1, env_var: str = "GEMINI_TEXT_MODEL") -> bool:
+        """n 건을 한꺼번에 허용하거나 전부 거절한다."""
+        if not owner or n <= 0:
+            return False
+        pressured = MODEL_HEALTH.under_pressure(preferred_model(env_var))
+        now = time.time()
+        today = time.strftime("%Y-%m-%d")
+        with self._lock:
+            if self._day != today:
+                self._day = today
+                self._owner_used.clear()
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            used = self._owner_used.get(owner, 0)
+            if (
+                pressured
+                or used + n > self.per_owner_daily
+                or len(self._recent) + n > self.global_per_minute
+            ):
+                self._counters["denied"] += 1
+                return False
+            self._owner_used[owner] = used + n
+            self._recent.extend([now] * n)
+            self._counters["granted"] += n
+            return True
+
+    def note(self, outcome: str, n: int = 1) -> None:
+        """추측 결과 기록: served(바로 제공) / cancelled(시작 전 취소) / unused(선택 안 됨, 끝나면 캐시에 남음)."""
+        with self._lock:
+            self._counters[outcome] = self._counters.get(outcome, 0) + n
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "per_owner_daily": self.per_owner_daily,
+                "global_per_minute": self.global_per_minute,
+                "owners_today": len(self._owner_used),
+                **self._counters,
+            }
+
+
+# 식전 인사이트 미리 받기 예산 (환경변수로 조정, 0 이면 끔)
+SPECULATIVE_BUDGET = SpeculativeBudget(
+    per_owner_daily=int(os.environ.get("NUTRISORT_PREFETCH_DAILY_PER_USER", "30") or 0),
+    global_per_minute=int(os.environ.get("NUTRISORT_PREFETCH_PER_MINUTE", "60") or 0),
+)
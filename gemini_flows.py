@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+"""
+NutriSort AI - Gemini 호출 흐름 (식전 인사이트·식후 피드백·메뉴명 추출·스캐너 비전 분석).
+
+각 흐름은 프롬프트·응답 스키마·후보 모델 폴백·재시도 정책·캐시·중복 호출 합치기·계측을 한 곳에서 정한다.
+Streamlit 에 의존하지 않으므로 앱(app.py)은 세션 상태·화면만 맡아 여기 함수를 부르고,
+부하 시험 스크립트(scripts/load_test_gemini.py)도 같은 함수를 그대로 호출한다.
+클라이언트는 호출부가 gemini_client.get_gemini_client 로 만들어 넘긴다 (API 키 조회는 호출부 몫).
+"""
+
+import copy
+import os
+import sys
+import threading
+import time
+
+from google.genai import types as gtypes  # 패키지: google-genai (구 google-generativeai 아님)
+
+from ai_cache import (
+    AI_SINGLE_FLIGHT,
+    get_vision_cache,
+    pre_meal_insights_cache,
+    pre_meal_insights_cache_key,
+    prompt_version,
+    vision_cache_key,
+)
+from food_analysis import build_order_comment, parse_food_analysis_json, score_food_items
+from gemini_client import (
+    BACKGROUND_RETRY,
+    INTERACTIVE_RETRY,
+    RetryPolicy,
+    gemini_generate,
+    gemini_generate_stream,
+    image_part,
+    model_fallback_chain,
+    preferred_model,
+    run_gemini_calls_concurrently,
+    should_try_next_model,
+)
+from gemini_metrics import gemini_operation, note_gemini_parse
+from gemini_quota import GEMINI_LIMITER, PriorityTicket, current_priority, gemini_priority, on_quota_wait
+from prompts import (
+    ADVICE_SECTION_KEYS,
+    POST_MEAL_FEEDBACK_SYSTEM_PROMPT,
+    PRE_MEAL_INSIGHTS_SYSTEM_PROMPT,
+    PRE_MEAL_MENU_NAME_VISION_PROMPT,
+    get_advice_section_titles,
+    get_analysis_prompt,
+    get_combined_analysis_prompt,
+    get_post_meal_feedback_user_prompt,
+    get_pre_meal_insights_user_prompt,
+    score_post_meal_glucose,
+)
+from response_schemas import (
+    COMBINED_ANALYSIS_SCHEMA,
+    FOOD_ANALYSIS_SCHEMA,
+    MENU_NAME_SCHEMA,
+    POST_MEAL_FEEDBACK_SCHEMA,
+    PRE_MEAL_INSIGHTS_SCHEMA,
+    ResponseSchemaError,
+    decode_response,
+)
+from vision_input import get_vision_input_profile
+
+# 스캐너 분석: 음식 JSON·소견 호출과 재시도 대기가 모두 함께 쓰는 마감 시간(초)
+VISION_ANALYSIS_DEADLINE_SEC = 60
+VISION_RETRY = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=6.0, deadline_sec=VISION_ANALYSIS_DEADLINE_SEC)
+
+# 스캐너 분석 방식: combined(이미지 1회 + response_schema 로 음식·소견 동시) | split(기존 2회 호출)
+#   | stream(음식 JSON 만 먼저 받고, 소견은 결과 화면에서 generate_content_stream 으로 흘려 표시)
+# combined 가 스키마 미지원 등 API 오류로 실패하면 같은 시도 안에서 split 으로 폴백한다 (응답 해석 실패는 폴백하지 않음).
+VISION_ANALYSIS_MODE = (os.environ.get("GEMINI_ANALYSIS_MODE", "combined").strip().lower() or "combined")
+
+
+class VisionParseError(ValueError):
+    """비전 응답을 음식 목록으로 해석하지 못함 (재시도하지 않고 사용자에게 다시 시도 안내)."""
+
+
+def decode_noting_parse(response, schema):
+    """공용 디코더로 응답을 검증하고 해석 성공 여부를 계측에 남긴다. 실패는 ResponseSchemaError 그대로."""
+    try:
+        out = decode_response(response, schema)
+    except ResponseSchemaError:
+        note_gemini_parse(False)
+        raise
+    note_gemini_parse(True)
+    return out
+
+
+# 진행 중인 합친 호출별 공유 우선순위 {(task, key): [PriorityTicket, 참여 호출자 수]}
+_flight_tickets = {}
+_flight_tickets_lock = threading.Lock()
+
+
+def _coalesced(task: str, key: str, fn, op_name: str, timeout: float, on_join=None):
+    """
+    AI_SINGLE_FLIGHT.do 에 우선순위 승계를 더한 것: 같은 호출을 기다리는 호출자들이 우선순위 표 하나를 공유해
+    미리 받기(speculative) 호출에 사용자 탭(insight)이 합류하면 아직 쿼터 대기 중인 그 호출의 순서를 올린다.
+    호출자 우선순위는 지정값(gemini_priority), 없으면 op_name 작업의 기본 클래스.
+    """
+    mine = current_priority(op_name)
+    fkey = (task, key)
+    with _flight_tickets_lock:
+        entry = _flight_tickets.get(fkey)
+        if entry is None:
+            entry = _flight_tickets[fkey] = [PriorityTicket(mine), 0]
+        entry[1] += 1
+    ticket = entry[0]
+    GEMINI_LIMITER.promote(ticket, mine)
+
+    def _leader():
+        with gemini_priority(ticket):
+            return fn()
+
+    try:
+        return AI_SINGLE_FLIGHT.do(task, key, _leader, timeout=timeout, on_join=on_join)
+    finally:
+        with _flight_tickets_lock:
+            entry[1] -= 1
+            if not entry[1] and _flight_tickets.get(fkey) is entry:
+                del _flight_tickets[fkey]
+
+
+def _generate_json_with_fallback(client, env_var, contents, schema, system_instruction=None):
+    """
+    한 번의 시도 = 후보 모델 전체 순회 후 스키마 디코드. 모델 상태 레지스트리 기준 정렬
+    (NOT_FOUND·과부하로 open 된 모델은 건너뜀). 스키마 강제 응답이라 해석 실패는 다른 모델을
+    다시 부르지 않고 ResponseSchemaError 로 올린다. 모두 과부하·쿼터 초과면 마지막 오류.
+    """
+    config = gtypes.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=schema.to_schema(),
+        system_instruction=system_instruction,
+    )
+    last_err = None
+    for mm in model_fallback_chain(env_var):
+        try:
+            response = gemini_generate(client, model=mm, contents=contents, config=config)
+        except Exception as e:
+            last_err = e
+            if should_try_next_model(e):
+                continue
+            raise
+        return decode_noting_parse(response, schema)
+    if last_err:
+        raise last_err
+    raise RuntimeError("사용 가능한 Gemini 모델이 없습니다.")
+
+
+def pre_meal_insights_key(menu: str, location: str, meal_slot: str, current_stress: float) -> str:
+    return pre_meal_insights_cache_key(
+        menu, location, meal_slot, current_stress,
+        prompt_version(PRE_MEAL_INSIGHTS_SYSTEM_PROMPT, preferred_model("GEMINI_TEXT_MODEL")),
+    )
+
+
+def generate_pre_meal_insights(client, menu: str, location: str, meal_slot: str, current_stress: float,
+                               use_cache: bool = True) -> dict:
+    """
+    텍스트 모델로 식전 인사이트 JSON 생성·파싱.
+    정규화 메뉴·장소·끼니·피로도 구간이 같은 요청은 프로세스 공용 캐시(TTL)에서 바로 반환
+    (use_cache=False 면 캐시를 읽지도 쓰지도 않음, 부하 시험용).
+    """
+    _cache_key = pre_meal_insights_key(menu, location, meal_slot, current_stress)
+    if use_cache:
+        _cached = pre_meal_insights_cache.get(_cache_key)
+        if _cached is not None:
+            return dict(_cached)
+    user_prompt = get_pre_meal_insights_user_prompt(menu, location, meal_slot, current_stress)
+
+    def _attempt():
+        out = _generate_json_with_fallback(
+            client, "GEMINI_TEXT_MODEL", [user_prompt], PRE_MEAL_INSIGHTS_SCHEMA,
+            system_instruction=PRE_MEAL_INSIGHTS_SYSTEM_PROMPT,
+        )
+        if use_cache:
+            pre_meal_insights_cache.set(_cache_key, dict(out))
+        return out
+
+    def _call():
+        with gemini_operation("pre_meal_insights"):
+            # 모두 과부하·쿼터 초과면 재시도 정책(백오프·마감 시간)에 맡김
+            return INTERACTIVE_RETRY.call(_attempt)
+
+    # 미리 받기·다른 세션의 같은 요청이 진행 중이면 그 결과를 함께 사용 (공유 dict 이므로 복사해서 반환)
+    return dict(
+        _coalesced("pre_meal_insights", _cache_key, _call, "pre_meal_insights", timeout=INTERACTIVE_RETRY.deadline_sec)
+    )
+
+
+def generate_post_meal_feedback(client, menu: str, glucose_value: int, meal_slot: str = "식사") -> dict:
+    """텍스트 모델로 식후 혈당 피드백 JSON 생성·파싱. 숫자 필드는 로컬 채점 값으로 덮어쓴다."""
+    user_prompt = get_post_meal_feedback_user_prompt(menu, glucose_value, meal_slot)
+
+    def _attempt():
+        out = _generate_json_with_fallback(
+            client, "GEMINI_TEXT_MODEL", [user_prompt], POST_MEAL_FEEDBACK_SCHEMA,
+            system_instruction=POST_MEAL_FEEDBACK_SYSTEM_PROMPT,
+        )
+        # 숫자 필드는 모델 값 대신 로컬 채점(프롬프트와 같은 구간표)을 사용
+        _score = score_post_meal_glucose(glucose_value)
+        out["stress_score_change"] = _score["stress_score_change"]
+        out["is_success"] = _score["is_success"]
+        return out
+
+    def _call():
+        with gemini_operation("post_meal_feedback"):
+            # 백그라운드 멘트 생성: 결과 다이얼로그의 대기 시간 안에서만 짧게 재시도
+            return BACKGROUND_RETRY.call(_attempt)
+
+    # 같은 메뉴·혈당·끼니 요청이 진행 중이면 (rerun·여러 탭) 그 결과를 함께 사용
+    _flight_key = prompt_version(POST_MEAL_FEEDBACK_SYSTEM_PROMPT, user_prompt, preferred_model("GEMINI_TEXT_MODEL"))
+    return dict(
+        _coalesced("post_meal_feedback", _flight_key, _call, "post_meal_feedback", timeout=BACKGROUND_RETRY.deadline_sec)
+    )
+
+
+def extract_menu_name_from_image(client, artifact, image_hash: str = None) -> str:
+    """
+    비전 모델로 음식 메뉴 짧은 문자열 추출. 같은 사진·프롬프트·모델 결과는 디스크 캐시에서 재사용.
+    image_hash 를 주면(재촬영 사진을 앞 사진에 묶은 대표 해시) 원본 해시 대신 캐시 키로 쓴다.
+    """
+    vision_profile = get_vision_input_profile()
+    _cache_key = vision_cache_key(
+        "menu",
+        image_hash or artifact.image_hash,
+        prompt_version(vision_profile.name, PRE_MEAL_MENU_NAME_VISION_PROMPT),
+        preferred_model("GEMINI_VISION_MODEL"),
+    )
+    _cached = get_vision_cache().get(_cache_key)
+    if _cached and _cached.get("menu_name"):
+        return _cached["menu_name"]
+    # 이미지는 입력 프로필로 한 번만 인코딩해 모든 후보·재시도에서 같은 Part 재사용
+    img_part = image_part(artifact.model_input(vision_profile))
+
+    def _attempt():
+        try:
+            name = _generate_json_with_fallback(
+                client, "GEMINI_VISION_MODEL", [PRE_MEAL_MENU_NAME_VISION_PROMPT, img_part], MENU_NAME_SCHEMA,
+            )["menu_name"]
+        except ResponseSchemaError as se:
+            raise RuntimeError("메뉴 이름을 인식하지 못했습니다.") from se
+        get_vision_cache().set(_cache_key, {"menu_name": name})
+        return name
+
+    def _call():
+        with gemini_operation("menu_name"):
+            return INTERACTIVE_RETRY.call(_attempt)
+
+    # 두 번 탭·rerun·여러 탭에서 같은 사진 요청이 겹치면 진행 중인 호출 하나를 함께 기다린다
+    return _coalesced("menu", _cache_key, _call, "menu_name", timeout=INTERACTIVE_RETRY.deadline_sec)
+
+
+def _vision_food_call(client, candidates, food_prompt, img):
+    """스캐너 음식 JSON 호출 (후보 모델 폴백). 원문 텍스트 반환. 스레드 풀에서 실행됨."""
+    last_model_err = ""
+    for mm in candidates:
+        try:
+            try:
+                response = gemini_generate(
+                    client,
+                    model=mm,
+                    contents=[food_prompt, img],
+                    config=gtypes.GenerateContentConfig(
+                        response_mime_type="application/json",
+                        response_schema=FOOD_ANALYSIS_SCHEMA.to_schema(),
+                    ),
+                )
+            except Exception as je:
+                if should_try_next_model(je):
+                    raise
+                response = gemini_generate(client, model=mm, contents=[food_prompt, img])
+            return (response.text or "").strip()
+        except Exception as me:
+            last_model_err = str(me)
+            # 모델 미지원/미존재·과부하는 다음 후보로 폴백
+            if should_try_next_model(me):
+                continue
+            raise
+    raise Exception(last_model_err or "No available Gemini multimodal model")
+
+
+def _vision_advice_call(client, candidates, advice_prompt, img):
+    """스캐너 소견(4단계 조언) 호출 (후보 모델 폴백). 파싱된 음식 목록이 필요 없어 음식 호출과 병렬 실행."""
+    last_model_err = ""
+    for mm in candidates:
+        try:
+            return gemini_generate(client, model=mm, contents=[advice_prompt, img]).text or ""
+        except Exception as me:
+            last_model_err = str(me)
+            if should_try_next_model(me):
+                continue
+            raise
+    raise Exception(last_model_err or "No available Gemini model (advice)")
+
+
+def stream_vision_advice(client, candidates, advice_prompt, img):
+    """
+    소견 스트리밍 제너레이터 (st.write_stream 용). 첫 조각을 받기 전의 모델 미존재·과부하만
+    다음 후보로 폴백하고, 이미 출력이 시작된 뒤의 오류는 그대로 올린다.
+    """
+    last_model_err = ""
+    for mm in candidates:
+        started = False
+        try:
+            for piece in gemini_generate_stream(client, model=mm, contents=[advice_prompt, img]):
+                started = True
+                yield piece
+            return
+        except Exception as me:
+            last_model_err = str(me)
+            if not started and should_try_next_model(me):
+                continue
+            raise
+    raise Exception(last_model_err or "No available Gemini model (advice)")
+
+
+def _format_combined_advice(advice, lang="KO"):
+    """advice 객체 → 기존 2회 호출 소견과 같은 "1. 제목\n본문" 형식 텍스트. 비어 있으면 ""."""
+    if not isinstance(advice, dict):
+        return ""
+    titles = get_advice_section_titles(lang)
+    parts = []
+    for idx, (key, title) in enumerate(zip(ADVICE_SECTION_KEYS, titles), start=1):
+        body = str(advice.get(key) or "").strip()
+        if body:
+            parts.append(f"{idx}. {title}\n{body}")
+    return "\n\n".join(parts)
+
+
+def _vision_combined_call(client, candidates, combined_prompt, img, lang="KO"):
+    """
+    단일 호출 비전 분석 (후보 모델 폴백). 성공 시 {"food": 검증된 응답 dict, "advice": 소견 텍스트}.
+    소견만 비어 있으면 advice=None (결과 화면에서 스트리밍), 음식 items 를 해석하지 못하면 VisionParseError.
+    """
+    last_model_err = ""
+    for mm in candidates:
+        try:
+            response = gemini_generate(
+                client,
+                model=mm,
+                contents=[combined_prompt, img],
+                config=gtypes.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    response_schema=COMBINED_ANALYSIS_SCHEMA.to_schema(),
+                ),
+            )
+        except Exception as me:
+            last_model_err = str(me)
+            if should_try_next_model(me):
+                continue
+            raise
+        # 스키마 강제 응답: 해석 실패로 다른 모델·split 호출을 다시 하지 않는다
+        try:
+            data = decode_noting_parse(response, COMBINED_ANALYSIS_SCHEMA)
+        except ResponseSchemaError as se:
+            raise VisionParseError(f"음식 분석 JSON 을 해석하지 못했습니다: {se}") from se
+        return {"food": data, "advice": _format_combined_advice(data["advice"], lang) or None}
+    raise Exception(last_model_err or "No available Gemini multimodal model")
+
+
+def run_vision_analysis(client, img, progress=None, use_cache: bool = True):
+    """
+    스캐너 비전 분석 전체: 캐시 조회 → (combined | stream | split) 호출·재시도 → 파싱 → 점수 계산.
+    img 는 image_pipeline.ImageArtifact. 백그라운드 작업 스레드에서 실행된다. 반환값은 current_analysis dict.
+    파싱 실패는 VisionParseError, 그 밖의 실패는 마지막 Gemini 오류를 그대로 올린다.
+    use_cache=False 면 디스크 캐시를 읽지도 쓰지도 않는다 (부하 시험용, 중복 호출 합치기는 유지).
+    """
+    progress = progress or (lambda *_a, **_k: None)
+    started = time.monotonic()
+
+    def _budget_left():
+        """분석 전체가 공유하는 마감 시간 중 남은 초 (재시도 대기 포함)."""
+        return max(1.0, VISION_ANALYSIS_DEADLINE_SEC - (time.monotonic() - started))
+
+    food_prompt, advice_prompt = get_analysis_prompt("KO")
+    combined_prompt = get_combined_analysis_prompt("KO")
+    # 음식·소견·재시도 모두 같은 인코딩 결과(Part)를 공유 (이미지 객체에 보관됨)
+    # 모델에는 표시용 이미지 대신 타일 크기에 맞춘 입력 프로필 이미지를 보낸다
+    vision_profile = get_vision_input_profile()
+    img_part = image_part(img.model_input(vision_profile))
+    # 같은 사진·프롬프트·모델·입력 프로필의 이전 분석 결과가 있으면 API 호출 없이 사용
+    cache_key = vision_cache_key(
+        "scan",
+        img.image_hash,
+        prompt_version(VISION_ANALYSIS_MODE, vision_profile.name, combined_prompt, food_prompt, advice_prompt),
+        preferred_model("GEMINI_VISION_MODEL"),
+    )
+    progress(0.05, "사진을 확인하고 있어요…")
+
+    def _attempt():
+        # Gemini 1.5 시리즈 폐기: gemini-2.5-flash → gemini-2.0-flash 만 사용 (google-genai SDK)
+        # 재시도마다 모델 상태 레지스트리 기준으로 다시 정렬 (직전 실패 모델은 뒤로/제외)
+        candidates = model_fallback_chain("GEMINI_VISION_MODEL")
+        progress(0.2, "AI가 음식을 분석하고 있어요…")
+        if VISION_ANALYSIS_MODE == "combined":
+            # 이미지 1회 업로드로 음식·소견을 한 번에 (response_schema)
+            try:
+                out = run_gemini_calls_concurrently(
+                    {"combined": lambda: _vision_combined_call(client, candidates, combined_prompt, img_part)},
+                    deadline_sec=_budget_left(),
+                )["combined"]
+            except Exception as ce:
+                # 과부하·쿼터 초과는 split 으로도 실패하므로 그대로 재시도 로직으로.
+                # 응답 해석 실패도 split 으로 다시 호출하지 않는다 (스키마 강제라 드묾)
+                if should_try_next_model(ce) or isinstance(ce, (TimeoutError, VisionParseError)):
+                    raise
+                sys.stderr.write(f"[비전 분석] combined 실패 → split 폴백: {ce}\n")
+                out = None
+            if out is not None:
+                return out
+        elif VISION_ANALYSIS_MODE == "stream":
+            # 음식 JSON 만 먼저 (구조화 응답은 비스트리밍), 소견은 결과 화면에서 스트리밍
+            out = run_gemini_calls_concurrently(
+                {"food": lambda: _vision_food_call(client, candidates, food_prompt, img_part)},
+                deadline_sec=_budget_left(),
+            )
+            out["advice"] = None
+            return out
+        # 기존 2회 호출: 음식 JSON 과 소견은 서로 독립 → 동시에 호출하고 하나의 마감 시간을 공유
+        return run_gemini_calls_concurrently(
+            {
+                "food": lambda: _vision_food_call(client, candidates, food_prompt, img_part),
+                "advice": lambda: _vision_advice_call(client, candidates, advice_prompt, img_part),
+            },
+            deadline_sec=_budget_left(),
+        )
+
+    cached = get_vision_cache().get(cache_key) if use_cache else None
+    if cached and cached.get("sorted_items") and cached.get("advice"):
+        parsed_tuple = (cached["sorted_items"], cached["total_carbs"])
+        advice_text = cached["advice"]
+    else:
+        # 지수 백오프 + full jitter (Retry-After 존중). 남은 마감 시간을 넘기면 바로 포기
+        def _on_quota_wait(position, eta):
+            if position:
+                progress(0.2, f"요청이 많아 순서를 기다리고 있어요 ({position}번째, 약 {max(1, round(eta))}초)")
+            else:
+                progress(0.2, "AI가 음식을 분석하고 있어요…")
+
+        def _analyze():
+            with gemini_operation(f"scan_{VISION_ANALYSIS_MODE}") as op, on_quota_wait(_on_quota_wait):
+                vision_out = VISION_RETRY.call(_attempt)
+                progress(0.85, "결과를 정리하고 있어요…")
+                parsed = parse_food_analysis_json(vision_out["food"])
+                # 호출은 풀 작업 스레드에서 끝났으므로 작업 핸들에 직접 기록
+                op.note_parse(bool(parsed and parsed[0]))
+            advice = vision_out.get("advice")
+            if use_cache and parsed and advice:
+                get_vision_cache().set(
+                    cache_key,
+                    {"sorted_items": parsed[0], "total_carbs": parsed[1], "advice": advice},
+                )
+            return parsed, advice
+
+        # 두 번 탭·여러 탭에서 같은 사진 분석이 겹치면 진행 중인 호출 하나의 결과를 함께 사용.
+        # 결과 객체는 합류한 호출자끼리 공유되므로 각자 깊은 복사본을 가진다 (항목 리스트 공유 방지)
+        parsed_tuple, advice_text = copy.deepcopy(_coalesced(
+            "scan", cache_key, _analyze, f"scan_{VISION_ANALYSIS_MODE}",
+            timeout=VISION_ANALYSIS_DEADLINE_SEC,
+            on_join=lambda: progress(0.2, "같은 사진을 분석하는 중이라 결과를 함께 기다리고 있어요…"),
+        ))
+    if not parsed_tuple or not parsed_tuple[0]:
+        raise VisionParseError("음식 분석 JSON 을 해석하지 못했습니다.")
+
+    sorted_items, total_carbs = parsed_tuple
+    order_comment = build_order_comment(sorted_items)
+    return {
+        "sorted_items": sorted_items,
+        # stream 모드: 소견은 결과 화면에서 채움 (advice_pending)
+        "advice": (advice_text + "\n\n" + order_comment) if advice_text else order_comment,
+        "advice_pending": not advice_text,
+        "advice_suffix": order_comment,
+        "cache_key": cache_key,
+        "raw_img": img,
+        # 혈당 스코어·영양 합계
+        **score_food_items(sorted_items, total_carbs),
+    }
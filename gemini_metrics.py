@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+NutriSort AI - Gemini 호출 계측.
+
+generate_content 호출마다 벽시계 시간·모델·토큰 수(usage_metadata)·이미지 바이트·오류 종류를 기록하고,
+기능 단위 작업(식전 인사이트·스캐너 분석 등)마다 폴백 홉·재시도 횟수·파싱 성공 여부를 묶어 기록한다.
+기록은 프로세스 메모리 히스토그램으로 집계되며, 최근 기록은 JSON lines 로 내보낼 수 있다.
+
+느린 스캔이 업로드(이미지 크기)·모델 지연·재시도·폴백 중 어디서 오는지 구분하기 위한 것.
+"""
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+# 최근 기록 보관 개수 / 기록마다 JSONL 로 덧붙일 파일 (비우면 파일 기록 안 함)
+_RECENT_MAX = int(os.environ.get("NUTRISORT_GEMINI_METRICS_RECENT", "2000") or 2000)
+_JSONL_PATH = os.environ.get("NUTRISORT_GEMINI_METRICS_JSONL", "").strip()
+
+# 히스토그램 구간 상한 (마지막 구간은 상한 없음)
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192)
+IMAGE_KB_BUCKETS = (32, 64, 128, 256, 512, 1024, 2048)
+
+
+class Histogram:
+    """고정 구간 히스토그램. 분위수는 구간 상한으로 근사한다."""
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value) -> None:
+        v = float(value)
+        self.counts[bisect_left(self.bounds, v)] += 1
+        self.total += 1
+        self.sum += v
+        self.max = max(self.max, v)
+
+    def quantile(self, q: float):
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        labels = [f"≤{b}" for b in self.bounds] + [f">{self.bounds[-1]}"]
+        return {
+            "count": self.total,
+            "mean": round(self.sum / self.total, 1) if self.total else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": round(self.max, 1) if self.total else None,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+def _usage_tokens(response):
+    """response.usage_metadata → (prompt 토큰, 응답 토큰). 없으면 (None, None)."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None, None
+    return getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None)
+
+
+class GeminiOperation:
+    """기능 단위 작업 하나 (후보 모델 순회·재시도·병렬 호출을 모두 포함)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.monotonic()
+        self.calls = []
+        self.retries = 0
+        self.parse_ok = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def add_call(self, call: dict) -> None:
+        with self._lock:
+            call["attempt"] = self.retries
+            self.calls.append(call)
+
+    def note_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def note_parse(self, ok: bool, call: dict = None) -> None:
+        """
+        응답 해석 성공 여부 기록 (작업 전체 값은 마지막 기록 기준). call(record_gemini_call 의 반환값)을
+        주면 그 호출에, 아니면 이 작업에서 응답을 받은 마지막 호출에 붙인다. 호출은 풀 작업 스레드에서,
+        해석은 호출부 스레드에서 할 수 있으므로 스레드로 찾지 않는다.
+        """
+        with self._lock:
+            if call is None:
+                call = next((c for c in reversed(self.calls) if not c.get("error")), None)
+            if call is not None:
+                call["parse_ok"] = bool(ok)
+            self.parse_ok = bool(ok)
+
+    def fallback_hops(self) -> int:
+        """같은 시도·같은 스레드 안에서 다음 후보(또는 같은 모델 재요청)로 넘어간 횟수."""
+        groups = {}
+        for call in self.calls:
+            key = (call["attempt"], call["thread"])
+            groups[key] = groups.get(key, 0) + 1
+        return sum(n - 1 for n in groups.values())
+
+    def to_record(self) -> dict:
+        with self._lock:
+            calls = list(self.calls)
+        ok_calls = [c for c in calls if not c.get("error")]
+
+        def _sum(field):
+            vals = [c[field] for c in calls if c.get(field) is not None]
+            return sum(vals) if vals else None
+
+        return {
+            "type": "operation",
+            "ts": time.time(),
+            "op": self.name,
+            "wall_ms": round((time.monotonic() - self.started) * 1000, 1),
+            "model": ok_calls[-1]["model"] if ok_calls else (calls[-1]["model"] if calls else None),
+            "calls": len(calls),
+            "fallback_hops": self.fallback_hops(),
+            "retries": self.retries,
+            "prompt_tokens": _sum("prompt_tokens"),
+            "response_tokens": _sum("response_tokens"),
+            "image_bytes": _sum("image_bytes") or 0,
+            "parse_ok": self.parse_ok,
+            "ok": self.error is None,
+            "error": self.error,
+        }
+
+
+class GeminiMetrics:
+    """호출·작업 기록을 모아 히스토그램·카운터로 집계하는 프로세스 공용 레지스트리 (스레드 안전)."""
+
+    def __init__(self, recent_max: int = _RECENT_MAX, jsonl_path: str = _JSONL_PATH):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=int(recent_max))
+        self._jsonl_path = jsonl_path
+        self._histograms = {}
+        self._counters = {}
+
+    def _hist(self, name, bounds) -> Histogram:
+        h = self._histograms.get(name)
+        if h is None:
+            h = self._histograms[name] = Histogram(bounds)
+        return h
+
+    def _count(self, name, n=1) -> None:
+        self._counters[name] = self._counters.get(name, 0) + n
+
+    def record(self, rec: dict) -> None:
+        with self._lock:
+            self._recent.append(rec)
+            if rec["type"] == "call":
+                model = rec["model"]
+                self._count(f"calls.{model}")
+                if rec.get("error"):
+                    self._count(f"call_errors.{model}.{rec['error']}")
+                else:
+                    self._hist(f"call_latency_ms.{model}", LATENCY_BUCKETS_MS).add(rec["wall_ms"])
+            else:
+                op = rec["op"]
+                self._count(f"ops.{op}")
+                self._hist(f"op_latency_ms.{op}", LATENCY_BUCKETS_MS).add(rec["wall_ms"])
+                if rec["prompt_tokens"] is not None:
+                    self._hist(f"prompt_tokens.{op}", TOKEN_BUCKETS).add(rec["prompt_tokens"])
+                if rec["response_tokens"] is not None:
+                    self._hist(f"response_tokens.{op}", TOKEN_BUCKETS).add(rec["response_tokens"])
+                if rec["image_bytes"]:
+                    self._hist(f"image_kb.{op}", IMAGE_KB_BUCKETS).add(rec["image_bytes"] / 1024)
+                self._count(f"retries.{op}", rec["retries"])
+                self._count(f"fallback_hops.{op}", rec["fallback_hops"])
+                if rec["parse_ok"] is False:
+                    self._count(f"parse_failures.{op}")
+                if not rec["ok"]:
+                    self._count(f"op_errors.{op}")
+        if self._jsonl_path:
+            self._append_jsonl(rec)
+
+    def _append_jsonl(self, rec: dict) -> None:
+        try:
+            with self._lock, open(self._jsonl_path, "a", encoding="utf-8") as fp:
+                fp.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        except OSError as e:
+            # 계측 실패가 사용자 요청을 막지 않도록 경로를 끄고 기록만 남긴다
+            sys.stderr.write(f"[Gemini 계측] JSONL 기록 실패 {self._jsonl_path}: {e}\n")
+            self._jsonl_path = ""
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "histograms": {k: h.snapshot() for k, h in sorted(self._histograms.items())},
+                "counters": dict(sorted(self._counters.items())),
+                "recent": len(self._recent),
+            }
+
+    def recent(self, limit: int = None, type_: str = None) -> list:
+        with self._lock:
+            recs = [r for r in self._recent if type_ is None or r["type"] == type_]
+        return recs[-limit:] if limit else recs
+
+    def export_jsonl(self, type_: str = None) -> str:
+        """최근 기록을 JSON lines 문자열로 (다운로드·오프라인 분석용)."""
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in self.recent(type_=type_))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._recent.clear()
+            self._histograms.clear()
+            self._counters.clear()
+
+
+GEMINI_METRICS = GeminiMetrics()
+
+# 현재 실행 중인 작업 (스레드 풀로 넘어갈 때는 contextvars.copy_context 로 전달)
+_CURRENT_OP = contextvars.ContextVar("nutrisort_gemini_operation", default=None)
+
+
+@contextmanager
+def gemini_operation(name: str):
+    """with 블록 안의 Gemini 호출·재시도·파싱 결과를 작업 하나로 묶어 기록한다."""
+    op = GeminiOperation(name)
+    token = _CURRENT_OP.set(op)
+    try:
+        yield op
+    except BaseException as e:
+        op.error = type(e).__name__
+        raise
+    finally:
+        _CURRENT_OP.reset(token)
+        GEMINI_METRICS.record(op.to_record())
+
+
+def current_operation_name():
+    """실행 중인 작업 이름 (없으면 None). 쿼터 우선순위 분류에 사용."""
+    op = _CURRENT_OP.get()
+    return op.name if op is not None else None
+
+
+def record_gemini_call(model, wall_sec, response=None, image_bytes=0, error_kind=None, stream=False,
+                       quota_wait_sec=0.0) -> dict:
+    """
+    generate_content(_stream) 호출 1회 기록 (wall_sec 는 쿼터 대기 제외). 실행 중인 작업이 있으면 그 작업에도 붙인다.
+    반환한 기록은 GeminiOperation.note_parse(call=...) 에 넘길 수 있다.
+    """
+    prompt_tokens, response_tokens = _usage_tokens(response)
+    op = _CURRENT_OP.get()
+    call = {
+        "type": "call",
+        "ts": time.time(),
+        "op": op.name if op else None,
+        "model": model,
+        "wall_ms": round(wall_sec * 1000, 1),
+        "prompt_tokens": prompt_tokens,
+        "response_tokens": response_tokens,
+        "image_bytes": int(image_bytes or 0),
+        "stream": bool(stream),
+        "quota_wait_ms": round(quota_wait_sec * 1000, 1),
+        "error": error_kind,
+        "thread": threading.get_ident(),
+    }
+    if op is not None:
+        op.add_call(call)
+    GEMINI_METRICS.record(call)
+    return call
+
+
+def note_gemini_retry() -> None:
+    op = _CURRENT_OP.get()
+    if op is not None:
+        op.note_retry()
+
+
+def note_gemini_parse(ok: bool, op: GeminiOperation = None) -> None:
+    """
+    응답 해석 결과를 작업에 기록. op 를 주지 않으면 현재 컨텍스트(gemini_operation)의 작업.
+    작업 스레드에서 해석할 때처럼 컨텍스트가 다를 수 있으면 gemini_operation 이 돌려준 op 를 넘긴다.
+    """
+    op = op if op is not None else _CURRENT_OP.get()
+    if op is not None:
+        op.note_parse(ok)
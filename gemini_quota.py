@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""
+NutriSort AI - GEMINI_API_KEY 쿼터 공유 토큰 버킷과 우선순위 입장 제어.
+
+한 프로세스의 모든 세션(그리고 NUTRISORT_GEMINI_LIMITER_FILE 을 같이 쓰는 여러 프로세스·배치 스크립트)이
+같은 API 키를 쓰므로, 모든 generate_content 호출 앞에서 토큰 버킷으로 분당 요청 수를 맞춘다.
+기다리는 요청은 우선순위 클래스 순서로 토큰을 받는다:
+  interactive(스캐너·메뉴 인식) > insight(식전·식후 멘트) > speculative(미리 받기) > batch(오프라인 재분석)
+같은 호출을 여러 호출자가 함께 기다리면 PriorityTicket 으로 그중 가장 높은 클래스까지 대기 순서를 올린다.
+예상 대기가 요청의 남은 마감 시간(RetryPolicy 의 deadline)을 넘으면 기다리지 않고 GeminiQuotaWaitTooLong.
+대기 중에는 on_quota_wait 로 등록한 콜백에 (대기 순번, 예상 초)를 알려 UI 에 보여 줄 수 있다 (입장하면 (0, 0)).
+"""
+
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from gemini_metrics import current_operation_name
+
+try:  # 다중 프로세스 공유 버킷 (POSIX 파일 잠금)
+    import fcntl
+except ImportError:  # Windows 등: 프로세스 내 버킷만 사용
+    fcntl = None
+
+PRIORITY_CLASSES = ("interactive", "insight", "speculative", "batch")
+# 계측 작업 이름(gemini_operation) → 우선순위 클래스. 접두 일치, 없으면 insight
+_OP_PRIORITY = (
+    ("scan_", "interactive"),
+    ("menu_name", "interactive"),
+    ("pre_meal_insights", "insight"),
+    ("post_meal_feedback", "insight"),
+    ("batch_", "batch"),
+)
+
+# 분당 요청 수(0 이면 끔)·순간 허용량·다중 프로세스 공유 상태 파일
+_RPM = float(os.environ.get("NUTRISORT_GEMINI_RPM", "600") or 0)
+_BURST = int(os.environ.get("NUTRISORT_GEMINI_BURST", "30") or 30)
+_STATE_FILE = os.environ.get("NUTRISORT_GEMINI_LIMITER_FILE", "").strip()
+
+_PRIORITY = contextvars.ContextVar("nutrisort_gemini_priority", default=None)
+_DEADLINE = contextvars.ContextVar("nutrisort_gemini_deadline", default=None)
+_WAIT_LISTENER = contextvars.ContextVar("nutrisort_gemini_wait_listener", default=None)
+
+
+class GeminiQuotaWaitTooLong(RuntimeError):
+    """쿼터 대기열이 길어 마감 시간 안에 호출할 수 없음 (재시도·다음 모델 폴백 대상 아님, '서버 혼잡' 안내)."""
+
+
+class PriorityTicket:
+    """
+    여러 호출자가 함께 기다리는 호출(중복 호출 합치기)의 우선순위. gemini_priority 에 넘기면 대기 중에도
+    GeminiRateLimiter.promote 로 올린 클래스가 바로 반영된다. 내려가지는 않는다.
+    """
+
+    __slots__ = ("priority",)
+
+    def __init__(self, priority: str):
+        self.priority = priority
+
+
+@contextmanager
+def gemini_priority(priority):
+    """
+    with 블록 안의 Gemini 호출 우선순위 클래스를 지정 (작업 이름으로 정한 기본값보다 우선).
+    priority 는 클래스 이름 또는 PriorityTicket.
+    """
+    token = _PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+@contextmanager
+def request_deadline(deadline_sec: float):
+    """with 블록 안 호출의 마감 시각(monotonic). 바깥에 더 이른 마감이 있으면 그대로 둔다."""
+    at = time.monotonic() + float(deadline_sec)
+    outer = _DEADLINE.get()
+    token = _DEADLINE.set(at if outer is None else min(outer, at))
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+@contextmanager
+def on_quota_wait(listener):
+    """쿼터 대기 중 listener(순번, 예상 대기 초) 호출. 순번이 바뀔 때마다 다시 알리고, 기다렸다가 입장하면 (0, 0)."""
+    token = _WAIT_LISTENER.set(listener)
+    try:
+        yield
+    finally:
+        _WAIT_LISTENER.reset(token)
+
+
+def deadline_remaining():
+    """현재 컨텍스트 마감까지 남은 초 (마감이 없으면 None). gemini_generate 가 HTTP 타임아웃으로 쓴다."""
+    at = _DEADLINE.get()
+    return None if at is None else at - time.monotonic()
+
+
+def current_priority(op_name: str = None) -> str:
+    """지정된 우선순위, 없으면 작업 이름(op_name, 기본은 실행 중인 작업)으로 정한 클래스."""
+    explicit = _PRIORITY.get()
+    if isinstance(explicit, PriorityTicket):
+        explicit = explicit.priority
+    if explicit in PRIORITY_CLASSES:
+        return explicit
+    op = op_name or current_operation_name() or ""
+    for prefix, cls in _OP_PRIORITY:
+        if op.startswith(prefix):
+            return cls
+    return "insight"
+
+
+class _LocalTokenBucket:
+    """프로세스 내 토큰 버킷 (호출자가 잠금을 잡고 사용)."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def try_take(self) -> float:
+        """토큰 1개를 가져오면 0, 아니면 다음 토큰까지 남은 초."""
+        self._refill()
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+
+class _FileTokenBucket:
+    """
+    여러 프로세스가 공유하는 토큰 버킷: 상태(토큰 수, 마지막 충전 시각)를 파일에 두고 flock 으로 갱신.
+    벽시계(time.time) 기준이라 프로세스가 달라도 충전량이 맞는다.
+    """
+
+    def __init__(self, path: str, rate: float, burst: int):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+
+    def _update(self, take: bool) -> float:
+        with open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except ValueError:
+                    state = {}
+                now = time.time()
+                tokens = float(state.get("tokens", self.burst))
+                last = float(state.get("last", now))
+                tokens = min(self.burst, tokens + max(0.0, now - last) * self.rate)
+                result = tokens
+                if take:
+                    if tokens >= 1.0:
+                        tokens -= 1.0
+                        result = 0.0
+                    else:
+                        result = (1.0 - tokens) / self.rate
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({"tokens": tokens, "last": now}))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return result
+
+    def try_take(self) -> float:
+        return self._update(take=True)
+
+    def available(self) -> float:
+        return self._update(take=False)
+
+
+class GeminiRateLimiter:
+    """
+    우선순위 대기열 + 토큰 버킷 (스레드 안전). 대기열 맨 앞 요청만 버킷에서 토큰을 가져가며,
+    앞선 순번 수로 예상 대기를 계산해 마감 시간을 넘길 요청은 바로 거절한다.
+    """
+
+    def __init__(self, per_minute: float, burst: int = 30, state_path: str = ""):
+        self.per_minute = float(per_minute)
+        self.rate = self.per_minute / 60.0
+        self.burst = max(1, int(burst))
+        self.shared = False
+        if self.rate > 0 and state_path:
+            if fcntl is not None:
+                self._bucket = _FileTokenBucket(state_path, self.rate, self.burst)
+                self.shared = True
+            else:
+                sys.stderr.write("[Gemini 쿼터] 파일 잠금을 쓸 수 없어 프로세스 내 버킷만 사용\n")
+        if not self.shared:
+            self._bucket = _LocalTokenBucket(self.rate, self.burst)
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._stats = {
+            cls: {"acquired": 0, "waited": 0, "rejected": 0, "wait_sec": 0.0, "max_wait_sec": 0.0}
+            for cls in PRIORITY_CLASSES
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _eta(self, ahead: int) -> float:
+        """앞에 ahead 건이 있을 때 내 차례까지 예상 초."""
+        need = ahead + 1 - self._bucket.available()
+        return max(0.0, need / self.rate)
+
+    def estimate_wait(self, priority: str = None) -> float:
+        """지금 이 우선순위로 요청하면 예상되는 대기 초 (UI 안내용)."""
+        if not self.enabled:
+            return 0.0
+        pidx = PRIORITY_CLASSES.index(priority or current_priority())
+        with self._cond:
+            ahead = sum(1 for k in self._waiters if k[0] <= pidx)
+            return self._eta(ahead)
+
+    def acquire(self, priority: str = None, deadline: float = None) -> float:
+        """호출 1건 입장. 기다린 초를 반환하고, 마감 전에 차례가 오지 않으면 GeminiQuotaWaitTooLong."""
+        if not self.enabled:
+            return 0.0
+        # 합류한 호출자가 우선순위를 올리면 대기 중에도 순서를 다시 잡는다
+        ticket = _PRIORITY.get() if priority is None else None
+        if not isinstance(ticket, PriorityTicket):
+            ticket = None
+        priority = priority if priority in PRIORITY_CLASSES else current_priority()
+        if deadline is None:
+            deadline = _DEADLINE.get()
+        listener = _WAIT_LISTENER.get()
+        started = time.monotonic()
+        key = (PRIORITY_CLASSES.index(priority), next(self._seq))
+        notified = None
+        with self._cond:
+            heapq.heappush(self._waiters, key)
+            try:
+                while True:
+                    if ticket is not None and ticket.priority != priority:
+                        priority = ticket.priority
+                        self._waiters.remove(key)
+                        key = (PRIORITY_CLASSES.index(priority), key[1])
+                        self._waiters.append(key)
+                        heapq.heapify(self._waiters)
+                    # 기다리는 사이 마감이 지났으면 토큰이 생겼어도 입장하지 않는다 (깨어날 때마다 확인)
+                    if deadline is not None and time.monotonic() > deadline:
+                        self._stats[priority]["rejected"] += 1
+                        raise GeminiQuotaWaitTooLong("Gemini 요청 대기 중 마감 시간이 지났습니다.")
+                    if self._waiters[0] == key:
+                        next_in = self._bucket.try_take()
+                        if next_in <= 0:
+                            heapq.heappop(self._waiters)
+                            waited = time.monotonic() - started
+                            self._record(priority, waited)
+                            if notified is not None:
+                                self._notify(listener, 0, 0.0)
+                            return waited
+                    ahead = sum(1 for k in self._waiters if k < key)
+                    eta = self._eta(ahead)
+                    now = time.monotonic()
+                    if deadline is not None and now + eta > deadline:
+                        self._stats[priority]["rejected"] += 1
+                        raise GeminiQuotaWaitTooLong(
+                            f"Gemini 요청이 많아 대기열 {ahead + 1}번째, 예상 {eta:.0f}초로 마감 시간을 넘깁니다."
+                        )
+                    if listener is not None and ahead != notified:
+                        notified = ahead
+                        self._notify(listener, ahead + 1, eta)
+                    # 토큰 충전 또는 앞선 요청 입장(notify) 시 다시 확인
+                    self._cond.wait(timeout=min(max(eta, 0.01), 0.5))
+            except BaseException:
+                if key in self._waiters:
+                    self._waiters.remove(key)
+                    heapq.heapify(self._waiters)
+                raise
+            finally:
+                self._cond.notify_all()
+
+    def promote(self, ticket: PriorityTicket, priority: str) -> None:
+        """ticket 의 우선순위를 priority 까지 올린다 (이미 같거나 높으면 그대로). 대기 중인 입장은 순서를 다시 잡는다."""
+        if priority not in PRIORITY_CLASSES:
+            return
+        with self._cond:
+            if PRIORITY_CLASSES.index(priority) < PRIORITY_CLASSES.index(ticket.priority):
+                ticket.priority = priority
+                self._cond.notify_all()
+
+    @staticmethod
+    def _notify(listener, position, eta) -> None:
+        try:
+            listener(position, eta)
+        except Exception as e:
+            sys.stderr.write(f"[Gemini 쿼터] 대기 알림 실패: {e}\n")
+
+    def _record(self, priority, waited) -> None:
+        row = self._stats[priority]
+        row["acquired"] += 1
+        if waited > 0.01:
+            row["waited"] += 1
+            row["wait_sec"] += waited
+            row["max_wait_sec"] = max(row["max_wait_sec"], waited)
+
+    def stats(self) -> dict:
+        with self._cond:
+            queued = {cls: 0 for cls in PRIORITY_CLASSES}
+            for pidx, _ in self._waiters:
+                queued[PRIORITY_CLASSES[pidx]] += 1
+            return {
+                "per_minute": self.per_minute,
+                "burst": self.burst,
+                "shared": self.shared,
+                "tokens": round(self._bucket.available(), 2) if self.enabled else None,
+                "queued": queued,
+                "classes": {
+                    cls: {**row, "wait_sec": round(row["wait_sec"], 2), "max_wait_sec": round(row["max_wait_sec"], 2)}
+                    for cls, row in self._stats.items()
+                },
+            }
+
+
+# 프로세스 공용 입장 제어 (NUTRISORT_GEMINI_RPM=0 이면 끔)
+GEMINI_LIMITER = GeminiRateLimiter(_RPM, _BURST, _STATE_FILE)
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+NutriSort AI - 업로드 사진 인코딩 파이프라인.
+
+업로드 직후 표시·전송용 JPEG(최대 1024px·500KB)를 만든다. 이전에는 화질 88→76→64… 로 다시 인코딩하면서
+실패할 때마다 15% 씩 LANCZOS 로 줄여, 촘촘한 음식 사진은 요청 스레드에서 인코딩 6번·리샘플 5번을 거쳤다.
+여기서는 긴 변 기준으로 한 번만 줄이고(reducing_gap), 목표 크기에 맞는 가장 높은 화질을 제한된 이분 탐색으로 찾는다.
+  - 화질 88 에서 이미 목표 이하면 인코딩 1번으로 끝 (대부분의 사진)
+  - 아니면 25~87 구간을 최대 QUALITY_SEARCH_STEPS 번 이분 탐색
+  - 최저 화질로도 넘치면(드묾) 크기 비율만큼 한 번 더 줄여 최저 화질로 인코딩
+결과는 인코딩한 JPEG 바이트와 그 바이트를 연 이미지(같은 바이트를 info 에 보관 → Gemini 요청에 재사용)다.
+비교는 scripts/bench_compress_image.py.
+
+업로드 수신(open_upload)은 12~48MP 카메라 원본을 통째로 RGB 로 풀지 않는다. JPEG 은 draft 모드로
+DCT 단계에서 1/2·1/4·1/8 로 줄여 디코딩하고(목표 긴 변 이상으로 유지), EXIF 방향을 적용하며,
+디코딩 후 픽셀 수가 NUTRISORT_UPLOAD_MAX_DECODE_MP 를 넘는 사진은 풀기 전에 거절한다.
+업로드당 최대 RSS 측정은 scripts/bench_upload_ingest.py.
+
+ImageArtifact 는 업로드 1장을 수신할 때 한 번 만드는 불변 묶음이다 (원본 바이트 해시·지각 해시(dHash)·
+표시용 JPEG·모델 입력·Storage 저장용 JPEG·미리보기 data URI). 캐시 키·미리보기·Gemini·저장이 모두 같은 바이트를
+참조하며, 파생 인코딩(모델 입력 프로필·저장용·썸네일·base64)은 처음 쓸 때 한 번만 만들어 보관한다.
+썸네일(THUMBNAIL_WIDTHS 너비의 WebP)은 저장 시 원본 JPEG 옆에 함께 올려, 일지 피드가 원본 대신 내려받는다.
+"""
+
+import base64
+import hashlib
+import io
+import math
+import os
+import threading
+from collections import namedtuple
+
+from PIL import Image, ImageOps
+
+from gemini_client import ENCODED_JPEG_INFO_KEY
+from vision_input import vision_input_image
+
+DISPLAY_MAX_EDGE = 1024
+DISPLAY_MAX_KB = 500
+QUALITY_MAX = 88
+QUALITY_MIN = 25
+# 화질 88 로 넘친 뒤 이분 탐색할 최대 인코딩 수 (25~87 구간 → 화질 4 단위 안으로 수렴)
+QUALITY_SEARCH_STEPS = 4
+# 큰 축소는 정수배 box 축소 후 LANCZOS (12MP→1024px 약 3배 빠름, 정확한 LANCZOS 대비 PSNR ≈ 50dB)
+RESIZE_REDUCING_GAP = 1.5
+
+# 업로드 한 장을 디코딩할 때 허용하는 최대 픽셀 수 (draft 축소 후 기준, RGB 3바이트/픽셀 → 24MP ≈ 72MB)
+UPLOAD_MAX_DECODE_MP = float(os.environ.get("NUTRISORT_UPLOAD_MAX_DECODE_MP", "24") or 24)
+
+# Storage 업로드용 JPEG (firebase_db.upload_image_to_storage 기본값과 같음)
+STORAGE_MAX_WIDTH = 800
+STORAGE_QUALITY = 85
+
+# 일지 피드용 썸네일 (너비 px, WebP). 160 은 타임라인 행 미리보기, 320 은 펼친 사진
+THUMBNAIL_WIDTHS = (160, 320)
+THUMBNAIL_QUALITY = 75
+
+# image: 바이트를 연 PIL 이미지, data: JPEG 바이트, quality: 최종 화질, encodes: 인코딩 횟수
+EncodedJpeg = namedtuple("EncodedJpeg", "image data quality encodes")
+
+
+def _to_rgb(img):
+    if img.mode in ("RGBA", "P", "LA"):
+        return img.convert("RGB")
+    return img
+
+
+class UploadImageTooLarge(ValueError):
+    """축소 디코딩으로도 메모리 상한(UPLOAD_MAX_DECODE_MP)을 넘는 업로드 사진."""
+
+
+def open_upload(fp, max_edge: int = DISPLAY_MAX_EDGE, max_decode_mp: float = None):
+    """
+    업로드 파일(경로·파일 객체) → 방향을 바로잡은 RGB 이미지 (긴 변은 max_edge 이상, 보통 그 2배 이내).
+    JPEG 은 draft 로 목표 크기 근처까지 줄여 디코딩하고, 그 밖의 형식은 원본 크기로 디코딩한다.
+    """
+    limit = int((max_decode_mp or UPLOAD_MAX_DECODE_MP) * 1_000_000)
+    img = Image.open(fp)
+    w, h = img.size
+    if img.format == "JPEG" and max(w, h) > max_edge:
+        # 긴 변이 max_edge 아래로 내려가지 않는 가장 작은 배율 (draft 는 요청 크기 이상을 보장)
+        ratio = max_edge / max(w, h)
+        img.draft("RGB", (max(1, math.ceil(w * ratio)), max(1, math.ceil(h * ratio))))
+    if img.size[0] * img.size[1] > limit:
+        raise UploadImageTooLarge(
+            f"사진 해상도가 너무 큽니다 ({w}×{h}, 디코딩 {img.size[0]}×{img.size[1]})."
+        )
+    img.load()
+    # 휴대폰 세로 사진: EXIF Orientation 을 픽셀에 반영 (재인코딩하면 EXIF 가 빠지므로)
+    img = ImageOps.exif_transpose(img)
+    return img if img.mode in ("RGB", "L") else img.convert("RGB")
+
+
+def fit_to_edge(img, max_edge: int):
+    """긴 변이 max_edge 를 넘으면 비율을 유지해 한 번만 LANCZOS 로 줄인다 (RGB 로 맞춤)."""
+    img = _to_rgb(img)
+    w, h = img.size
+    if w > max_edge or h > max_edge:
+        ratio = min(max_edge / w, max_edge / h)
+        img = img.resize(
+            (max(1, int(w * ratio)), max(1, int(h * ratio))),
+            Image.Resampling.LANCZOS,
+            reducing_gap=RESIZE_REDUCING_GAP,
+        )
+    return img
+
+
+def _encode(img, quality: int) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def encode_jpeg_to_size(img, max_kb: float = DISPLAY_MAX_KB, max_edge: int = DISPLAY_MAX_EDGE) -> EncodedJpeg:
+    """
+    PIL 이미지 → 긴 변 max_edge 이하·max_kb 이하 JPEG.
+    목표를 넘지 않는 가장 높은 화질(QUALITY_MAX 이하)을 찾고, 최저 화질로도 넘칠 때만 한 번 더 줄인다.
+    """
+    img = fit_to_edge(img, max_edge)
+    limit = int(max_kb * 1024)
+    quality, data = QUALITY_MAX, _encode(img, QUALITY_MAX)
+    encodes = 1
+    if len(data) > limit:
+        best = None
+        floor = None  # 탐색 중 넘친 가장 낮은 화질 (화질, 바이트)
+        lo, hi = QUALITY_MIN, QUALITY_MAX - 1
+        for _ in range(QUALITY_SEARCH_STEPS):
+            if lo > hi:
+                break
+            q = (lo + hi) // 2
+            d = _encode(img, q)
+            encodes += 1
+            if len(d) <= limit:
+                best, lo = (q, d), q + 1
+            else:
+                floor, hi = (q, d), q - 1
+        if best is None and floor[0] > QUALITY_MIN:
+            d = _encode(img, QUALITY_MIN)
+            encodes += 1
+            if len(d) <= limit:
+                best = (QUALITY_MIN, d)
+            else:
+                floor = (QUALITY_MIN, d)
+        if best is not None:
+            quality, data = best
+        else:
+            # 최저 화질로도 넘침: 크기 비율(면적 ∝ 바이트)만큼 한 번 더 줄여 최저 화질로 (이전 동작처럼 결과는 반환)
+            scale = math.sqrt(limit / len(floor[1])) * 0.95
+            img = img.resize(
+                (max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.Resampling.LANCZOS
+            )
+            quality, data = QUALITY_MIN, _encode(img, QUALITY_MIN)
+            encodes += 1
+    out = Image.open(io.BytesIO(data))
+    # 이 JPEG 바이트를 Gemini 요청에 그대로 재사용 (gemini_client.image_part)
+    out.info[ENCODED_JPEG_INFO_KEY] = data
+    return EncodedJpeg(out, data, quality, encodes)
+
+
+def dhash64(img) -> int:
+    """
+    64비트 difference hash: 흑백 9×8 로 줄여 가로 이웃 픽셀 밝기 비교.
+    같은 접시를 다시 찍은 사진(약간의 구도·노출·재인코딩 차이)은 해밍 거리가 작다.
+    """
+    small = img.convert("L").resize((9, 8), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    px = small.tobytes()
+    bits = 0
+    for row in range(8):
+        base = row * 9
+        for col in range(8):
+            bits = (bits << 1) | (px[base + col] > px[base + col + 1])
+    return bits
+
+
+def _raw_digest(fp) -> str:
+    """업로드 원본 바이트 SHA-256. BytesIO(UploadedFile)는 memoryview 로 복사 없이, 파일은 조각으로 읽는다."""
+    if isinstance(fp, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(fp).hexdigest()
+    if hasattr(fp, "getbuffer"):
+        with fp.getbuffer() as view:
+            return hashlib.sha256(view).hexdigest()
+    h = hashlib.sha256()
+    if isinstance(fp, (str, os.PathLike)):
+        with open(fp, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.hexdigest()
+    pos = fp.tell()
+    for chunk in iter(lambda: fp.read(1 << 20), b""):
+        h.update(chunk)
+    fp.seek(pos)
+    return h.hexdigest()
+
+
+_artifact_lock = threading.Lock()
+
+
+class ImageArtifact(namedtuple("_ImageArtifact", "image_hash dhash display display_jpeg memo")):
+    """
+    업로드 사진 1장의 불변 산출물. from_upload 로 수신 시 한 번 만든다.
+      image_hash: 업로드 원본 바이트 SHA-256 (정확히 같은 파일 판별, AI 응답 캐시·진행 중 요청 키)
+      dhash: 표시용 이미지의 64비트 지각 해시 (다시 찍은 비슷한 사진 판별, ai_cache.NEAR_DUPLICATES)
+      display / display_jpeg: 표시용 이미지와 그 JPEG 바이트 (≤1024px·500KB, info 에 같은 바이트)
+    모델 입력·저장용 JPEG·data URI 는 처음 요청될 때 한 번만 만들어 memo 에 둔다.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_upload(cls, fp, max_kb: float = DISPLAY_MAX_KB, max_edge: int = DISPLAY_MAX_EDGE):
+        """업로드 파일(UploadedFile·경로·바이트) → 아티팩트. 축소 디코딩·EXIF 방향·목표 크기 인코딩을 한 번에."""
+        digest = _raw_digest(fp)
+        if isinstance(fp, (bytes, bytearray, memoryview)):
+            fp = io.BytesIO(fp)
+        elif hasattr(fp, "seek"):
+            fp.seek(0)
+        enc = encode_jpeg_to_size(open_upload(fp, max_edge=max_edge), max_kb=max_kb, max_edge=max_edge)
+        # 여러 스레드(UI·분석 작업)가 공유하므로 지연 디코딩을 미리 끝내 둔다
+        enc.image.load()
+        return cls(digest, dhash64(enc.image), enc.image, enc.data, {})
+
+    def _memoized(self, key, build):
+        with _artifact_lock:
+            if key in self.memo:
+                return self.memo[key]
+        value = build()
+        with _artifact_lock:
+            return self.memo.setdefault(key, value)
+
+    @property
+    def size(self):
+        return self.display.size
+
+    @property
+    def data_uri(self) -> str:
+        """<img src> 용 data URI (rerun 마다 다시 인코딩하지 않음)."""
+        return self._memoized(
+            "data_uri", lambda: "data:image/jpeg;base64," + base64.b64encode(self.display_jpeg).decode()
+        )
+
+    def model_input(self, profile=None):
+        """Gemini 입력 이미지 (vision_input 프로필별 한 번만 인코딩, JPEG 바이트는 info 에)."""
+        return vision_input_image(self.display, profile)
+
+    def storage_jpeg(self, max_width: int = STORAGE_MAX_WIDTH, quality: int = STORAGE_QUALITY) -> bytes:
+        """Storage 업로드용 JPEG (표시용 이미지를 너비 max_width 이하로, 설정별 한 번만 인코딩)."""
+
+        def _build():
+            img = _to_rgb(self.display)
+            w, h = img.size
+            if w > max_width:
+                img = img.resize((max_width, max(1, int(h * max_width / w))), Image.Resampling.LANCZOS)
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=quality, optimize=True)
+            return buf.getvalue()
+
+        return self._memoized(("storage", max_width, quality), _build)
+
+    def thumbnail_webp(self, width: int, quality: int = THUMBNAIL_QUALITY) -> bytes:
+        """피드용 WebP 썸네일 (표시용 이미지를 너비 width 이하로, 너비별 한 번만 인코딩)."""
+
+        def _build():
+            img = _to_rgb(self.display)
+            w, h = img.size
+            if w > width:
+                img = img.resize(
+                    (width, max(1, int(h * width / w))), Image.Resampling.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP
+                )
+            buf = io.BytesIO()
+            img.save(buf, format="WEBP", quality=quality, method=4)
+            return buf.getvalue()
+
+        return self._memoized(("thumb", width, quality), _build)
+
+    def thumbnails(self, widths=THUMBNAIL_WIDTHS) -> dict:
+        """{너비: WebP 바이트} (firebase_db.upload_meal_thumbnails 입력)."""
+        return {w: self.thumbnail_webp(w) for w in widths}
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+NutriSort AI - 프로세스 내 백그라운드 작업 실행기.
+
+비전 분석처럼 5~15초 걸리는 작업을 세션 스크립트 스레드 밖에서 실행한다.
+작업은 id 로 조회하며, 결과는 일정 시간 보관되어 웹소켓 재연결·새로고침된 세션도 이어받을 수 있다.
+동시에 실행되는 작업 수(전역 상한)와 대기열 길이를 제한하고, 대기열 지표를 제공한다.
+"""
+
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobQueueFull(RuntimeError):
+    """대기열이 가득 차 새 작업을 받을 수 없음 (사용자에게는 '서버 혼잡'으로 안내)."""
+
+
+class Job:
+    """작업 상태: queued → running → done | error. progress 는 0.0~1.0."""
+
+    __slots__ = (
+        "id", "kind", "owner", "meta", "state", "progress", "message",
+        "result", "error", "submitted_at", "started_at", "finished_at", "claimed",
+    )
+
+    def __init__(self, kind, owner=None, meta=None):
+        self.id = uuid.uuid4().hex[:16]
+        self.kind = kind
+        self.owner = owner
+        self.meta = meta or {}
+        self.state = "queued"
+        self.progress = 0.0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.claimed = False
+
+    @property
+    def done(self) -> bool:
+        return self.state in ("done", "error")
+
+
+class JobRunner:
+    """
+    제한된 스레드 풀 기반 작업 실행기 (스레드 안전).
+    fn(progress) 형태의 callable 을 받으며, progress(fraction, message="") 로 진행률을 보고한다.
+    """
+
+    def __init__(self, max_workers=4, max_queue=32, result_ttl_sec=600, name="jobs"):
+        self.max_workers = int(max_workers)
+        self.max_queue = int(max_queue)
+        self.result_ttl_sec = float(result_ttl_sec)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+        self._wait_total = 0.0
+        self._run_total = 0.0
+
+    def _purge(self, now):
+        expired = [
+            jid for jid, j in self._jobs.items()
+            if j.done and j.finished_at and now - j.finished_at > self.result_ttl_sec
+        ]
+        for jid in expired:
+            del self._jobs[jid]
+
+    def submit(self, kind, fn, owner=None, meta=None) -> str:
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            queued = sum(1 for j in self._jobs.values() if j.state == "queued")
+            if queued >= self.max_queue:
+                self._counters["rejected"] += 1
+                raise JobQueueFull(f"작업 대기열이 가득 찼습니다 ({queued}/{self.max_queue}).")
+            job = Job(kind, owner=owner, meta=meta)
+            self._jobs[job.id] = job
+            self._counters["submitted"] += 1
+        self._pool.submit(self._run, job, fn)
+        return job.id
+
+    def _run(self, job, fn):
+        with self._lock:
+            job.state = "running"
+            job.started_at = time.time()
+            self._wait_total += job.started_at - job.submitted_at
+
+        def _progress(fraction, message=""):
+            job.progress = max(job.progress, min(1.0, float(fraction)))
+            if message:
+                job.message = message
+
+        try:
+            result = fn(_progress)
+        except Exception as e:  # 작업 스레드에서 예외가 새어 나가지 않도록 기록
+            with self._lock:
+                job.error = e
+                job.state = "error"
+                job.finished_at = time.time()
+                self._run_total += job.finished_at - job.started_at
+                self._counters["failed"] += 1
+            sys.stderr.write(f"[작업] {job.kind} {job.id} 실패: {e}\n")
+            return
+        with self._lock:
+            job.result = result
+            job.progress = 1.0
+            job.state = "done"
+            job.finished_at = time.time()
+            self._run_total += job.finished_at - job.started_at
+            self._counters["completed"] += 1
+
+    def get(self, job_id):
+        if not job_id:
+            return None
+        with self._lock:
+            self._purge(time.time())
+            return self._jobs.get(job_id)
+
+    def latest_for_owner(self, owner, kind=None):
+        """해당 사용자의 아직 수령되지 않은 가장 최근 작업 (재연결 세션 이어받기용)."""
+        if not owner:
+            return None
+        with self._lock:
+            cands = [
+                j for j in self._jobs.values()
+                if j.owner == owner and not j.claimed and (kind is None or j.kind == kind)
+            ]
+            return max(cands, key=lambda j: j.submitted_at) if cands else None
+
+    def claim(self, job_id) -> bool:
+        """완료된 작업 결과를 한 세션만 반영하도록 표시. 처음 수령한 경우에만 True."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or not job.done or job.claimed:
+                return False
+            job.claimed = True
+            return True
+
+    def abandon(self, job_id) -> None:
+        """사용자가 화면을 떠난 작업: 결과가 나와도 다른 세션이 이어받지 않도록 수령 처리."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.claimed = True
+
+    def metrics(self) -> dict:
+        with self._lock:
+            queued = sum(1 for j in self._jobs.values() if j.state == "queued")
+            running = sum(1 for j in self._jobs.values() if j.state == "running")
+            started = self._counters["completed"] + self._counters["failed"] + running
+            finished = self._counters["completed"] + self._counters["failed"]
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": queued,
+                "running": running,
+                "retained": len(self._jobs),
+                **self._counters,
+                "avg_wait_sec": round(self._wait_total / started, 3) if started else 0.0,
+                "avg_run_sec": round(self._run_total / finished, 3) if finished else 0.0,
+            }
+
+
+# 비전 분석 전용 실행기: 프로세스 전체 동시 실행 상한 (Gemini 쿼터·메모리 보호)
+VISION_JOBS = JobRunner(
+    max_workers=int(os.environ.get("NUTRISORT_VISION_JOB_WORKERS", "4") or 4),
+    max_queue=int(os.environ.get("NUTRISORT_VISION_JOB_QUEUE", "32") or 32),
+    name="vision-job",
+)
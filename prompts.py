@@ -5,16 +5,21 @@ st.session_state.lang 또는 전달된 lang에 따라 해당 언어로 분석 
 """
 # KO: 한국어로 친절하게, EN: 영어로 전문적으로, ZH/JA/HI: 해당 언어로 (임시 지시문 포함, 검토 필요)
 
-def get_food_analysis_prompt_json(lang):
-    """비전 분석용: 단일 JSON 객체만 반환하도록 지시 (파싱·total_carbs 연동용)."""
-    _json_rules = """
+from food_index import get_food_index
+
+
+def _food_json_rules(index_names=None):
+    """음식 JSON 스키마 지시. index_names(기준표 음식명)를 주면 그 음식은 수치를 생략하게 한다 (앱이 기준표로 채움)."""
+    if not index_names:
+        return """
 반드시 JSON 객체 하나만 출력하세요. 앞뒤 설명, 마크다운, 코드펜스(```) 사용 금지.
 스키마:
 {
   "total_carbs": <정수, 모든 항목 carbs 합과 동일>,
   "items": [
     {
-      "name": "음식 이름 문자열",
+      "name": "음식 이름 문자열 (일반적인 음식명, 예: 김치찌개, 현미밥)",
+      "portion": <사진 속 양, 1인분 기준 배수 (예: 0.5, 1, 1.5)>,
       "gi": <0~100 정수>,
       "carbs": <탄수화물 g 정수>,
       "protein": <단백질 g 정수>,
@@ -25,7 +30,40 @@ def get_food_analysis_prompt_json(lang):
     }
   ]
 }
-규칙: 사진에 보이는 음식만 포함. 숫자 필드는 모두 정수. total_carbs는 items의 carbs 합과 일치."""
+규칙: 사진에 보이는 음식만 포함. portion 외의 숫자 필드는 모두 정수이며 portion 만큼의 양 기준. total_carbs는 items의 carbs 합과 일치."""
+    return """
+반드시 JSON 객체 하나만 출력하세요. 앞뒤 설명, 마크다운, 코드펜스(```) 사용 금지.
+스키마:
+{
+  "total_carbs": <정수, 모든 항목에 carbs 를 쓴 경우에만 그 합. 아니면 생략>,
+  "items": [
+    {
+      "name": "음식 이름 문자열 (기준표 음식이면 목록의 이름 그대로, 예: 김치찌개, 현미밥)",
+      "portion": <사진 속 양, 1인분 기준 배수 (예: 0.5, 1, 1.5)>,
+      "gi": <0~100 정수, 기준표 음식이면 생략>,
+      "carbs": <탄수화물 g 정수, 기준표 음식이면 생략>,
+      "protein": <단백질 g 정수, 기준표 음식이면 생략>,
+      "fat": <지방 g 정수, 기준표 음식이면 생략>,
+      "kcal": <칼로리 정수, 기준표 음식이면 생략>,
+      "signal": "초록" | "노랑" | "빨강" (또는 영문 신호),
+      "order": <섭취 순서, 1부터 정수>
+    }
+  ]
+}
+규칙: 사진에 보이는 음식만 포함. 아래 기준표에 있는 음식과 정확히 같은 음식이면 name 에 목록의 이름을 그대로 쓰고
+(양은 name 이 아니라 portion 으로) name·portion·signal·order 만 쓰며 gi·carbs·protein·fat·kcal 은 생략한다
+(앱이 기준표 1인분 × portion 으로 채움). 비슷하지만 다른 음식(예: 라볶이, 짬뽕밥, 감자탕)은 기준표 음식이 아니다.
+기준표에 없는 음식은 숫자를 모두 채우며, portion 외의 숫자는 정수이고 portion 만큼의 양 기준.
+기준표 음식: """ + ", ".join(index_names)
+
+
+def get_food_analysis_prompt_json(lang):
+    """
+    비전 분석용: 단일 JSON 객체만 반환하도록 지시 (파싱·total_carbs 연동용).
+    한글 음식명(KO)이면 로컬 기준표 음식의 수치는 생략하게 해 출력 토큰을 줄인다 (food_analysis 가 기준표로 채움).
+    """
+    _index = get_food_index() if lang == "KO" else None
+    _json_rules = _food_json_rules(_index.names if _index is not None else None)
     if lang == "KO":
         return (
             "사진 속 음식들을 혈당 관리 관점에서 분석해줘.\n"
@@ -145,6 +183,44 @@ def get_analysis_prompt(lang):
     return (get_food_analysis_prompt_json(lang), get_advice_prompt(lang))
 
 
+# 단일 호출 비전 분석: 4단계 소견을 JSON "advice" 객체의 네 필드로 받는다 (순서 = 4단계 순서)
+ADVICE_SECTION_KEYS = ("menu_check", "venue_tips", "eating_order", "extra_notes")
+
+_ADVICE_SECTION_TITLES = {
+    "KO": ("사진 속 메뉴 확인", "장소 유추 및 실전 메뉴 꿀팁", "권장 식사 순서", "그밖에 부가 설명"),
+    "EN": ("Menu in the photo", "Venue and practical tips", "Recommended eating order", "Additional notes"),
+    "ZH": ("照片中的菜单", "场所推断与实用建议", "推荐进食顺序", "其他说明"),
+    "JA": ("写真のメニュー確認", "場所の推測と実践的なヒント", "推奨する食べる順序", "その他"),
+    "HI": ("Photo mein menu", "Venue aur tips", "Khane ka recommended order", "Extra notes"),
+}
+
+
+def get_advice_section_titles(lang):
+    """4단계 소견 제목 (ADVICE_SECTION_KEYS 순서). 단일 호출 응답을 기존 소견 텍스트 형식으로 조립할 때 사용."""
+    return _ADVICE_SECTION_TITLES.get(lang, _ADVICE_SECTION_TITLES["EN"])
+
+
+def get_combined_analysis_prompt(lang):
+    """
+    단일 호출 비전 분석용: 음식 items·total_carbs 와 4단계 소견을 JSON 하나로 받는 프롬프트.
+    response_schema 와 함께 사용 (이미지 1회 업로드). 실패 시 get_analysis_prompt 의 2회 호출로 폴백.
+    """
+    if lang == "KO":
+        bridge = (
+            "추가로, 아래 4단계 조언을 같은 JSON 객체의 \"advice\" 필드에 작성하라.\n"
+            "advice = {\"menu_check\": 1단계, \"venue_tips\": 2단계, \"eating_order\": 3단계, \"extra_notes\": 4단계}\n"
+            "각 값에는 번호·제목 없이 본문만 쓴다. 본문 안의 줄바꿈은 \\n 으로 이스케이프한다."
+        )
+    else:
+        bridge = (
+            "Additionally, write the 4-section advice below into the \"advice\" field of the same JSON object.\n"
+            "advice = {\"menu_check\": section 1, \"venue_tips\": section 2, \"eating_order\": section 3, \"extra_notes\": section 4}\n"
+            "Write only the body of each section (no number or heading). Escape line breaks inside strings as \\n."
+        )
+    # bridge 를 마지막에 두어 소견 프롬프트의 "번호와 제목" 지시보다 우선하게 한다
+    return get_food_analysis_prompt_json(lang) + "\n\n" + get_advice_prompt(lang) + "\n\n" + bridge
+
+
 # 식전 인사이트: Gemini systemInstruction — 1타 헬스 코치 페르소나·JSON 스키마·필드 규칙
 PRE_MEAL_INSIGHTS_SYSTEM_PROMPT = """너는 지루한 영양사가 아니라, 사용자의 도파민을 자극하고 혈당 방어를 돕는 1타 헬스 코치다.
 공포 마케팅·비난·죄책감 유발은 금지. 응답은 반드시 JSON 객체 하나만 (설명·마크다운·코드펜스 금지).
@@ -264,3 +340,52 @@ def get_post_meal_feedback_user_prompt(menu: str, glucose_value: int, meal_slot:
 - 식전에 먹은 메뉴: {menu!r}
 - 끼니: {meal_slot!r}
 - 식후 혈당 측정값: {glucose_value} mg/dL"""
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 식후 혈당 로컬 채점 — 위 POST_MEAL_FEEDBACK_SYSTEM_PROMPT 의 구간표와 반드시 같게 유지.
+# 숫자 필드(stress_score_change·is_success)는 LLM 을 기다리지 않고 여기서 즉시 계산한다.
+# ──────────────────────────────────────────────────────────────────────────────
+# (이 값 미만이면, 피로도 변화, 피드백 구간) — 마지막 항목은 상한 없음
+POST_MEAL_STRESS_BANDS = (
+    (90, -15, "perfect"),
+    (110, -10, "success"),
+    (140, -5, "success"),
+    (160, 10, "mild"),
+    (180, 15, "mild"),
+    (200, 20, "moderate"),
+    (None, 25, "high"),
+)
+POST_MEAL_SUCCESS_THRESHOLD = 140
+
+# LLM 응답이 늦거나 실패할 때 쓰는 구간별 기본 피드백
+_POST_MEAL_TEMPLATE_MESSAGES = {
+    "perfect": "완벽 방어! 🎉 췌장이 감격의 눈물을 흘리고 있어요. 오늘 식사 전략 그대로 다음 끼니도 가봅시다!",
+    "success": "방어 성공! 👏 혈당을 안정적으로 지켜냈어요. 채소·단백질 먼저 먹는 습관, 그대로 유지해 주세요.",
+    "mild": "살짝 스파이크가 왔어요 😅 지금 바로 15분 빠르게 걷기 퀘스트 시작! 물 한 잔도 함께 드세요.",
+    "moderate": "혈당이 꽤 올랐어요 ⚠️ 15분 걷기 + 물 한 컵 + 가벼운 스쿼트 10회로 바로 방어해 봅시다!",
+    "high": "경보 발령! 🚨 혈당이 200을 넘었어요. 지금 산책 20분, 물 충분히, 스쿼트 10회 세트를 꼭 해 주세요.",
+}
+
+
+def score_post_meal_glucose(glucose_value) -> dict:
+    """식후 혈당 → {"stress_score_change", "is_success", "band"} (결정적, 네트워크 없음)."""
+    try:
+        g = int(round(float(glucose_value)))
+    except (TypeError, ValueError):
+        g = 0
+    change, band = POST_MEAL_STRESS_BANDS[-1][1], POST_MEAL_STRESS_BANDS[-1][2]
+    for upper, delta, name in POST_MEAL_STRESS_BANDS:
+        if upper is None or g < upper:
+            change, band = delta, name
+            break
+    return {
+        "stress_score_change": change,
+        "is_success": g < POST_MEAL_SUCCESS_THRESHOLD,
+        "band": band,
+    }
+
+
+def get_post_meal_template_message(band: str) -> str:
+    """구간별 기본 피드백 문구 (모델 지연·실패 시 대체용)."""
+    return _POST_MEAL_TEMPLATE_MESSAGES.get(band, _POST_MEAL_TEMPLATE_MESSAGES["success"])
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+NutriSort AI - Gemini 구조화 응답 스키마와 공용 디코더.
+
+작업마다(식전 인사이트·식후 피드백·메뉴 이름·음식 분석·단일 호출 분석) 응답 스키마를 한 곳에 정의한다.
+  - to_schema(): GenerateContentConfig(response_schema=...) 로 넘겨 모델이 스키마대로만 답하게 하고
+  - decode_response(): 응답(SDK response.parsed 또는 원문)을 같은 스키마로 검증·정규화한다.
+스키마를 강제하므로 해석 실패는 드물며, 실패해도 ResponseSchemaError 로 바로 올린다.
+해석 실패로 다음 후보 모델을 다시 호출하지 않는다 (호출 폴백은 모델 미존재·과부하·쿼터 초과만).
+"""
+
+import json
+import re
+
+from google.genai import types as gtypes
+
+from prompts import ADVICE_SECTION_KEYS
+
+_REQUIRED = object()
+_TYPES = {
+    "string": "STRING",
+    "integer": "INTEGER",
+    "number": "NUMBER",
+    "boolean": "BOOLEAN",
+    "object": "OBJECT",
+    "array": "ARRAY",
+}
+
+
+class ResponseSchemaError(ValueError):
+    """모델 응답이 스키마에 맞지 않음 (path 는 "$.items[2].name" 처럼 문제 위치)."""
+
+    def __init__(self, message: str, path: str = "$"):
+        super().__init__(f"{path}: {message}")
+        self.path = path
+
+
+def _to_int(v):
+    """정수 변환: 실수는 반올림, "약 30g" 같은 문자열은 숫자만 추린다. 불가하면 None."""
+    if v is None or isinstance(v, bool):
+        return None
+    if isinstance(v, int):
+        return v
+    if isinstance(v, float):
+        return int(round(v)) if v == v else None
+    s = str(v).strip()
+    if not s:
+        return None
+    try:
+        return int(round(float(s)))
+    except (TypeError, ValueError):
+        digits = "".join(c for c in s if c.isdigit() or c in ".-")
+        try:
+            return int(float(digits)) if digits else None
+        except (TypeError, ValueError):
+            return None
+
+
+def _to_float(v):
+    if v is None or isinstance(v, bool):
+        return None
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return f if f == f else None
+
+
+def _to_bool(v):
+    if isinstance(v, bool):
+        return v
+    if isinstance(v, (int, float)):
+        return bool(v)
+    s = str(v or "").strip().lower()
+    if s in ("true", "yes", "1", "예", "성공"):
+        return True
+    if s in ("false", "no", "0", "아니오", "실패", ""):
+        return False
+    return None
+
+
+class Field:
+    """
+    응답 필드 하나. kind 는 string|integer|number|boolean|object|array.
+    default 가 있으면 값이 없거나 변환할 수 없을 때 그 값을 쓰고, 없으면 ResponseSchemaError.
+    lo/hi 는 숫자 범위(벗어나면 잘라냄), max_len 은 문자열 길이 상한, nonempty 는 빈 문자열 거부.
+    array 는 items(Field), skip_invalid 면 맞지 않는 원소는 버리고 min_items 로 최소 개수 검사.
+    optional 이면 응답 스키마의 required 에서 빼 모델이 생략할 수 있게 한다 (생략하면 default).
+    """
+
+    def __init__(self, kind, *, default=_REQUIRED, lo=None, hi=None, max_len=None, nonempty=False,
+                 fields=None, items=None, skip_invalid=False, min_items=0, optional=False):
+        self.kind = kind
+        self.optional = optional and default is not _REQUIRED
+        self.default = default
+        self.lo = lo
+        self.hi = hi
+        self.max_len = max_len
+        self.nonempty = nonempty
+        self.fields = fields or {}
+        self.items = items
+        self.skip_invalid = skip_invalid
+        self.min_items = min_items
+        self._schema = None
+
+    @property
+    def required(self) -> bool:
+        return self.default is _REQUIRED
+
+    def to_schema(self):
+        """gtypes.Schema 로 변환 (response_schema 용, 한 번만 만들어 재사용). optional 이 아닌 필드는 required 로 요청한다."""
+        if self._schema is None:
+            kw = {"type": getattr(gtypes.Type, _TYPES[self.kind])}
+            if self.kind == "object":
+                kw["properties"] = {k: f.to_schema() for k, f in self.fields.items()}
+                kw["required"] = [k for k, f in self.fields.items() if not f.optional]
+            elif self.kind == "array":
+                kw["items"] = self.items.to_schema()
+            self._schema = gtypes.Schema(**kw)
+        return self._schema
+
+    def _missing(self, path, why):
+        if self.required:
+            raise ResponseSchemaError(why, path)
+        return self.default
+
+    def decode(self, value, path="$"):
+        if value is None:
+            return self._missing(path, "값이 없습니다")
+        if self.kind == "object":
+            if not isinstance(value, dict):
+                raise ResponseSchemaError("객체가 아닙니다", path)
+            return {k: f.decode(value.get(k), f"{path}.{k}") for k, f in self.fields.items()}
+        if self.kind == "array":
+            if not isinstance(value, list):
+                raise ResponseSchemaError("배열이 아닙니다", path)
+            out = []
+            for i, v in enumerate(value):
+                try:
+                    out.append(self.items.decode(v, f"{path}[{i}]"))
+                except ResponseSchemaError:
+                    if not self.skip_invalid:
+                        raise
+            if len(out) < self.min_items:
+                raise ResponseSchemaError(f"항목이 {self.min_items}개 미만입니다", path)
+            return out
+        if self.kind == "string":
+            s = str(value).strip()
+            if self.max_len:
+                s = s[: self.max_len]
+            if self.nonempty and not s:
+                return self._missing(path, "빈 문자열입니다")
+            return s
+        conv = {"integer": _to_int, "number": _to_float, "boolean": _to_bool}[self.kind](value)
+        if conv is None:
+            return self._missing(path, f"{self.kind} 로 변환할 수 없습니다: {value!r}")
+        if self.lo is not None:
+            conv = max(self.lo, conv)
+        if self.hi is not None:
+            conv = min(self.hi, conv)
+        return conv
+
+
+def _strip_fences(text: str) -> str:
+    fence = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", text, re.IGNORECASE)
+    return fence.group(1).strip() if fence else text
+
+
+def load_json_text(text):
+    """
+    응답 원문 → JSON 값. 스키마 강제 응답은 그대로 json.loads 되며,
+    스키마를 쓰지 않은 응답(구 모델·폴백 경로)만 코드펜스·앞뒤 잡담을 한 번 걷어내고 첫 객체를 읽는다.
+    """
+    s = str(text or "").strip()
+    if not s:
+        raise ResponseSchemaError("모델 응답이 비어 있습니다")
+    try:
+        return json.loads(s)
+    except json.JSONDecodeError:
+        pass
+    s = _strip_fences(s)
+    start = s.find("{")
+    if start < 0:
+        raise ResponseSchemaError("JSON 객체가 없습니다")
+    try:
+        return json.JSONDecoder().raw_decode(s, start)[0]
+    except json.JSONDecodeError as e:
+        raise ResponseSchemaError(f"JSON 해석 실패: {e.msg}")
+
+
+def decode_response(response, schema: Field):
+    """
+    SDK 응답 객체·원문 문자열·이미 파싱된 dict → 스키마로 검증·정규화한 값.
+    response_schema 를 넘긴 호출은 SDK 가 채운 response.parsed 를 우선 사용한다.
+    """
+    if isinstance(response, (dict, list)):
+        data = response
+    elif isinstance(response, str):
+        data = load_json_text(response)
+    else:
+        data = getattr(response, "parsed", None)
+        if not isinstance(data, (dict, list)):
+            data = load_json_text(getattr(response, "text", None))
+    return schema.decode(data)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 작업별 응답 스키마
+# ──────────────────────────────────────────────────────────────────────────────
+PRE_MEAL_INSIGHTS_SCHEMA = Field("object", fields={
+    "mission": Field("string"),
+    "analysis": Field("string"),
+    "next_meal": Field("string"),
+    "added_stress": Field("integer", default=0, lo=0, hi=30),
+})
+
+# 숫자 필드는 호출부에서 로컬 채점 값으로 덮어쓰므로 기본값만 둔다
+POST_MEAL_FEEDBACK_SCHEMA = Field("object", fields={
+    "feedback_message": Field("string", nonempty=True),
+    "stress_score_change": Field("integer", default=0, lo=-15, hi=30),
+    "is_success": Field("boolean", default=False),
+})
+
+MENU_NAME_SCHEMA = Field("object", fields={
+    "menu_name": Field("string", nonempty=True, max_len=120),
+})
+
+# 음식 항목: 이름 없는 항목만 버린다. 기준표에 있는 음식은 수치를 모두 덮어쓰므로 gi·영양 수치는 생략 가능
+# (프롬프트가 기준표 밖 음식만 요청). 빠지거나 이상한 수치는 가짜 기본값 대신 None 으로 두고,
+# 기준표에도 없으면 food_analysis 가 해석 실패로 처리한다 (GI 50·0g 이 실제 값처럼 저장되지 않게)
+FOOD_ITEM_SCHEMA = Field("object", fields={
+    "name": Field("string", nonempty=True),
+    # 인분 배수: 기준표에 있는 음식은 수치를 기준표 1인분 × portion 으로 채움
+    "portion": Field("number", default=1.0, lo=0.25, hi=4.0),
+    "gi": Field("integer", default=None, lo=0, hi=100, optional=True),
+    "carbs": Field("integer", default=None, lo=0, optional=True),
+    "protein": Field("integer", default=None, lo=0, optional=True),
+    "fat": Field("integer", default=None, lo=0, optional=True),
+    "kcal": Field("integer", default=None, lo=0, optional=True),
+    "signal": Field("string", default="노랑", nonempty=True),
+    "order": Field("integer", default=99, lo=1),
+})
+
+FOOD_ANALYSIS_SCHEMA = Field("object", fields={
+    # 없으면 항목 carbs 합 (기준표 음식이 있으면 어차피 다시 계산)
+    "total_carbs": Field("integer", default=None, lo=0, optional=True),
+    "items": Field("array", items=FOOD_ITEM_SCHEMA, skip_invalid=True, min_items=1),
+})
+
+ADVICE_SCHEMA = Field("object", fields={k: Field("string", default="") for k in ADVICE_SECTION_KEYS})
+
+# 단일 호출 비전 분석: 음식 items·total_carbs + 4단계 소견
+COMBINED_ANALYSIS_SCHEMA = Field("object", fields={
+    **FOOD_ANALYSIS_SCHEMA.fields,
+    "advice": ADVICE_SCHEMA,
+})
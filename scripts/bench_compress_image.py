@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+업로드 사진 압축 벤치마크: 이전 compress_image(화질 12씩 낮추며 매번 15% 리샘플) vs
+image_pipeline.encode_jpeg_to_size(한 번 리사이즈 + 화질 이분 탐색).
+
+휴대폰 원본 사진들로 두 방식을 같은 조건(최대 1024px·500KB)에서 돌려
+  - 처리 시간(반복 중앙값)·JPEG 인코딩 횟수·리샘플 횟수
+  - 결과 크기(KB)·해상도·화질
+  - 정확한 LANCZOS 로 1024px 에 맞춘 기준 이미지 대비 PSNR(dB, 높을수록 원본에 가까움)
+을 비교한다. --max-kb 를 낮추면 목표를 넘는 사진(탐색 경로) 비중을 늘려 볼 수 있다.
+
+사용법:
+  python scripts/bench_compress_image.py ~/phone_photos
+  python scripts/bench_compress_image.py ~/phone_photos --max-kb 200 --repeat 5 --report out.json
+"""
+import argparse
+import io
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+# 프로젝트 루트를 path에 추가
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+_ROOT = os.path.dirname(_SCRIPT_DIR)
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+from PIL import Image, ImageChops, ImageStat  # noqa: E402
+
+from image_pipeline import encode_jpeg_to_size  # noqa: E402
+
+_IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def _collect_images(paths):
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            for name in sorted(os.listdir(p)):
+                if name.lower().endswith(_IMAGE_EXTS):
+                    files.append(os.path.join(p, name))
+        elif os.path.isfile(p):
+            files.append(p)
+    return files
+
+
+def _legacy_compress(img, max_size_kb=500, max_edge=1024):
+    """이전 app.compress_image 동작 그대로 (비교용). (이미지, 바이트, 화질, 인코딩 수, 리샘플 수)."""
+    if img.mode in ("RGBA", "P"):
+        img = img.convert("RGB")
+    w, h = img.size
+    resamples = 0
+    if w > max_edge or h > max_edge:
+        ratio = min(max_edge / w, max_edge / h)
+        img = img.resize((max(1, int(w * ratio)), max(1, int(h * ratio))), Image.Resampling.LANCZOS)
+        resamples += 1
+    quality = 88
+    encodes = 0
+    while True:
+        output = io.BytesIO()
+        img.save(output, format="JPEG", quality=quality)
+        encodes += 1
+        if len(output.getvalue()) / 1024 <= max_size_kb or quality <= 25:
+            return Image.open(io.BytesIO(output.getvalue())), output.getvalue(), quality, encodes, resamples
+        quality -= 12
+        img = img.resize((max(1, int(img.width * 0.85)), max(1, int(img.height * 0.85))), Image.Resampling.LANCZOS)
+        resamples += 1
+
+
+def _new_compress(img, max_size_kb=500, max_edge=1024):
+    enc = encode_jpeg_to_size(img, max_kb=max_size_kb, max_edge=max_edge)
+    w, h = img.size
+    # 한 번 리사이즈 + (최저 화질로도 넘칠 때만) 한 번 더
+    resized = w > max_edge or h > max_edge
+    resamples = int(resized) + int(max(enc.image.size) < (max_edge if resized else max(w, h)))
+    return enc.image, enc.data, enc.quality, enc.encodes, resamples
+
+
+def _psnr(out, reference):
+    """기준 이미지 대비 PSNR. 해상도가 다르면 결과를 기준 크기로 키워 비교 (줄어든 만큼 손실로 잡힌다)."""
+    out = out.convert("RGB")
+    if out.size != reference.size:
+        out = out.resize(reference.size, Image.Resampling.LANCZOS)
+    rms = ImageStat.Stat(ImageChops.difference(out, reference)).rms
+    mse = sum(r * r for r in rms) / len(rms)
+    return round(10 * math.log10(255 * 255 / mse), 2) if mse > 0 else 99.0
+
+
+def _measure(fn, src, args):
+    walls = []
+    out = None
+    for _ in range(max(1, args.repeat)):
+        t0 = time.perf_counter()
+        out = fn(src, args.max_kb, args.max_edge)
+        walls.append(time.perf_counter() - t0)
+    img, data, quality, encodes, resamples = out
+    return {
+        "ms": round(statistics.median(walls) * 1000, 1),
+        "kb": round(len(data) / 1024, 1),
+        "size": list(img.size),
+        "quality": quality,
+        "encodes": encodes,
+        "resamples": resamples,
+        "_img": img,
+    }
+
+
+def _summary(rows, key, max_kb):
+    vals = [r[key] for r in rows]
+    return {
+        "ms_mean": round(statistics.mean(v["ms"] for v in vals), 1),
+        "ms_p50": round(statistics.median(v["ms"] for v in vals), 1),
+        "ms_max": max(v["ms"] for v in vals),
+        "kb_mean": round(statistics.mean(v["kb"] for v in vals), 1),
+        "encodes_mean": round(statistics.mean(v["encodes"] for v in vals), 2),
+        "encodes_max": max(v["encodes"] for v in vals),
+        "resamples_mean": round(statistics.mean(v["resamples"] for v in vals), 2),
+        "psnr_mean": round(statistics.mean(v["psnr"] for v in vals), 2),
+        "over_limit": sum(1 for v in vals if v["kb"] > max_kb),
+    }
+
+
+def run(args) -> dict:
+    files = _collect_images(args.paths)
+    if not files:
+        raise RuntimeError("비교할 사진이 없습니다.")
+    rows = []
+    for path in files:
+        src = Image.open(path)
+        src.load()
+        # 비교 기준: 정확한 LANCZOS 로 긴 변만 맞춘 이미지 (압축 손실 없음)
+        rgb = src.convert("RGB")
+        ratio = min(1.0, args.max_edge / max(rgb.size))
+        reference = rgb.resize((max(1, int(rgb.width * ratio)), max(1, int(rgb.height * ratio))), Image.Resampling.LANCZOS)
+        row = {
+            "image": os.path.basename(path),
+            "source_size": list(src.size),
+            "source_kb": round(os.path.getsize(path) / 1024, 1),
+        }
+        for name, fn in (("legacy", _legacy_compress), ("new", _new_compress)):
+            res = _measure(fn, src, args)
+            res["psnr"] = _psnr(res.pop("_img"), reference)
+            row[name] = res
+        rows.append(row)
+        print(
+            f"  {row['image']}: legacy {row['legacy']['ms']}ms/{row['legacy']['encodes']}회 → "
+            f"new {row['new']['ms']}ms/{row['new']['encodes']}회",
+            file=sys.stderr,
+        )
+    legacy, new = _summary(rows, "legacy", args.max_kb), _summary(rows, "new", args.max_kb)
+    return {
+        "images": len(files),
+        "max_kb": args.max_kb,
+        "max_edge": args.max_edge,
+        "repeat": args.repeat,
+        "legacy": legacy,
+        "new": new,
+        "speedup_mean": round(legacy["ms_mean"] / new["ms_mean"], 2) if new["ms_mean"] else None,
+        "rows": rows,
+    }
+
+
+def _print_table(result) -> None:
+    cols = [
+        ("method", 8), ("ms_mean", 9), ("ms_p50", 8), ("ms_max", 8), ("kb_mean", 9), ("encodes_mean", 13),
+        ("encodes_max", 12), ("resamples_mean", 15), ("psnr_mean", 10), ("over_limit", 10),
+    ]
+    print("".join(c.ljust(w) for c, w in cols))
+    for name in ("legacy", "new"):
+        s = result[name]
+        vals = [name] + [s.get(c) for c, _ in cols[1:]]
+        print("".join(str(v).ljust(w) for v, (_, w) in zip(vals, cols)))
+    print(
+        f"(사진 {result['images']}장, 목표 {result['max_kb']}KB·{result['max_edge']}px, "
+        f"반복 {result['repeat']}회 중앙값, 평균 {result['speedup_mean']}배)"
+    )
+
+
+def _parse_args(argv=None):
+    p = argparse.ArgumentParser(description="이전 compress_image 와 한 번 리사이즈·화질 이분 탐색 인코더 비교")
+    p.add_argument("paths", nargs="+", help="사진 파일 또는 사진이 든 디렉터리")
+    p.add_argument("--max-kb", type=float, default=500, help="목표 최대 크기 (KB, 앱 기본 500)")
+    p.add_argument("--max-edge", type=int, default=1024, help="최대 긴 변 (px, 앱 기본 1024)")
+    p.add_argument("--repeat", type=int, default=3, help="사진·방식마다 반복 횟수 (시간은 중앙값)")
+    p.add_argument("--report", help="사진별 결과까지 포함한 JSON 리포트 저장 경로")
+    return p.parse_args(argv)
+
+
+def main():
+    args = _parse_args()
+    try:
+        result = run(args)
+    except Exception as e:
+        print(f"[압축 벤치] 실패: {e}", file=sys.stderr)
+        sys.exit(1)
+    _print_table(result)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as fp:
+            json.dump(result, fp, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
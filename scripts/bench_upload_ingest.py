@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+업로드 수신 단계 메모리·시간 측정: 전체 디코딩(Image.open → encode_jpeg_to_size) vs
+image_pipeline.open_upload(JPEG draft 축소 디코딩 + EXIF 방향) → encode_jpeg_to_size.
+
+사진마다 방식별로 새 프로세스를 띄워, import 를 마친 뒤의 RSS 와 처리 후 최대 RSS(ru_maxrss)의 차이를
+업로드 1건의 최대 추가 메모리로 잡는다 (같은 프로세스에서 재면 앞선 할당이 섞임).
+
+사용법:
+  python scripts/bench_upload_ingest.py ~/phone_photos
+  python scripts/bench_upload_ingest.py a.jpg b.jpg --report out.json
+
+POSIX 전용 (resource 모듈).
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+# 프로젝트 루트를 path에 추가
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+_ROOT = os.path.dirname(_SCRIPT_DIR)
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+_IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+_METHODS = ("full", "draft")
+
+
+def _collect_images(paths):
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            for name in sorted(os.listdir(p)):
+                if name.lower().endswith(_IMAGE_EXTS):
+                    files.append(os.path.join(p, name))
+        elif os.path.isfile(p):
+            files.append(p)
+    return files
+
+
+def _max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 는 KB, macOS 는 바이트
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _child(method: str, path: str) -> None:
+    """한 방식으로 한 장 처리하고 결과 JSON 한 줄 출력 (부모가 새 프로세스로 호출)."""
+    from PIL import Image
+
+    from image_pipeline import encode_jpeg_to_size, open_upload
+
+    base = _max_rss_mb()
+    t0 = time.perf_counter()
+    with open(path, "rb") as fp:
+        if method == "full":
+            src = Image.open(fp)
+            src.load()
+            decoded = src.size
+        else:
+            src = open_upload(fp)
+            decoded = src.size
+        enc = encode_jpeg_to_size(src)
+    wall = time.perf_counter() - t0
+    print(json.dumps({
+        "decoded": list(decoded),
+        "output": list(enc.image.size),
+        "kb": round(len(enc.data) / 1024, 1),
+        "ms": round(wall * 1000, 1),
+        "peak_rss_mb": round(_max_rss_mb() - base, 1),
+    }))
+
+
+def _run_child(method, path):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", method, path],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def run(args) -> dict:
+    files = _collect_images(args.paths)
+    if not files:
+        raise RuntimeError("측정할 사진이 없습니다.")
+    rows = []
+    for path in files:
+        row = {"image": os.path.basename(path), "source_kb": round(os.path.getsize(path) / 1024, 1)}
+        for method in _METHODS:
+            row[method] = _run_child(method, path)
+        rows.append(row)
+        print(
+            f"  {row['image']}: full {row['full']['peak_rss_mb']}MB/{row['full']['ms']}ms → "
+            f"draft {row['draft']['peak_rss_mb']}MB/{row['draft']['ms']}ms",
+            file=sys.stderr,
+        )
+    summary = {}
+    for method in _METHODS:
+        vals = [r[method] for r in rows]
+        summary[method] = {
+            "peak_rss_mb_mean": round(statistics.mean(v["peak_rss_mb"] for v in vals), 1),
+            "peak_rss_mb_max": max(v["peak_rss_mb"] for v in vals),
+            "ms_mean": round(statistics.mean(v["ms"] for v in vals), 1),
+            "ms_max": max(v["ms"] for v in vals),
+        }
+    return {"images": len(files), "summary": summary, "rows": rows}
+
+
+def _print_table(result) -> None:
+    cols = [("method", 8), ("peak_rss_mb_mean", 18), ("peak_rss_mb_max", 17), ("ms_mean", 9), ("ms_max", 8)]
+    print("".join(c.ljust(w) for c, w in cols))
+    for name, s in result["summary"].items():
+        vals = [name] + [s.get(c) for c, _ in cols[1:]]
+        print("".join(str(v).ljust(w) for v, (_, w) in zip(vals, cols)))
+    print(f"(사진 {result['images']}장, 업로드 1건당 import 이후 추가 최대 RSS)")
+
+
+def _parse_args(argv=None):
+    p = argparse.ArgumentParser(description="업로드 수신 단계 전체 디코딩 vs draft 축소 디코딩 메모리·시간 비교")
+    p.add_argument("paths", nargs="*", help="사진 파일 또는 사진이 든 디렉터리")
+    p.add_argument("--report", help="사진별 결과까지 포함한 JSON 리포트 저장 경로")
+    p.add_argument("--child", nargs=2, metavar=("METHOD", "PATH"), help=argparse.SUPPRESS)
+    return p.parse_args(argv)
+
+
+def main():
+    args = _parse_args()
+    if args.child:
+        _child(*args.child)
+        return
+    try:
+        result = run(args)
+    except Exception as e:
+        print(f"[업로드 벤치] 실패: {e}", file=sys.stderr)
+        sys.exit(1)
+    _print_table(result)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as fp:
+            json.dump(result, fp, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
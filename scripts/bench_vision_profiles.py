@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+비전 입력 프로필 벤치마크.
+
+같은 식단 사진들을 프로필(display·tile768·plate768·tile384)별로 전처리해 Gemini 음식 분석을 호출하고
+  - 페이로드 크기·추정 이미지 토큰·실제 prompt 토큰(usage_metadata)·지연 시간
+  - 기준 프로필(기본 display) 대비 음식 인식 일치도(정규화 음식명 Jaccard)·총 탄수화물 차이
+를 표로 비교한다. 지연 대비 정확도가 가장 좋은 프로필을 GEMINI_VISION_INPUT_PROFILE 로 고르는 데 쓴다.
+
+사용법:
+  python scripts/bench_vision_profiles.py ~/meal_photos                    # 전체 프로필 비교
+  python scripts/bench_vision_profiles.py ~/meal_photos --offline          # API 호출 없이 크기·추정 토큰만
+  python scripts/bench_vision_profiles.py a.jpg b.jpg --profiles display,tile768 --repeat 3 --report out.json
+
+필요 환경 변수: GEMINI_API_KEY (--offline 이면 불필요). (선택) GEMINI_VISION_MODEL
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+# 프로젝트 루트를 path에 추가
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+_ROOT = os.path.dirname(_SCRIPT_DIR)
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+from google.genai import types as gtypes  # noqa: E402
+
+from firebase_db import _get_secret  # noqa: E402
+from food_analysis import parse_food_analysis_json  # noqa: E402
+from food_index import normalize_food_name  # noqa: E402
+from gemini_client import (  # noqa: E402
+    ENCODED_JPEG_INFO_KEY,
+    RetryPolicy,
+    gemini_generate,
+    get_gemini_client,
+    image_part,
+    preferred_model,
+)
+from image_pipeline import encode_jpeg_to_size, open_upload  # noqa: E402
+from prompts import get_food_analysis_prompt_json  # noqa: E402
+from response_schemas import FOOD_ANALYSIS_SCHEMA  # noqa: E402
+from vision_input import VISION_INPUT_PROFILES, estimate_image_tokens, vision_input_image  # noqa: E402
+
+_IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+# 프로필 간 비교가 목적이므로 폴백 없이 한 모델만, 일시 오류만 짧게 재시도
+BENCH_RETRY = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=8.0, deadline_sec=60.0)
+
+
+def _collect_images(paths):
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            for name in sorted(os.listdir(p)):
+                if name.lower().endswith(_IMAGE_EXTS):
+                    files.append(os.path.join(p, name))
+        elif os.path.isfile(p):
+            files.append(p)
+    return files
+
+
+def _display_image(path):
+    """앱 업로드 수신과 같은 표시용 이미지 (ImageArtifact.display)."""
+    return encode_jpeg_to_size(open_upload(path)).image
+
+
+def _payload_bytes(img) -> int:
+    data = img.info.get(ENCODED_JPEG_INFO_KEY)
+    if data:
+        return len(data)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=85)
+    return len(buf.getvalue())
+
+
+def _analyze(client, model, food_prompt, img):
+    """(지연 초, prompt 토큰, 정규화 음식명 집합 또는 None, 총 탄수화물 또는 None)."""
+    part = image_part(img)
+    config = gtypes.GenerateContentConfig(
+        response_mime_type="application/json", response_schema=FOOD_ANALYSIS_SCHEMA.to_schema()
+    )
+
+    def _call():
+        t0 = time.monotonic()
+        response = gemini_generate(client, model=model, contents=[food_prompt, part], config=config)
+        return time.monotonic() - t0, response
+
+    wall, response = BENCH_RETRY.call(_call)
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None) if usage is not None else None
+    parsed = parse_food_analysis_json(response)
+    if not parsed:
+        return wall, prompt_tokens, None, None
+    sorted_items, total_carbs = parsed
+    names = {normalize_food_name(item[0]) for item in sorted_items} - {""}
+    return wall, prompt_tokens, names, total_carbs
+
+
+def _jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _mean(vals):
+    vals = [v for v in vals if v is not None]
+    return round(statistics.mean(vals), 3) if vals else None
+
+
+def _median(vals):
+    vals = [v for v in vals if v is not None]
+    return round(statistics.median(vals), 3) if vals else None
+
+
+def run(args) -> dict:
+    files = _collect_images(args.paths)
+    if not files:
+        raise RuntimeError("비교할 사진이 없습니다.")
+    profiles = [p.strip() for p in args.profiles.split(",") if p.strip()]
+    unknown = [p for p in profiles if p not in VISION_INPUT_PROFILES]
+    if unknown:
+        raise RuntimeError(f"알 수 없는 프로필: {', '.join(unknown)}")
+    if args.reference not in profiles:
+        profiles.insert(0, args.reference)
+
+    client = model = food_prompt = None
+    if not args.offline:
+        api_key = _get_secret("GEMINI_API_KEY")
+        if not api_key:
+            raise RuntimeError("GEMINI_API_KEY가 설정되어 있지 않습니다.")
+        client = get_gemini_client(api_key, "vision")
+        model = preferred_model("GEMINI_VISION_MODEL")
+        food_prompt = get_food_analysis_prompt_json(args.lang)
+
+    rows = {p: [] for p in profiles}
+    print(f"[벤치] 사진 {len(files)}장 × 프로필 {len(profiles)}개 × {args.repeat}회 (모델: {model or 'offline'})", file=sys.stderr)
+    for path in files:
+        display = _display_image(path)
+        per_image = {}
+        for name in profiles:
+            t0 = time.monotonic()
+            img = vision_input_image(display, VISION_INPUT_PROFILES[name])
+            row = {
+                "image": os.path.basename(path),
+                "size": list(img.size),
+                "payload_kb": round(_payload_bytes(img) / 1024, 1),
+                "est_image_tokens": estimate_image_tokens(*img.size),
+                "preprocess_ms": round((time.monotonic() - t0) * 1000, 1),
+            }
+            if client is not None:
+                walls, tokens, names, carbs = [], None, None, None
+                for _ in range(max(1, args.repeat)):
+                    try:
+                        wall, tokens, names, carbs = _analyze(client, model, food_prompt, img)
+                    except Exception as e:
+                        print(f"  [실패] {row['image']} {name}: {e}", file=sys.stderr)
+                        names = carbs = None
+                        break
+                    walls.append(wall)
+                row.update({
+                    "latency_sec": _median(walls),
+                    "prompt_tokens": tokens,
+                    "parse_ok": names is not None,
+                    "foods": sorted(names) if names is not None else None,
+                    "total_carbs": carbs,
+                })
+            per_image[name] = row
+            rows[name].append(row)
+
+        ref = per_image[args.reference]
+        for name, row in per_image.items():
+            if client is None or row["foods"] is None or ref["foods"] is None:
+                row["agreement"] = row["carbs_diff"] = None
+                continue
+            row["agreement"] = round(_jaccard(set(row["foods"]), set(ref["foods"])), 3)
+            row["carbs_diff"] = abs((row["total_carbs"] or 0) - (ref["total_carbs"] or 0))
+
+    summary = {}
+    for name in profiles:
+        rs = rows[name]
+        prof = VISION_INPUT_PROFILES[name]
+        summary[name] = {
+            "max_side": prof.max_side,
+            "crop": prof.crop,
+            "quality": prof.quality,
+            "payload_kb": _mean(r["payload_kb"] for r in rs),
+            "est_image_tokens": _mean(r["est_image_tokens"] for r in rs),
+            "preprocess_ms": _mean(r["preprocess_ms"] for r in rs),
+        }
+        if client is not None:
+            summary[name].update({
+                "prompt_tokens": _mean(r["prompt_tokens"] for r in rs),
+                "latency_p50_sec": _median(r["latency_sec"] for r in rs),
+                "latency_mean_sec": _mean(r["latency_sec"] for r in rs),
+                "parse_rate": round(sum(1 for r in rs if r["parse_ok"]) / len(rs), 3),
+                "agreement": _mean(r["agreement"] for r in rs),
+                "carbs_diff": _mean(r["carbs_diff"] for r in rs),
+            })
+    return {"model": model, "reference": args.reference, "images": len(files), "profiles": summary, "rows": rows}
+
+
+def _print_table(result) -> None:
+    cols = [
+        ("profile", 10), ("payload_kb", 11), ("est_image_tokens", 17), ("prompt_tokens", 14),
+        ("latency_p50_sec", 16), ("parse_rate", 11), ("agreement", 10), ("carbs_diff", 11),
+    ]
+    print("".join(c.ljust(w) for c, w in cols))
+    for name, s in result["profiles"].items():
+        vals = [name] + [s.get(c) for c, _ in cols[1:]]
+        print("".join(("-" if v is None else str(v)).ljust(w) for v, (_, w) in zip(vals, cols)))
+    print(f"(agreement·carbs_diff 기준: {result['reference']}, 사진 {result['images']}장)")
+
+
+def _parse_args(argv=None):
+    p = argparse.ArgumentParser(description="비전 입력 프로필별 토큰·지연·인식 일치도 비교")
+    p.add_argument("paths", nargs="+", help="사진 파일 또는 사진이 든 디렉터리")
+    p.add_argument("--profiles", default=",".join(VISION_INPUT_PROFILES), help="비교할 프로필 (쉼표 구분)")
+    p.add_argument("--reference", default="display", choices=sorted(VISION_INPUT_PROFILES), help="일치도 기준 프로필")
+    p.add_argument("--repeat", type=int, default=1, help="사진·프로필마다 호출 횟수 (지연은 중앙값)")
+    p.add_argument("--offline", action="store_true", help="API 호출 없이 크기·추정 토큰·전처리 시간만")
+    p.add_argument("--lang", default="KO", help="분석 프롬프트 언어 (앱과 같은 KO 기본)")
+    p.add_argument("--report", help="사진별 결과까지 포함한 JSON 리포트 저장 경로")
+    return p.parse_args(argv)
+
+
+def main():
+    args = _parse_args()
+    try:
+        result = run(args)
+    except Exception as e:
+        print(f"[벤치] 실패: {e}", file=sys.stderr)
+        sys.exit(1)
+    _print_table(result)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as fp:
+            json.dump(result, fp, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gemini 경로 부하·지연 시험 (기본: 가짜 백엔드, 네트워크·실제 키 불필요).
+
+가상 사용자 N명이 스캐너(비전 분석, 비전 작업 실행기 경유)·식전 인사이트·식후 피드백을 섞어
+반복 실행한다. 호출 흐름은 앱과 같은 gemini_flows 함수를 그대로 부르므로 프롬프트·응답 스키마·
+후보 모델 폴백·재시도 정책·중복 호출 합치기·계측이 앱과 같다. (결과 캐시는 --use-cache 일 때만)
+흐름별 처리량·성공률·지연 분위수와 재시도·폴백 카운터, 작업 대기열·쿼터 입장 제어 지표를 출력한다.
+(NUTRISORT_GEMINI_RPM 을 낮추면 우선순위별 쿼터 대기·마감 초과 거절을 재현할 수 있다.)
+
+사용법:
+  python scripts/load_test_gemini.py --users 200 --duration 60
+  NUTRISORT_GEMINI_FAKE_LATENCY=lognormal:2.5,0.6 NUTRISORT_GEMINI_FAKE_ERRORS=503=0.05,429=0.02 \\
+      python scripts/load_test_gemini.py --users 300 --mix scan=2,pre=2,post=1
+  NUTRISORT_GEMINI_FAKE_MISSING_MODELS=gemini-2.5-flash python scripts/load_test_gemini.py   # 1순위 모델 NOT_FOUND
+  NUTRISORT_GEMINI_BACKEND=replay python scripts/load_test_gemini.py --images ~/meal_photos  # 녹화 재생
+
+백엔드 설정은 gemini_backends 참고 (NUTRISORT_GEMINI_BACKEND 기본값을 이 스크립트에서만 fake 로 둔다).
+"""
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+# 프로젝트 루트를 path에 추가
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+_ROOT = os.path.dirname(_SCRIPT_DIR)
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+# 백엔드 설정은 import 시점에 읽히므로 먼저 기본값을 둔다
+os.environ.setdefault("NUTRISORT_GEMINI_BACKEND", "fake")
+if os.environ["NUTRISORT_GEMINI_BACKEND"] in ("fake", "replay"):
+    os.environ.setdefault("GEMINI_API_KEY", "fake-key")
+
+from PIL import Image  # noqa: E402
+
+from gemini_client import MODEL_HEALTH, client_pool_stats, get_gemini_client  # noqa: E402
+from gemini_flows import (  # noqa: E402
+    generate_post_meal_feedback,
+    generate_pre_meal_insights,
+    run_vision_analysis,
+)
+from gemini_metrics import GEMINI_METRICS  # noqa: E402
+from gemini_quota import GEMINI_LIMITER  # noqa: E402
+from image_pipeline import ImageArtifact  # noqa: E402
+from jobs import VISION_JOBS, JobQueueFull  # noqa: E402
+
+_MENUS = ("김치찌개 백반", "제육덮밥", "연어 포케", "떡볶이 순대", "닭가슴살 샐러드", "비빔밥")
+_SLOTS = ("아침", "점심", "저녁")
+_LOCATIONS = ("집밥", "외식")
+
+
+def _scan(vision_client, img, use_cache):
+    job_id = VISION_JOBS.submit("vision", lambda progress: run_vision_analysis(vision_client, img, progress, use_cache))
+    # 앱의 진행률 fragment 처럼 완료될 때까지 폴링
+    while True:
+        job = VISION_JOBS.get(job_id)
+        if job is None or job.done:
+            break
+        time.sleep(0.1)
+    VISION_JOBS.claim(job_id)
+    if job is not None and job.state == "error":
+        raise job.error
+    return job.result if job is not None else None
+
+
+def _pre_meal(text_client, rng, use_cache):
+    return generate_pre_meal_insights(
+        text_client, rng.choice(_MENUS), rng.choice(_LOCATIONS), rng.choice(_SLOTS), rng.uniform(0, 80),
+        use_cache=use_cache,
+    )
+
+
+def _post_meal(text_client, rng):
+    return generate_post_meal_feedback(text_client, rng.choice(_MENUS), rng.randint(90, 220), rng.choice(_SLOTS))
+
+
+def _load_images(path):
+    """
+    --images 디렉터리의 JPEG 을 앱 업로드와 같은 ImageArtifact 로 (모델 입력 인코딩이 앱과 같아
+    재생 백엔드가 앱 녹화와 같은 지문을 만든다). 없으면 임의 잡음 사진 8장.
+    """
+    if path:
+        out = []
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith((".jpg", ".jpeg")):
+                with open(os.path.join(path, name), "rb") as f:
+                    out.append(ImageArtifact.from_upload(f))
+        if out:
+            return out
+    out = []
+    for _ in range(8):
+        buf = io.BytesIO()
+        Image.frombytes("RGB", (320, 240), os.urandom(320 * 240 * 3)).save(buf, format="JPEG", quality=85)
+        buf.seek(0)
+        out.append(ImageArtifact.from_upload(buf))
+    return out
+
+
+def _parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, w = part.partition("=")
+        if name.strip() in ("scan", "pre", "post"):
+            mix[name.strip()] = max(0.0, float(w or 1))
+    if not any(mix.values()):
+        raise RuntimeError(f"흐름 비율을 해석할 수 없습니다: {spec!r}")
+    return mix
+
+
+class _Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rows = []
+
+    def add(self, flow, ok, wall, error=None):
+        with self._lock:
+            self.rows.append((flow, ok, wall, error))
+
+
+def _quantile(sorted_vals, q):
+    if not sorted_vals:
+        return None
+    return round(sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))], 3)
+
+
+def _user_loop(uid, args, mix, images, results, stop_at):
+    rng = random.Random(args.seed * 100_003 + uid if args.seed is not None else None)
+    api_key = os.environ.get("GEMINI_API_KEY", "")
+    text_client = get_gemini_client(api_key, "text")
+    vision_client = get_gemini_client(api_key, "vision")
+    flows, weights = zip(*mix.items())
+    # 사용자마다 시작 시점을 흩어 동시 폭주를 피한다
+    time.sleep(rng.uniform(0, args.ramp_up))
+    done = 0
+    while time.monotonic() < stop_at and (not args.iterations or done < args.iterations):
+        flow = rng.choices(flows, weights)[0]
+        t0 = time.monotonic()
+        try:
+            if flow == "scan":
+                _scan(vision_client, rng.choice(images), args.use_cache)
+            elif flow == "pre":
+                _pre_meal(text_client, rng, args.use_cache)
+            else:
+                _post_meal(text_client, rng)
+        except JobQueueFull:
+            results.add(flow, False, time.monotonic() - t0, "queue_full")
+        except Exception as e:
+            results.add(flow, False, time.monotonic() - t0, type(e).__name__)
+        else:
+            results.add(flow, True, time.monotonic() - t0)
+        done += 1
+        time.sleep(rng.expovariate(1.0 / args.think_time) if args.think_time > 0 else 0)
+
+
+def run(args) -> dict:
+    mix = _parse_mix(args.mix)
+    images = _load_images(args.images)
+    results = _Results()
+    started = time.monotonic()
+    stop_at = started + args.duration
+    threads = [
+        threading.Thread(target=_user_loop, args=(i, args, mix, images, results, stop_at), daemon=True,
+                         name=f"user-{i}")
+        for i in range(args.users)
+    ]
+    print(
+        f"[부하] 백엔드={os.environ['NUTRISORT_GEMINI_BACKEND']} 사용자={args.users} "
+        f"시간={args.duration}s 비율={mix}",
+        file=sys.stderr,
+    )
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    flows = {}
+    for flow in sorted({r[0] for r in results.rows}):
+        rows = [r for r in results.rows if r[0] == flow]
+        walls = sorted(r[2] for r in rows if r[1])
+        errors = {}
+        for r in rows:
+            if not r[1]:
+                errors[r[3]] = errors.get(r[3], 0) + 1
+        flows[flow] = {
+            "count": len(rows),
+            "ok": len(walls),
+            "ok_rate": round(len(walls) / len(rows), 3) if rows else None,
+            "per_sec": round(len(rows) / elapsed, 2),
+            "p50_sec": _quantile(walls, 0.5),
+            "p95_sec": _quantile(walls, 0.95),
+            "p99_sec": _quantile(walls, 0.99),
+            "mean_sec": round(statistics.mean(walls), 3) if walls else None,
+            "errors": errors,
+        }
+    counters = GEMINI_METRICS.snapshot()["counters"]
+    return {
+        "backend": os.environ["NUTRISORT_GEMINI_BACKEND"],
+        "users": args.users,
+        "elapsed_sec": round(elapsed, 1),
+        "flows": flows,
+        "gemini_counters": {k: v for k, v in counters.items() if k.split(".")[0] in (
+            "retries", "fallback_hops", "parse_failures", "op_errors", "call_errors",
+        )},
+        "vision_jobs": VISION_JOBS.metrics(),
+        "model_health": MODEL_HEALTH.snapshot(),
+        "clients": client_pool_stats(),
+        "quota": GEMINI_LIMITER.stats(),
+    }
+
+
+def _parse_args(argv=None):
+    p = argparse.ArgumentParser(description="가짜·재생 Gemini 백엔드로 스캐너·식전·식후 흐름 부하 시험")
+    p.add_argument("--users", type=int, default=100, help="동시 가상 사용자 수")
+    p.add_argument("--duration", type=float, default=30.0, help="시험 시간(초)")
+    p.add_argument("--iterations", type=int, default=0, help="사용자당 최대 요청 수 (0 = 시간 제한까지)")
+    p.add_argument("--think-time", type=float, default=2.0, help="요청 사이 평균 대기(초, 지수 분포)")
+    p.add_argument("--ramp-up", type=float, default=5.0, help="사용자 시작 시점을 흩뿌릴 구간(초)")
+    p.add_argument("--mix", default="scan=1,pre=1,post=1", help="흐름 비율 (scan·pre·post)")
+    p.add_argument("--images", help="스캐너에 쓸 JPEG 디렉터리 (재생 백엔드용, 기본: 임의 잡음 사진)")
+    p.add_argument("--use-cache", action="store_true",
+                   help="앱처럼 비전·식전 인사이트 결과 캐시 사용 (기본: 매번 Gemini 경로를 거침)")
+    p.add_argument("--seed", type=int, help="사용자 행동 난수 시드")
+    p.add_argument("--report", help="결과 JSON 저장 경로")
+    return p.parse_args(argv)
+
+
+def main():
+    args = _parse_args()
+    try:
+        summary = run(args)
+    except Exception as e:
+        print(f"[부하] 실패: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as fp:
+            json.dump(summary, fp, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
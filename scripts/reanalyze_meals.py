@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+저장된 식단 사진 일괄 재분석 스크립트.
+
+음식 분석 프롬프트(get_food_analysis_prompt_json)나 점수 규칙이 바뀐 뒤, users/{uid}/meals 문서의
+sorted_items·blood_sugar_score 등을 현재 규칙으로 다시 계산한다.
+  - 식단 문서를 페이지 단위로 읽고(구간마다 체크포인트 저장), Storage 에서 사진을 내려받아
+  - client.aio 로 비전 분석을 호출하되 동시 실행 수는 --concurrency, 분당 요청 수는 앱과 같은
+    공용 쿼터(gemini_quota.GEMINI_LIMITER, batch 우선순위라 앱 요청에 항상 양보)로 제한하고
+  - 결과를 BulkWriter 로 되써서, 바뀐 날짜의 daily_summaries 합계를 식단 문서 기준으로 다시 계산한다.
+이미 현재 분석 버전(프롬프트·1순위 모델·입력 프로필)으로 분석된 문서(analysis_prompt_version)는 건너뛴다.
+소견(advice)은 그대로 둔다.
+
+사용법:
+  python scripts/reanalyze_meals.py --dry-run --limit 50      # 쓰기 없이 변경 내용만 확인
+  NUTRISORT_GEMINI_RPM=600 python scripts/reanalyze_meals.py --concurrency 16
+  python scripts/reanalyze_meals.py --uid <UID> --force         # 한 사용자만, 버전이 같아도 다시 분석
+  python scripts/reanalyze_meals.py --reset-checkpoint          # 처음부터 다시
+
+필요 환경 변수: GEMINI_API_KEY, FIREBASE_CREDENTIALS_JSON (또는 FIREBASE_* 개별 키).
+  (선택) FIREBASE_STORAGE_BUCKET, GEMINI_VISION_MODEL, GEMINI_VISION_INPUT_PROFILE
+  (선택) NUTRISORT_GEMINI_RPM·NUTRISORT_GEMINI_BURST: 분당 요청 수·순간 허용량 (앱과 같은 설정)
+  (선택) NUTRISORT_GEMINI_LIMITER_FILE 을 앱 서버와 같은 경로로 두면 같은 API 키 쿼터를 batch 우선순위로 나눠 쓴다.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+# 프로젝트 루트를 path에 추가
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+_ROOT = os.path.dirname(_SCRIPT_DIR)
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+from firebase_admin import firestore, storage  # noqa: E402
+from google.cloud.firestore import FieldPath  # noqa: E402
+from google.genai import types as gtypes  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from ai_cache import prompt_version  # noqa: E402
+from firebase_db import _blob_paths_for_meal_image, _get_secret, _init_firebase, sanitize_for_firestore  # noqa: E402
+from food_analysis import parse_food_analysis_json, score_food_items  # noqa: E402
+from gemini_client import (  # noqa: E402
+    ENCODED_JPEG_INFO_KEY,
+    RetryPolicy,
+    gemini_generate_async,
+    get_gemini_client,
+    model_fallback_chain,
+    preferred_model,
+    should_try_next_model,
+)
+from gemini_metrics import GEMINI_METRICS, gemini_operation  # noqa: E402
+from gemini_quota import GEMINI_LIMITER  # noqa: E402
+from prompts import get_food_analysis_prompt_json  # noqa: E402
+from response_schemas import FOOD_ANALYSIS_SCHEMA  # noqa: E402
+from vision_input import VISION_INPUT_PROFILES, get_vision_input_profile, vision_input_image  # noqa: E402
+
+_DEFAULT_CHECKPOINT = os.path.join(tempfile.gettempdir(), "nutrisort_reanalyze_meals.checkpoint.json")
+_OP_NAME = "batch_reanalysis"
+# 오프라인 배치: 사용자가 기다리지 않으므로 대화형보다 길게 재시도 (429·503 은 Retry-After 존중)
+BATCH_RETRY = RetryPolicy(max_attempts=5, base_delay=2.0, max_delay=30.0, deadline_sec=180.0)
+
+
+class Checkpoint:
+    """마지막으로 끝까지 반영한 문서 경로·다시 계산할 일별 합계 목록·누적 통계를 JSON 파일로 보관."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.last_path = None
+        self.dirty_days = set()
+        self.totals = {}
+
+    def load(self) -> "Checkpoint":
+        try:
+            with open(self.path, "r", encoding="utf-8") as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return self
+        self.last_path = data.get("last_path")
+        self.dirty_days = {tuple(d) for d in data.get("dirty_days", [])}
+        self.totals = dict(data.get("totals", {}))
+        return self
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fp:
+            json.dump(
+                {
+                    "last_path": self.last_path,
+                    "dirty_days": sorted(list(d) for d in self.dirty_days),
+                    "totals": self.totals,
+                    "saved_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                },
+                fp,
+                ensure_ascii=False,
+                indent=2,
+            )
+        os.replace(tmp, self.path)
+
+
+def _meal_uid(snap):
+    """users/{uid}/meals/{id} 문서면 uid, 다른 경로의 meals 컬렉션이면 None."""
+    user_ref = snap.reference.parent.parent
+    if user_ref is None or user_ref.parent.id != "users":
+        return None
+    return user_ref.id
+
+
+def _iter_meal_pages(db, uid, start_after_path, page_size):
+    """식단 문서를 문서 경로 순으로 page_size 개씩 읽는 제너레이터 (긴 스트림 타임아웃 회피)."""
+    if uid:
+        base = db.collection("users").document(str(uid)).collection("meals")
+    else:
+        base = db.collection_group("meals")
+    query = base.order_by(FieldPath.document_id())
+    cursor = db.document(start_after_path).get() if start_after_path else None
+    if cursor is not None and not cursor.exists:
+        raise RuntimeError(f"체크포인트 문서가 없습니다: {start_after_path} (--reset-checkpoint 로 처음부터)")
+    while True:
+        q = query.start_after(cursor) if cursor is not None else query
+        page = list(q.limit(page_size).stream())
+        if not page:
+            return
+        yield page
+        cursor = page[-1]
+
+
+def _download_meal_image(bucket, uid, snap, data):
+    """저장된 사진 바이트와 MIME. 후보 경로를 모두 시도해 없으면 (None, None)."""
+    for path in _blob_paths_for_meal_image(uid, snap.id, data, bucket.name):
+        blob = bucket.blob(path)
+        try:
+            payload = blob.download_as_bytes()
+        except Exception:
+            continue
+        if payload:
+            return payload, (blob.content_type or "image/jpeg")
+    return None, None
+
+
+def _model_input_bytes(image_bytes, mime_type, profile):
+    """저장된 사진 → 비전 입력 프로필 JPEG 바이트 (display 이거나 줄일 것이 없으면 원본 그대로)."""
+    if profile.max_side <= 0:
+        return image_bytes, mime_type
+    img = Image.open(io.BytesIO(image_bytes))
+    out = vision_input_image(img, profile)
+    if out is img:
+        return image_bytes, mime_type
+    return out.info[ENCODED_JPEG_INFO_KEY], "image/jpeg"
+
+
+async def _analyze_image(client, food_prompt, image_bytes, mime_type):
+    """
+    후보 모델 폴백 + BATCH_RETRY. (응답 원문, 응답 모델) 반환.
+    쿼터 입장은 gemini_generate_async 가 공용 GEMINI_LIMITER 에서 batch 우선순위(작업 이름 batch_)로 한다.
+    """
+    img_part = gtypes.Part.from_bytes(data=image_bytes, mime_type=mime_type)
+    config = gtypes.GenerateContentConfig(
+        response_mime_type="application/json", response_schema=FOOD_ANALYSIS_SCHEMA.to_schema()
+    )
+
+    async def _attempt():
+        last_err = None
+        for mm in model_fallback_chain("GEMINI_VISION_MODEL"):
+            try:
+                response = await gemini_generate_async(client, model=mm, contents=[food_prompt, img_part], config=config)
+                return (response.text or "").strip(), mm
+            except Exception as e:
+                last_err = e
+                if should_try_next_model(e):
+                    continue
+                raise
+        raise last_err or RuntimeError("사용 가능한 Gemini 비전 모델이 없습니다.")
+
+    return await BATCH_RETRY.call_async(_attempt)
+
+
+async def _process_meal(snap, *, client, bucket, food_prompt, prompt_ver, force, profile):
+    """문서 하나 → (결과 종류, 갱신 필드 dict 또는 None, 이전 점수 dict)."""
+    data = snap.to_dict() or {}
+    uid = _meal_uid(snap)
+    if uid is None:
+        return "skipped_path", None, data
+    if not force and data.get("analysis_prompt_version") == prompt_ver:
+        return "skipped_current", None, data
+    image_bytes, mime_type = await asyncio.to_thread(_download_meal_image, bucket, uid, snap, data)
+    if not image_bytes:
+        return "no_image", None, data
+    image_bytes, mime_type = await asyncio.to_thread(_model_input_bytes, image_bytes, mime_type, profile)
+    with gemini_operation(_OP_NAME) as op:
+        raw, model = await _analyze_image(client, food_prompt, image_bytes, mime_type)
+        parsed = parse_food_analysis_json(raw)
+        op.note_parse(bool(parsed))
+    if not parsed:
+        return "parse_failed", None, data
+    sorted_items, total_carbs = parsed
+    update = sanitize_for_firestore({"sorted_items": sorted_items, **score_food_items(sorted_items, total_carbs)})
+    update["analysis_prompt_version"] = prompt_ver
+    update["analysis_model"] = model
+    update["reanalyzed_at"] = firestore.SERVER_TIMESTAMP
+    return "updated", update, data
+
+
+def _recompute_daily_summary(db, uid, date_key):
+    """해당 날짜 식단 문서 합계로 daily_summaries 의 누적 필드를 덮어쓴다 (몇 번 실행해도 같은 결과)."""
+    meals = db.collection("users").document(str(uid)).collection("meals")
+    totals = {"total_carbs": 0, "total_protein": 0, "total_fat": 0, "spike_sum": 0, "meal_count": 0}
+    for snap in meals.where("date_key", "==", str(date_key)).stream():
+        d = snap.to_dict() or {}
+        totals["total_carbs"] += int(d.get("total_carbs", 0) or 0)
+        totals["total_protein"] += int(d.get("total_protein", 0) or 0)
+        totals["total_fat"] += int(d.get("total_fat", 0) or 0)
+        totals["spike_sum"] += int(d.get("estimated_spike", 0) or 0)
+        totals["meal_count"] += 1
+    totals["updated_at"] = firestore.SERVER_TIMESTAMP
+    return db.collection("users").document(str(uid)).collection("daily_summaries").document(str(date_key)), totals
+
+
+def _flush_summaries(db, dirty_days):
+    writer = db.bulk_writer()
+    for uid, date_key in sorted(dirty_days):
+        ref, totals = _recompute_daily_summary(db, uid, date_key)
+        writer.set(ref, totals, merge=True)
+    writer.close()
+
+
+class ThroughputReport:
+    """구간별·누적 처리량 (문서/초)과 결과 종류별 건수, Gemini 지연 분위수."""
+
+    def __init__(self, totals: dict):
+        self.started = time.monotonic()
+        self.counts = {}
+        self.prev_totals = dict(totals)
+
+    def add(self, kind: str) -> None:
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def summary(self) -> dict:
+        elapsed = max(1e-6, time.monotonic() - self.started)
+        done = sum(self.counts.values())
+        latency = GEMINI_METRICS.snapshot()["histograms"].get(f"op_latency_ms.{_OP_NAME}", {})
+        return {
+            "elapsed_sec": round(elapsed, 1),
+            "docs": done,
+            "docs_per_sec": round(done / elapsed, 2),
+            "docs_per_hour": int(done / elapsed * 3600),
+            "counts": dict(sorted(self.counts.items())),
+            "gemini_p50_ms": latency.get("p50"),
+            "gemini_p95_ms": latency.get("p95"),
+            "gemini_calls": latency.get("count", 0),
+        }
+
+    def line(self, last_path) -> str:
+        s = self.summary()
+        return (
+            f"[재분석] {s['docs']}건 {s['elapsed_sec']}초 ({s['docs_per_sec']}건/초, 시간당 {s['docs_per_hour']}건) "
+            f"{s['counts']} p50={s['gemini_p50_ms']}ms p95={s['gemini_p95_ms']}ms 마지막={last_path}"
+        )
+
+    def merged_totals(self) -> dict:
+        out = dict(self.prev_totals)
+        for k, v in self.counts.items():
+            out[k] = out.get(k, 0) + v
+        return out
+
+
+def _print_diff(snap, data, update):
+    before = {k: data.get(k) for k in ("blood_sugar_score", "total_carbs", "avg_gi")}
+    after = {k: update.get(k) for k in ("blood_sugar_score", "total_carbs", "avg_gi")}
+    names = [str(it).split(",")[0] for it in update.get("sorted_items", [])]
+    print(f"  {snap.reference.path}: {before} → {after} {names}")
+
+
+async def run(args) -> dict:
+    api_key = _get_secret("GEMINI_API_KEY")
+    if not api_key:
+        raise RuntimeError("GEMINI_API_KEY가 설정되어 있지 않습니다.")
+    _init_firebase()
+    db = firestore.client()
+    bucket = storage.bucket()
+    client = get_gemini_client(api_key, "vision")
+    food_prompt = get_food_analysis_prompt_json(args.lang)
+    profile = get_vision_input_profile(args.vision_profile)
+    # 모델·입력 프로필이 바뀌어도 결과가 달라지므로 프롬프트와 함께 버전에 넣는다 (앱 비전 캐시 키와 같은 기준)
+    prompt_ver = prompt_version(food_prompt, preferred_model("GEMINI_VISION_MODEL"), profile.name)
+    sem = asyncio.Semaphore(args.concurrency)
+
+    ckpt = Checkpoint(args.checkpoint)
+    if not args.reset_checkpoint and not args.dry_run:
+        ckpt.load()
+    if ckpt.dirty_days:
+        # 지난 실행이 식단 문서를 쓴 뒤 합계 재계산 전에 멈춘 경우
+        print(f"[재분석] 이전 실행의 일별 합계 {len(ckpt.dirty_days)}건 재계산")
+        await asyncio.to_thread(_flush_summaries, db, ckpt.dirty_days)
+        ckpt.dirty_days.clear()
+        ckpt.save()
+    report = ThroughputReport(ckpt.totals)
+    print(
+        f"[재분석] 시작: prompt_version={prompt_ver} 입력={profile.name} 동시={args.concurrency} "
+        f"분당={GEMINI_LIMITER.per_minute:g}{' (공유)' if GEMINI_LIMITER.shared else ''} "
+        f"{'(dry-run) ' if args.dry_run else ''}체크포인트={ckpt.last_path or '처음부터'}"
+    )
+
+    async def _guarded(snap):
+        async with sem:
+            try:
+                return snap, await _process_meal(
+                    snap, client=client, bucket=bucket,
+                    food_prompt=food_prompt, prompt_ver=prompt_ver, force=args.force, profile=profile,
+                )
+            except Exception as e:
+                print(f"  [실패] {snap.reference.path}: {e}", file=sys.stderr)
+                return snap, ("error", None, None)
+
+    seen = 0
+    last_report = time.monotonic()
+    pages = _iter_meal_pages(db, args.uid, ckpt.last_path, args.window)
+    while True:
+        page = await asyncio.to_thread(next, pages, None)
+        if not page:
+            break
+        if args.limit:
+            page = page[: max(0, args.limit - seen)]
+        seen += len(page)
+        results = await asyncio.gather(*(_guarded(snap) for snap in page))
+
+        updates = []
+        for snap, (kind, update, data) in results:
+            report.add(kind)
+            if update is None:
+                continue
+            updates.append((snap, update))
+            if data.get("date_key"):
+                ckpt.dirty_days.add((_meal_uid(snap), str(data["date_key"])))
+            if args.dry_run and args.verbose:
+                _print_diff(snap, data, update)
+
+        if not args.dry_run:
+            # 1) 다시 계산할 날짜를 먼저 기록 → 2) 식단 문서 쓰기 → 3) 합계 재계산 → 4) 구간 완료 기록
+            ckpt.save()
+            if updates:
+                writer = db.bulk_writer()
+                for snap, update in updates:
+                    writer.update(snap.reference, update)
+                await asyncio.to_thread(writer.close)
+            if ckpt.dirty_days:
+                await asyncio.to_thread(_flush_summaries, db, ckpt.dirty_days)
+                ckpt.dirty_days.clear()
+            ckpt.last_path = page[-1].reference.path
+            ckpt.totals = report.merged_totals()
+            ckpt.save()
+        else:
+            ckpt.dirty_days.clear()
+
+        if time.monotonic() - last_report >= args.report_every:
+            print(report.line(page[-1].reference.path))
+            last_report = time.monotonic()
+        if args.limit and seen >= args.limit:
+            break
+
+    summary = report.summary()
+    summary["dry_run"] = bool(args.dry_run)
+    summary["prompt_version"] = prompt_ver
+    summary["checkpoint"] = None if args.dry_run else ckpt.last_path
+    return summary
+
+
+def _parse_args(argv=None):
+    p = argparse.ArgumentParser(description="저장된 식단 사진을 현재 프롬프트·점수 규칙으로 일괄 재분석")
+    p.add_argument("--uid", help="이 사용자 식단만 (기본: 모든 사용자)")
+    p.add_argument("--limit", type=int, default=0, help="처리할 최대 문서 수 (0 = 전체)")
+    p.add_argument("--concurrency", type=int, default=8, help="동시에 분석할 문서 수")
+    p.add_argument("--window", type=int, default=200, help="체크포인트 구간(한 번에 읽어 쓰는 문서 수)")
+    p.add_argument("--checkpoint", default=_DEFAULT_CHECKPOINT, help="체크포인트 파일 경로")
+    p.add_argument("--reset-checkpoint", action="store_true", help="체크포인트를 무시하고 처음부터")
+    p.add_argument("--force", action="store_true", help="현재 프롬프트 버전으로 분석된 문서도 다시 분석")
+    p.add_argument("--dry-run", action="store_true", help="Firestore 쓰기·체크포인트 저장 없이 분석만")
+    p.add_argument("--verbose", action="store_true", help="dry-run 에서 문서별 변경 내용 출력")
+    p.add_argument("--lang", default="KO", help="분석 프롬프트 언어 (앱과 같은 KO 기본)")
+    p.add_argument(
+        "--vision-profile", choices=sorted(VISION_INPUT_PROFILES),
+        help="모델 입력 이미지 프로필 (기본: GEMINI_VISION_INPUT_PROFILE 또는 tile768)",
+    )
+    p.add_argument("--report-every", type=float, default=30.0, help="처리량 출력 간격(초)")
+    p.add_argument("--report", help="최종 처리량 리포트를 JSON 으로 저장할 경로")
+    return p.parse_args(argv)
+
+
+def main():
+    args = _parse_args()
+    try:
+        summary = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("[재분석] 중단됨 — 같은 명령으로 다시 실행하면 마지막 체크포인트부터 이어서 처리합니다.", file=sys.stderr)
+        sys.exit(130)
+    except Exception as e:
+        print(f"[재분석] 실패: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as fp:
+            json.dump(summary, fp, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
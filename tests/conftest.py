@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+테스트 공용 설정: 프로젝트 루트를 import 경로에 넣는다.
+테스트는 Streamlit·Firebase·네트워크 없이 import 되는 모듈만 다룬다 (app.py 는 대상 아님).
+"""
+import os
+import sys
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from ai_cache import (
+    DiskLRUCache,
+    NearDuplicateIndex,
+    SingleFlight,
+    TTLCache,
+    normalize_menu_text,
+    pre_meal_insights_cache_key,
+)
+
+
+def test_disk_cache_round_trip_and_fresh_copies(tmp_path):
+    cache = DiskLRUCache(str(tmp_path / "c.sqlite3"), 1 << 20)
+    cache.set("k", {"sorted_items": [["현미밥", 55]]})
+    first = cache.get("k")
+    first["sorted_items"][0][0] = "변경"
+    assert cache.get("k") == {"sorted_items": [["현미밥", 55]]}
+    assert cache.get("없음") is None
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskLRUCache(str(tmp_path / "c.sqlite3"), 250)
+    cache.set("a", "x" * 100)
+    time.sleep(0.01)
+    cache.set("b", "y" * 100)
+    time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.set("c", "z" * 100)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_cache_skips_values_larger_than_capacity(tmp_path):
+    cache = DiskLRUCache(str(tmp_path / "c.sqlite3"), 10)
+    cache.set("big", "x" * 100)
+    assert cache.get("big") is None
+
+
+def test_ttl_cache_expires_and_evicts():
+    cache = TTLCache(max_entries=2, ttl_sec=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("c") is None
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["expirations"] == 1
+
+
+def test_pre_meal_key_normalizes_menu_order_emoji_and_location():
+    assert normalize_menu_text("🍲 김치찌개 + 🍚현미밥") == normalize_menu_text("현미밥, 김치찌개")
+    a = pre_meal_insights_cache_key("김치찌개+현미밥", "외식/배달", "점심", 10, "v1")
+    b = pre_meal_insights_cache_key("현미밥 그리고 김치찌개", "외식", "점심", 20, "v1")
+    assert a == b
+    assert a != pre_meal_insights_cache_key("김치찌개+현미밥", "외식", "점심", 30, "v1")
+
+
+def _start_leader(flight, release, result=None, error=None):
+    """release 가 set 될 때까지 끝나지 않는 선행 호출을 스레드로 시작하고, 진행 중이 될 때까지 기다린다."""
+    calls = []
+    out = {}
+
+    def _fn():
+        calls.append(1)
+        release.wait(5)
+        if error is not None:
+            raise error
+        return result
+
+    def _run():
+        try:
+            out["value"] = flight.do("scan", "k", _fn)
+        except Exception as e:
+            out["error"] = e
+
+    t = threading.Thread(target=_run)
+    t.start()
+    while flight.stats()["inflight"] == 0:
+        time.sleep(0.005)
+    return t, calls, out
+
+
+def test_single_flight_joiner_shares_leader_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    t, calls, out = _start_leader(flight, release, result={"v": 1})
+    joined = []
+    got = {}
+    j = threading.Thread(
+        target=lambda: got.setdefault("v", flight.do("scan", "k", lambda: calls.append(2), on_join=lambda: joined.append(1)))
+    )
+    j.start()
+    time.sleep(0.05)
+    release.set()
+    t.join(5)
+    j.join(5)
+    assert calls == [1] and joined == [1]
+    assert got["v"] is out["value"]
+    row = flight.stats()["tasks"]["scan"]
+    assert row["calls"] == 1 and row["joined"] == 1 and flight.stats()["inflight"] == 0
+
+
+def test_single_flight_join_timeout_leaves_leader_running():
+    flight = SingleFlight()
+    release = threading.Event()
+    t, calls, out = _start_leader(flight, release, result="done")
+    with pytest.raises(TimeoutError):
+        flight.do("scan", "k", lambda: "unused", timeout=0.05)
+    release.set()
+    t.join(5)
+    assert out["value"] == "done"
+    assert flight.stats()["tasks"]["scan"]["timeouts"] == 1
+
+
+def test_single_flight_shares_leader_error():
+    flight = SingleFlight()
+    release = threading.Event()
+    t, _calls, out = _start_leader(flight, release, error=ValueError("boom"))
+    errors = []
+
+    def _join():
+        try:
+            flight.do("scan", "k", lambda: "unused")
+        except ValueError as e:
+            errors.append(e)
+
+    j = threading.Thread(target=_join)
+    j.start()
+    time.sleep(0.05)
+    release.set()
+    t.join(5)
+    j.join(5)
+    assert errors and errors[0] is out["error"]
+    assert flight.stats()["tasks"]["scan"]["shared_errors"] == 1
+
+
+def test_single_flight_forgets_finished_calls_and_separates_keys():
+    flight = SingleFlight()
+    assert flight.do("scan", "a", lambda: 1) == 1
+    assert flight.do("scan", "a", lambda: 2) == 2
+    assert flight.do("menu", "a", lambda: 3) == 3
+    assert flight.stats()["saved_calls"] == 0
+
+
+def test_near_duplicate_within_threshold_maps_to_first_photo():
+    idx = NearDuplicateIndex(window_sec=60, max_distance=8)
+    assert idx.canonical_hash("u1", "h1", 0) == "h1"
+    assert idx.canonical_hash("u1", "h2", 0xFF) == "h1"  # 거리 8
+    assert idx.canonical_hash("u1", "h3", 0xFFFF << 40) == "h3"  # 어느 사진과도 거리 16: 새 사진
+    # 묶인 재촬영 사진(h2)과만 가까운 사진도 첫 사진의 대표 해시로
+    assert idx.canonical_hash("u1", "h4", 0xFFF) == "h1"  # h1 과 12, h2 와 4
+    stats = idx.stats()
+    assert (stats["near_duplicates"], stats["new_images"]) == (2, 2)
+
+
+def test_near_duplicate_exact_raw_hash_does_not_append():
+    idx = NearDuplicateIndex(window_sec=60, max_distance=8)
+    idx.canonical_hash("u1", "h1", 0)
+    for _ in range(30):
+        assert idx.canonical_hash("u1", "h1", 0) == "h1"
+    assert len(idx._owners["u1"]) == 1
+    assert idx.stats()["exact_duplicates"] == 30
+
+
+def test_near_duplicate_window_expires_and_owners_are_separate():
+    idx = NearDuplicateIndex(window_sec=0.05, max_distance=8)
+    idx.canonical_hash("u1", "h1", 0)
+    assert idx.canonical_hash("u2", "h2", 0) == "h2"
+    time.sleep(0.06)
+    assert idx.canonical_hash("u1", "h3", 0) == "h3"
+
+
+def test_near_duplicate_disabled_without_owner_or_window():
+    assert NearDuplicateIndex(window_sec=0, max_distance=8).canonical_hash("u1", "h1", 0) == "h1"
+    idx = NearDuplicateIndex(window_sec=60, max_distance=8)
+    idx.canonical_hash(None, "h1", 0)
+    assert idx.canonical_hash(None, "h2", 0) == "h2"
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from food_analysis import parse_food_analysis_json
+from food_index import _DEFAULT_PATH, FoodIndex, normalize_food_name
+
+
+@pytest.fixture(scope="module")
+def index():
+    return FoodIndex(_DEFAULT_PATH)
+
+
+def test_normalize_strips_emoji_quantity_and_notes():
+    assert normalize_food_name("🍚 흰 쌀밥(1공기)") == "흰쌀밥"
+    assert normalize_food_name("현미밥 반공기") == "현미밥"
+    assert normalize_food_name("  ") == ""
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("흰쌀밥", "흰쌀밥"),
+    ("🍚 흰 쌀밥(1공기)", "흰쌀밥"),
+    ("공기밥", "흰쌀밥"),  # 별칭
+    ("현미밥 반공기", "현미밥"),
+    ("참치 김밥", "김밥"),
+])
+def test_lookup_matches_names_and_aliases_exactly(index, name, expected):
+    facts = index.lookup(name)
+    assert facts is not None and facts.name == expected
+
+
+@pytest.mark.parametrize("name", ["라볶이", "삼각김밥", "짬뽕밥", "감자탕", "", "🍚"])
+def test_lookup_does_not_fall_back_to_suffix_match(index, name):
+    assert index.lookup(name) is None
+
+
+def _tiny_index(tmp_path):
+    path = tmp_path / "foods.tsv"
+    path.write_text(
+        "# name\taliases\tgi\tcarbs\tprotein\tfat\tkcal\n"
+        "흰쌀밥\t공기밥|밥\t86\t65\t5\t1\t300\n",
+        encoding="utf-8",
+    )
+    return FoodIndex(str(path))
+
+
+def test_parse_fills_index_foods_from_table_times_portion(tmp_path):
+    out = parse_food_analysis_json(
+        {"total_carbs": 999, "items": [
+            {"name": "공기밥", "portion": 1.5, "signal": "yellow", "order": 2},
+            {"name": "시금치나물", "gi": 15, "carbs": 4, "protein": 2, "fat": 3, "kcal": 45,
+             "signal": "green", "order": 1},
+        ]},
+        index=_tiny_index(tmp_path),
+    )
+    assert out is not None
+    items, total = out
+    assert [it[0] for it in items] == ["시금치나물", "공기밥"]
+    assert items[1][1:4] == [86, 98, 8]  # gi, 65×1.5, 5×1.5
+    assert total == 4 + 98  # 기준표 항목이 있으면 모델 total_carbs 대신 항목 합
+
+
+def test_parse_rejects_index_miss_without_numbers(tmp_path):
+    # 기준표에 없는 라볶이의 수치를 모델이 생략했다면 기본값으로 채우지 않고 실패
+    out = parse_food_analysis_json(
+        {"items": [{"name": "라볶이", "portion": 1, "signal": "red", "order": 1}]},
+        index=_tiny_index(tmp_path),
+    )
+    assert out is None
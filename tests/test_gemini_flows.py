@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+import gemini_flows
+from gemini_flows import _coalesced
+from gemini_quota import current_priority, gemini_priority
+
+
+def test_user_tap_joining_prefetch_promotes_shared_ticket():
+    started = threading.Event()
+    release = threading.Event()
+    joined = threading.Event()
+    seen = []
+    got = {}
+
+    def _fn():
+        seen.append(current_priority())
+        started.set()
+        release.wait(5)
+        seen.append(current_priority())
+        return {"insights": ["물 먼저"]}
+
+    def _prefetch():
+        with gemini_priority("speculative"):
+            got["prefetch"] = _coalesced("pre_meal_insights", "k-promote", _fn, "pre_meal_insights", timeout=5)
+
+    def _tap():
+        got["tap"] = _coalesced(
+            "pre_meal_insights", "k-promote", _fn, "pre_meal_insights", timeout=5, on_join=joined.set
+        )
+
+    leader = threading.Thread(target=_prefetch)
+    leader.start()
+    assert started.wait(5)
+    tap = threading.Thread(target=_tap)
+    tap.start()
+    assert joined.wait(5)
+    release.set()
+    leader.join(5)
+    tap.join(5)
+
+    # 미리 받기로 시작한 호출이 사용자 탭(insight)이 합류한 뒤부터 insight 로 쿼터를 기다린다
+    assert seen == ["speculative", "insight"]
+    assert got["prefetch"] == got["tap"] == {"insights": ["물 먼저"]}
+    assert ("pre_meal_insights", "k-promote") not in gemini_flows._flight_tickets
+
+
+def test_ticket_is_dropped_when_flight_fails():
+    def _boom():
+        raise RuntimeError("모델 오류")
+
+    with pytest.raises(RuntimeError):
+        _coalesced("menu_name", "k-fail", _boom, "menu_name", timeout=5)
+    assert ("menu_name", "k-fail") not in gemini_flows._flight_tickets
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from gemini_quota import (
+    GeminiQuotaWaitTooLong,
+    GeminiRateLimiter,
+    PriorityTicket,
+    current_priority,
+    gemini_priority,
+    request_deadline,
+)
+
+
+def _drained(per_minute=60):
+    lim = GeminiRateLimiter(per_minute, burst=1)
+    lim.acquire("interactive")
+    return lim
+
+
+def _queue_up(lim, waiters, started_gap=0.05):
+    """(이름, 우선순위 또는 PriorityTicket) 순서대로 대기열에 넣고 (스레드 목록, 입장 순서 리스트) 반환."""
+    order = []
+
+    def _run(name, prio):
+        with gemini_priority(prio):
+            lim.acquire()
+        order.append(name)
+
+    threads = []
+    for name, prio in waiters:
+        t = threading.Thread(target=_run, args=(name, prio))
+        t.start()
+        threads.append(t)
+        time.sleep(started_gap)
+    return threads, order
+
+
+def test_disabled_limiter_never_waits():
+    lim = GeminiRateLimiter(0)
+    assert not lim.enabled
+    assert lim.acquire("batch", deadline=time.monotonic() - 1) == 0.0
+    assert lim.estimate_wait("batch") == 0.0
+
+
+def test_rejects_when_eta_exceeds_deadline():
+    lim = _drained(per_minute=6)  # 다음 토큰까지 약 10초
+    with pytest.raises(GeminiQuotaWaitTooLong):
+        lim.acquire("interactive", deadline=time.monotonic() + 0.5)
+    assert lim.stats()["classes"]["interactive"]["rejected"] == 1
+    assert sum(lim.stats()["queued"].values()) == 0
+
+
+def test_rejects_once_deadline_has_passed_even_with_tokens():
+    lim = GeminiRateLimiter(60, burst=5)
+    with pytest.raises(GeminiQuotaWaitTooLong):
+        lim.acquire("interactive", deadline=time.monotonic() - 0.01)
+
+
+def test_request_deadline_context_applies_to_acquire():
+    lim = _drained(per_minute=6)
+    with request_deadline(0.2), pytest.raises(GeminiQuotaWaitTooLong):
+        lim.acquire("insight")
+
+
+def test_higher_priority_is_admitted_first():
+    lim = _drained(per_minute=120)
+    threads, order = _queue_up(lim, [("batch", "batch"), ("spec", "speculative"), ("int", "interactive")])
+    for t in threads:
+        t.join(5)
+    assert order == ["int", "spec", "batch"]
+
+
+def test_promoted_ticket_moves_ahead_while_waiting():
+    lim = _drained(per_minute=120)
+    ticket = PriorityTicket("speculative")
+    threads, order = _queue_up(lim, [("batch", "batch"), ("spec", "speculative"), ("promoted", ticket)])
+    lim.promote(ticket, "insight")
+    for t in threads:
+        t.join(10)
+    assert order == ["promoted", "spec", "batch"]
+    assert ticket.priority == "insight"
+
+
+def test_promote_never_lowers_priority():
+    lim = GeminiRateLimiter(60)
+    ticket = PriorityTicket("insight")
+    lim.promote(ticket, "batch")
+    assert ticket.priority == "insight"
+
+
+def test_current_priority_from_ticket_and_operation_name():
+    assert current_priority("scan_combined") == "interactive"
+    assert current_priority("batch_reanalysis") == "batch"
+    assert current_priority("unknown") == "insight"
+    with gemini_priority(PriorityTicket("speculative")):
+        assert current_priority("scan_combined") == "speculative"
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import io
+import random
+
+from PIL import Image, ImageDraw
+
+from ai_cache import _hamming64
+from image_pipeline import ENCODED_JPEG_INFO_KEY, QUALITY_MAX, QUALITY_MIN, dhash64, encode_jpeg_to_size
+
+
+def _plate(seed=0, size=(640, 480)):
+    """원·사각형 몇 개로 만든 가짜 접시 사진 (seed 가 다르면 배치가 다름)."""
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, (235, 230, 220))
+    draw = ImageDraw.Draw(img)
+    for _ in range(6):
+        x, y = rng.randrange(size[0] - 160), rng.randrange(size[1] - 160)
+        r = rng.randrange(40, 150)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        (draw.ellipse if rng.random() < 0.5 else draw.rectangle)((x, y, x + r, y + r), fill=color)
+    return img
+
+
+def _noise(size, seed):
+    return Image.frombytes("RGB", size, random.Random(seed).randbytes(size[0] * size[1] * 3))
+
+
+def _reencode(img, quality):
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality)
+    buf.seek(0)
+    return Image.open(buf)
+
+
+def test_dhash_is_stable_across_resize_and_recompression():
+    img = _plate(1)
+    h = dhash64(img)
+    assert _hamming64(h, dhash64(_reencode(img, 60))) <= 4
+    assert _hamming64(h, dhash64(img.resize((320, 240)))) <= 4
+    cropped = img.crop((8, 6, 632, 474))
+    assert _hamming64(h, dhash64(cropped)) <= 8
+
+
+def test_dhash_separates_different_plates():
+    assert _hamming64(dhash64(_plate(1)), dhash64(_plate(2))) > 8
+
+
+def test_encode_keeps_top_quality_when_it_already_fits():
+    enc = encode_jpeg_to_size(_plate(1), max_kb=500, max_edge=1024)
+    assert (enc.quality, enc.encodes) == (QUALITY_MAX, 1)
+    assert enc.image.info[ENCODED_JPEG_INFO_KEY] == enc.data
+
+
+def test_encode_lowers_quality_to_fit_max_kb_and_max_edge():
+    base = _plate(1, size=(1600, 1200))
+    grainy = Image.blend(base, _noise(base.size, seed=7), 0.3)
+    enc = encode_jpeg_to_size(grainy, max_kb=40, max_edge=800)
+    assert len(enc.data) <= 40 * 1024
+    assert enc.image.size == (800, 600)
+    assert QUALITY_MIN < enc.quality < QUALITY_MAX
+
+
+def test_encode_downscales_when_lowest_quality_still_too_big():
+    enc = encode_jpeg_to_size(_noise((1200, 900), seed=3), max_kb=60, max_edge=800)
+    assert enc.quality == QUALITY_MIN
+    assert len(enc.data) <= 60 * 1024
+    assert max(enc.image.size) < 800
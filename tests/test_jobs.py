@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from jobs import JobQueueFull, JobRunner
+
+
+def _wait_done(runner, job_id, timeout=2.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        job = runner.get(job_id)
+        if job is not None and job.done:
+            return job
+        time.sleep(0.005)
+    raise AssertionError(f"작업 {job_id} 가 {timeout}s 안에 끝나지 않음")
+
+
+def test_submit_reports_progress_and_result():
+    runner = JobRunner(max_workers=1)
+
+    def work(progress):
+        progress(0.5, "분석 중")
+        return {"items": 3}
+
+    job = _wait_done(runner, runner.submit("vision", work, owner="u1"))
+    assert job.state == "done"
+    assert job.result == {"items": 3}
+    assert job.progress == 1.0 and job.message == "분석 중"
+    assert runner.metrics()["completed"] == 1
+
+
+def test_failed_job_keeps_error():
+    runner = JobRunner(max_workers=1)
+
+    def work(progress):
+        raise ValueError("깨진 이미지")
+
+    job = _wait_done(runner, runner.submit("vision", work))
+    assert job.state == "error"
+    assert isinstance(job.error, ValueError)
+    assert runner.metrics()["failed"] == 1
+
+
+def test_claim_only_once_and_only_when_done():
+    runner = JobRunner(max_workers=1)
+    release = threading.Event()
+    job_id = runner.submit("vision", lambda progress: release.wait(2) or "ok", owner="u1")
+    assert runner.claim(job_id) is False  # 아직 실행 중
+    release.set()
+    _wait_done(runner, job_id)
+    assert runner.claim(job_id) is True
+    assert runner.claim(job_id) is False
+    assert runner.claim("없는-id") is False
+
+
+def test_abandoned_job_is_neither_claimable_nor_resumable():
+    runner = JobRunner(max_workers=1)
+    release = threading.Event()
+    job_id = runner.submit("vision", lambda progress: release.wait(2) or "ok", owner="u1")
+    assert runner.latest_for_owner("u1", kind="vision").id == job_id
+    runner.abandon(job_id)
+    release.set()
+    _wait_done(runner, job_id)
+    assert runner.claim(job_id) is False
+    assert runner.latest_for_owner("u1", kind="vision") is None
+
+
+def test_latest_for_owner_picks_newest_unclaimed_job_of_owner():
+    runner = JobRunner(max_workers=2)
+    first = runner.submit("vision", lambda progress: 1, owner="u1")
+    time.sleep(0.002)
+    second = runner.submit("vision", lambda progress: 2, owner="u1")
+    runner.submit("vision", lambda progress: 3, owner="u2")
+    assert runner.latest_for_owner("u1", kind="vision").id == second
+    assert runner.latest_for_owner("u1", kind="other") is None
+    assert runner.latest_for_owner(None) is None
+    _wait_done(runner, second)
+    runner.claim(second)
+    assert runner.latest_for_owner("u1").id == first
+
+
+def test_finished_jobs_are_purged_after_result_ttl():
+    runner = JobRunner(max_workers=1, result_ttl_sec=0.05)
+    job_id = runner.submit("vision", lambda progress: "ok")
+    _wait_done(runner, job_id)
+    time.sleep(0.08)
+    assert runner.get(job_id) is None
+    assert runner.metrics()["retained"] == 0
+
+
+def test_full_queue_rejects_new_jobs():
+    runner = JobRunner(max_workers=1, max_queue=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocker(progress):
+        started.set()
+        release.wait(2)
+
+    try:
+        runner.submit("vision", blocker)
+        assert started.wait(1)
+        runner.submit("vision", lambda progress: None)  # 대기열 1칸
+        with pytest.raises(JobQueueFull):
+            runner.submit("vision", lambda progress: None)
+        assert runner.metrics()["rejected"] == 1
+    finally:
+        release.set()
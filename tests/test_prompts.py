@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from prompts import get_post_meal_template_message, score_post_meal_glucose
+
+
+@pytest.mark.parametrize("glucose, change, band", [
+    (70, -15, "perfect"),
+    (89, -15, "perfect"),
+    (90, -10, "success"),
+    (109, -10, "success"),
+    (110, -5, "success"),
+    (139, -5, "success"),
+    (140, 10, "mild"),
+    (159, 10, "mild"),
+    (160, 15, "mild"),
+    (180, 20, "moderate"),
+    (199, 20, "moderate"),
+    (200, 25, "high"),
+    (350, 25, "high"),
+])
+def test_post_meal_score_bands(glucose, change, band):
+    score = score_post_meal_glucose(glucose)
+    assert (score["stress_score_change"], score["band"]) == (change, band)
+
+
+def test_post_meal_success_threshold_is_140():
+    assert score_post_meal_glucose(139)["is_success"] is True
+    assert score_post_meal_glucose(140)["is_success"] is False
+    assert score_post_meal_glucose("139.6")["is_success"] is False  # 반올림 후 140
+
+
+@pytest.mark.parametrize("value", [None, "", "높음"])
+def test_post_meal_score_treats_invalid_input_as_zero(value):
+    assert score_post_meal_glucose(value) == score_post_meal_glucose(0)
+
+
+def test_post_meal_template_message_falls_back_to_success():
+    assert get_post_meal_template_message("없는구간") == get_post_meal_template_message("success")
+    assert "200" in get_post_meal_template_message("high")
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from response_schemas import (
+    FOOD_ANALYSIS_SCHEMA,
+    FOOD_ITEM_SCHEMA,
+    MENU_NAME_SCHEMA,
+    PRE_MEAL_INSIGHTS_SCHEMA,
+    Field,
+    ResponseSchemaError,
+    decode_response,
+    load_json_text,
+)
+
+
+def test_integer_coerces_strings_floats_and_clamps():
+    f = Field("integer", lo=0, hi=100)
+    assert f.decode("약 30g") == 30
+    assert f.decode(12.6) == 13
+    assert f.decode("150") == 100
+    assert f.decode(-5) == 0
+
+
+def test_integer_rejects_bool_and_nan_without_default():
+    f = Field("integer")
+    with pytest.raises(ResponseSchemaError):
+        f.decode(True)
+    with pytest.raises(ResponseSchemaError):
+        f.decode(float("nan"))
+
+
+def test_missing_or_unconvertible_value_uses_default():
+    f = Field("integer", default=7)
+    assert f.decode(None) == 7
+    assert f.decode("없음") == 7
+
+
+def test_required_field_error_carries_path():
+    with pytest.raises(ResponseSchemaError) as ei:
+        PRE_MEAL_INSIGHTS_SCHEMA.decode({"mission": "걷기", "analysis": "좋음"})
+    assert ei.value.path == "$.next_meal"
+
+
+def test_boolean_accepts_korean_words():
+    f = Field("boolean", default=None)
+    assert f.decode("성공") is True
+    assert f.decode("아니오") is False
+    assert f.decode("모름") is None
+
+
+def test_nonempty_string_and_max_len():
+    with pytest.raises(ResponseSchemaError):
+        MENU_NAME_SCHEMA.decode({"menu_name": "   "})
+    assert MENU_NAME_SCHEMA.decode({"menu_name": "가" * 200})["menu_name"] == "가" * 120
+
+
+def test_array_skips_invalid_items_and_checks_min_items():
+    out = FOOD_ANALYSIS_SCHEMA.decode({"items": [{"name": ""}, {"name": "김치찌개", "portion": 9}]})
+    assert [it["name"] for it in out["items"]] == ["김치찌개"]
+    assert out["items"][0]["portion"] == 4.0
+    with pytest.raises(ResponseSchemaError):
+        FOOD_ANALYSIS_SCHEMA.decode({"items": [{"name": ""}]})
+
+
+def test_optional_numbers_decode_to_none_and_are_not_required():
+    item = FOOD_ITEM_SCHEMA.decode({"name": "현미밥"})
+    assert item["gi"] is None and item["carbs"] is None and item["kcal"] is None
+    required = FOOD_ITEM_SCHEMA.to_schema().required
+    assert "name" in required and "gi" not in required and "carbs" not in required
+
+
+def test_non_object_is_rejected():
+    with pytest.raises(ResponseSchemaError):
+        PRE_MEAL_INSIGHTS_SCHEMA.decode(["mission"])
+
+
+def test_load_json_text_strips_fences_and_chatter():
+    text = '설명입니다\n```json\n{"menu_name": "비빔밥"} \n```\n끝'
+    assert load_json_text(text) == {"menu_name": "비빔밥"}
+    with pytest.raises(ResponseSchemaError):
+        load_json_text("")
+    with pytest.raises(ResponseSchemaError):
+        load_json_text("JSON 없음")
+
+
+def test_decode_response_prefers_parsed_then_text():
+    class _Resp:
+        parsed = {"menu_name": "라면"}
+        text = '{"menu_name": "무시됨"}'
+
+    class _TextOnly:
+        parsed = None
+        text = '{"menu_name": "떡국"}'
+
+    assert decode_response(_Resp(), MENU_NAME_SCHEMA)["menu_name"] == "라면"
+    assert decode_response(_TextOnly(), MENU_NAME_SCHEMA)["menu_name"] == "떡국"
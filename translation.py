@@ -233,6 +233,7 @@ def _ko():
         "post_meal_fail_label": "방어 실패!",
         "post_meal_dialog_close": "✅ 확인하고 다음 식사 준비",
         "post_meal_err_ai": "AI 분석에 실패했습니다.",
+        "post_meal_feedback_pending": "AI 코치가 한마디를 준비 중입니다…",
     }
 
 
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+NutriSort AI - Gemini 입력용 이미지 전처리 프로필.
+
+업로드 아티팩트의 표시용 이미지(최대 1024px·500KB JPEG, image_pipeline)는 브라우저 표시용이다. Gemini 는 파일 크기가 아니라
+이미지 타일 수로 토큰을 매기므로(양 변 384px 이하 = 258 토큰, 그보다 크면 768×768 타일당 258 토큰),
+4:3 사진 1024×768 은 타일 2장(516 토큰)이 되고 768×576 으로 줄이면 1장(258 토큰)이 된다.
+여기서는 표시용 이미지와 별도로 타일 크기에 맞춘 해상도·선택적 중앙 정사각 크롭(접시)·낮은 화질로
+모델 입력 이미지를 만들고, 인코딩한 JPEG 바이트를 Image.info 에 남겨 image_part 가 그대로 쓰게 한다.
+
+프로필은 GEMINI_VISION_INPUT_PROFILE 로 고른다 (기본 tile768). 비교는 scripts/bench_vision_profiles.py.
+"""
+
+import io
+import math
+import os
+import sys
+import threading
+from collections import namedtuple
+
+from PIL import Image
+
+from gemini_client import ENCODED_JPEG_INFO_KEY
+
+# Gemini 이미지 토큰 규칙 (추정치: 실제 값은 usage_metadata.prompt_token_count 로 확인)
+TILE_PX = 768
+SMALL_IMAGE_PX = 384
+TOKENS_PER_TILE = 258
+
+# max_side=0 은 표시용 이미지를 그대로 보낸다. crop 은 짧은 변 대비 중앙 정사각형 비율 (0 = 크롭 안 함)
+VisionInputProfile = namedtuple("VisionInputProfile", "name max_side crop quality")
+
+VISION_INPUT_PROFILES = {
+    # 기존 동작: 표시용 이미지 그대로 (1024px 4:3 사진이면 타일 2장)
+    "display": VisionInputProfile("display", 0, 0.0, 0),
+    # 긴 변 768px → 어떤 비율이든 타일 1장
+    "tile768": VisionInputProfile("tile768", TILE_PX, 0.0, 80),
+    # 중앙 정사각형(짧은 변의 90%)을 768px 로 → 타일 1장을 접시에 모두 사용
+    "plate768": VisionInputProfile("plate768", TILE_PX, 0.9, 80),
+    # 양 변 384px 이하 → 258 토큰 고정, 페이로드 최소 (작은 반찬 인식은 떨어질 수 있음)
+    "tile384": VisionInputProfile("tile384", SMALL_IMAGE_PX, 0.0, 82),
+}
+DEFAULT_VISION_INPUT_PROFILE = "tile768"
+
+# 프로필별 결과를 원본 Image.info 에 보관하는 키 (같은 사진의 재시도·병렬 호출에서 재사용)
+_PROFILE_INFO_KEY = "nutrisort_vision_inputs"
+_memo_lock = threading.Lock()
+
+
+def get_vision_input_profile(name: str = None) -> VisionInputProfile:
+    """이름(없으면 GEMINI_VISION_INPUT_PROFILE) → 프로필. 알 수 없는 이름이면 기본 프로필."""
+    key = (name or os.environ.get("GEMINI_VISION_INPUT_PROFILE", "") or DEFAULT_VISION_INPUT_PROFILE).strip().lower()
+    prof = VISION_INPUT_PROFILES.get(key)
+    if prof is None:
+        sys.stderr.write(f"[비전 입력] 알 수 없는 프로필 {key!r} → {DEFAULT_VISION_INPUT_PROFILE}\n")
+        prof = VISION_INPUT_PROFILES[DEFAULT_VISION_INPUT_PROFILE]
+    return prof
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Gemini 이미지 1장 입력 토큰 추정: 양 변 384px 이하 258, 그 밖은 768px 타일 수 × 258."""
+    if width <= SMALL_IMAGE_PX and height <= SMALL_IMAGE_PX:
+        return TOKENS_PER_TILE
+    return math.ceil(width / TILE_PX) * math.ceil(height / TILE_PX) * TOKENS_PER_TILE
+
+
+def _center_square(img, fraction: float):
+    w, h = img.size
+    side = max(1, int(min(w, h) * fraction))
+    left, top = (w - side) // 2, (h - side) // 2
+    return img.crop((left, top, left + side, top + side))
+
+
+def vision_input_image(img, profile=None):
+    """
+    표시용 PIL 이미지 → 프로필에 맞춘 모델 입력 이미지 (JPEG 바이트는 info[ENCODED_JPEG_INFO_KEY]).
+    display 프로필이거나 줄일 것이 없으면 원본을 그대로 돌려준다. 결과는 원본 info 에 프로필별로 보관.
+    """
+    prof = profile if isinstance(profile, VisionInputProfile) else get_vision_input_profile(profile)
+    if prof.max_side <= 0:
+        return img
+    info = getattr(img, "info", None)
+    if isinstance(info, dict):
+        cached = (info.get(_PROFILE_INFO_KEY) or {}).get(prof.name)
+        if cached is not None:
+            return cached
+    im = _center_square(img, prof.crop) if prof.crop else img
+    w, h = im.size
+    scale = prof.max_side / max(w, h)
+    if scale < 1.0:
+        im = im.resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.Resampling.LANCZOS)
+    elif im is img:
+        # 이미 타일 1장 이내 크기: 표시용 JPEG 를 그대로 쓴다 (재인코딩 화질 손실 방지)
+        return img
+    if im.mode not in ("RGB", "L"):
+        im = im.convert("RGB")
+    buf = io.BytesIO()
+    im.save(buf, format="JPEG", quality=int(prof.quality), optimize=True)
+    # crop/resize 는 원본 info(표시용 JPEG 바이트·Part 캐시)를 복사하므로 새로 채운다
+    im.info = {ENCODED_JPEG_INFO_KEY: buf.getvalue()}
+    if isinstance(info, dict):
+        with _memo_lock:
+            im = info.setdefault(_PROFILE_INFO_KEY, {}).setdefault(prof.name, im)
+    return im